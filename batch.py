@@ -0,0 +1,265 @@
+import asyncio
+import zipfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncGenerator, List, Optional
+
+from fastapi import UploadFile
+
+from mistral_parser import MistralDocumentParser
+from models import BatchItemResult, InsuranceDataResponse
+from pipeline import ExtractionPipeline
+from upload import SpooledUpload, spool_stream, spool_upload
+
+
+@dataclass
+class BatchDocument:
+    """One document of a batch, either spooled to disk or rejected up front"""
+
+    index: int
+    filename: str
+    upload: Optional[SpooledUpload] = None
+    error: Optional[str] = None
+
+    def close(self) -> None:
+        """Delete the spooled file, if any"""
+        if self.upload is not None:
+            self.upload.close()
+            self.upload = None
+
+
+def _format_error(filename: str) -> Optional[str]:
+    """Return an error message if the file format is not supported"""
+    file_ext = Path(filename).suffix.lower()
+    if file_ext not in MistralDocumentParser.SUPPORTED_FORMATS:
+        return f"Unsupported file format: {file_ext}. Supported formats: {', '.join(MistralDocumentParser.SUPPORTED_FORMATS)}"
+    return None
+
+
+def _expand_zip(
+    archive: SpooledUpload,
+    first_index: int,
+    spool_dir: Optional[str],
+    max_documents: int,
+    max_bytes: int,
+    unpacked_before: int = 0
+) -> List[BatchDocument]:
+    """
+    Spool every file in a zip archive to disk as a batch document
+
+    The archive is rejected as soon as it holds more than max_documents
+    members or takes the batch over max_bytes of uncompressed data, before
+    the rest is written to disk.
+
+    Args:
+        archive: Spooled zip archive
+        first_index: Batch index of the archive's first member
+        spool_dir: Directory for temporary files (system default if None)
+        max_documents: Documents left in the batch's budget
+        max_bytes: Maximum uncompressed bytes taken from all of the
+            batch's archives
+        unpacked_before: Uncompressed bytes taken from earlier archives
+
+    Raises:
+        ValueError: If the archive is invalid or exceeds either budget
+    """
+    documents = []
+    unpacked = unpacked_before
+
+    try:
+        with zipfile.ZipFile(archive.path) as zip_file:
+            for info in zip_file.infolist():
+                # Skip directories and macOS resource forks
+                if info.is_dir() or info.filename.startswith("__MACOSX/"):
+                    continue
+
+                if len(documents) >= max_documents:
+                    raise ValueError(f"Batch exceeds maximum of {first_index + max_documents} documents")
+
+                document = BatchDocument(index=first_index + len(documents), filename=info.filename)
+                documents.append(document)
+
+                document.error = _format_error(info.filename)
+                if document.error is not None:
+                    continue
+
+                if info.file_size > MistralDocumentParser.MAX_FILE_SIZE:
+                    document.error = f"File size exceeds maximum limit of {MistralDocumentParser.MAX_FILE_SIZE // (1024*1024)}MB"
+                    continue
+
+                remaining = max_bytes - unpacked
+                if info.file_size > remaining:
+                    raise ValueError(_unpacked_size_error(archive.filename, max_bytes))
+
+                try:
+                    # Sizes in the zip header can lie, so the limits are enforced while copying too
+                    with zip_file.open(info) as member:
+                        document.upload = spool_stream(
+                            member, info.filename, min(MistralDocumentParser.MAX_FILE_SIZE, remaining), spool_dir
+                        )
+                except ValueError as e:
+                    if remaining < MistralDocumentParser.MAX_FILE_SIZE:
+                        raise ValueError(_unpacked_size_error(archive.filename, max_bytes))
+                    document.error = str(e)
+                    continue
+                except zipfile.BadZipFile as e:
+                    document.error = str(e)
+                    continue
+
+                unpacked += document.upload.size
+
+    except zipfile.BadZipFile as e:
+        close_documents(documents)
+        raise ValueError(f"Invalid zip archive {archive.filename}: {str(e)}")
+    except BaseException:
+        close_documents(documents)
+        raise
+
+    return documents
+
+
+def _unpacked_size_error(archive_name: str, max_bytes: int) -> str:
+    return f"Batch exceeds maximum of {max_bytes // (1024*1024)}MB unpacked from archives (at {archive_name})"
+
+
+async def collect_batch_documents(
+    files: List[UploadFile],
+    max_documents: int,
+    max_archive_size: int,
+    max_unpacked_bytes: int,
+    spool_dir: Optional[str] = None
+) -> List[BatchDocument]:
+    """
+    Spool uploaded files to disk, expanding zip archives into their members
+
+    Files with unsupported formats or over the size limit become documents
+    with an error rather than failing the whole batch.
+
+    Args:
+        files: Uploaded documents and/or zip archives
+        max_documents: Maximum number of documents in the batch
+        max_archive_size: Maximum size of a single zip archive in bytes
+        max_unpacked_bytes: Maximum total uncompressed size of the
+            documents taken from zip archives
+        spool_dir: Directory for temporary files (system default if None)
+
+    Returns:
+        Batch documents in upload order
+
+    Raises:
+        ValueError: If an archive is invalid or the batch is too large
+    """
+    documents: List[BatchDocument] = []
+    unpacked = 0
+
+    try:
+        for file in files:
+            if Path(file.filename).suffix.lower() == ".zip":
+                archive = await spool_upload(file, max_archive_size, spool_dir)
+                try:
+                    members = await asyncio.to_thread(
+                        _expand_zip, archive, len(documents), spool_dir,
+                        max_documents - len(documents), max_unpacked_bytes, unpacked
+                    )
+                finally:
+                    archive.close()
+                documents.extend(members)
+                unpacked += sum(member.upload.size for member in members if member.upload is not None)
+            else:
+                document = BatchDocument(index=len(documents), filename=file.filename)
+                documents.append(document)
+
+                document.error = _format_error(file.filename)
+                if document.error is None:
+                    try:
+                        document.upload = await spool_upload(
+                            file, MistralDocumentParser.MAX_FILE_SIZE, spool_dir
+                        )
+                    except ValueError as e:
+                        document.error = str(e)
+
+            if len(documents) > max_documents:
+                raise ValueError(f"Batch exceeds maximum of {max_documents} documents")
+
+    except BaseException:
+        close_documents(documents)
+        raise
+
+    return documents
+
+
+def close_documents(documents: List[BatchDocument]) -> None:
+    """Delete the spooled files of batch documents"""
+    for document in documents:
+        document.close()
+
+
+async def run_batch(
+    pipeline: ExtractionPipeline,
+    documents: List[BatchDocument],
+    concurrency: int
+) -> AsyncGenerator[BatchItemResult, None]:
+    """
+    Run batch documents through the pipeline, yielding results as each completes
+
+    The caller must pass the generator to stop_batch when done with it, as
+    the cleanup here only runs if iteration has started.
+
+    Args:
+        pipeline: Extraction pipeline
+        documents: Documents from collect_batch_documents
+        concurrency: Maximum number of documents processed at once
+
+    Yields:
+        Per-document results in completion order
+    """
+    slots = asyncio.Semaphore(concurrency)
+
+    async def run_one(document: BatchDocument) -> BatchItemResult:
+        if document.error is not None:
+            return BatchItemResult(index=document.index, filename=document.filename, error=document.error)
+
+        async with slots:
+            try:
+                result = await pipeline.run(document.upload.path, document.filename, document.upload.sha256)
+                return BatchItemResult(
+                    index=document.index,
+                    filename=document.filename,
+                    result=InsuranceDataResponse(**result)
+                )
+            except (ValueError, RuntimeError) as e:
+                return BatchItemResult(index=document.index, filename=document.filename, error=str(e))
+            except Exception as e:
+                return BatchItemResult(
+                    index=document.index,
+                    filename=document.filename,
+                    error=f"Unexpected error: {str(e)}"
+                )
+            finally:
+                document.close()
+
+    tasks = [asyncio.create_task(run_one(document)) for document in documents]
+
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # Stop outstanding work if the client went away mid-stream
+        for task in tasks:
+            task.cancel()
+        close_documents(documents)
+
+
+async def stop_batch(results: AsyncGenerator[BatchItemResult, None], documents: List[BatchDocument]) -> None:
+    """
+    Cancel a batch run and delete its spooled files
+
+    Safe to call whether the results were read in full, in part or not at
+    all, e.g. when a streaming client disconnects before the first result.
+
+    Args:
+        results: Generator returned by run_batch
+        documents: Documents passed to run_batch
+    """
+    await results.aclose()
+    close_documents(documents)
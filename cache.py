@@ -0,0 +1,293 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Tuple, Union
+
+from sqlite_fork import ForkSafeSQLite
+
+
+class CacheBackend:
+    """Interface for string key/value cache storage"""
+
+    name = "base"
+
+    def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: str) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def iter_keys(self, prefix: str) -> Iterator[str]:
+        raise NotImplementedError
+
+
+class MemoryCacheBackend(CacheBackend):
+    """In-process LRU cache with entry-count and TTL eviction"""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: Optional[int] = None):
+        if max_entries <= 0:
+            raise ValueError("Cache max_entries must be positive")
+
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._entries[key]
+                return None
+
+            # Mark as most recently used
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        expires_at = time.time() + self.ttl_seconds if self.ttl_seconds else None
+
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+
+            # Evict least recently used entries over the size limit
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def iter_keys(self, prefix: str) -> Iterator[str]:
+        with self._lock:
+            keys = [key for key in self._entries if key.startswith(prefix)]
+        return iter(keys)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteCacheBackend(ForkSafeSQLite, CacheBackend):
+    """On-disk cache stored in a single SQLite table"""
+
+    name = "sqlite"
+
+    def __init__(self, path: str, ttl_seconds: Optional[int] = None):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._open()
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+        )
+        self._conn.commit()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, check_same_thread=False)
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None:
+                return None
+
+            value, expires_at = row
+            if expires_at is not None and expires_at <= time.time():
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        expires_at = time.time() + self.ttl_seconds if self.ttl_seconds else None
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, expires_at)
+            )
+            self._conn.commit()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def iter_keys(self, prefix: str) -> Iterator[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key FROM cache WHERE substr(key, 1, ?) = ? "
+                "AND (expires_at IS NULL OR expires_at > ?)",
+                (len(prefix), prefix, time.time())
+            ).fetchall()
+        return (row[0] for row in rows)
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Cache backed by any Redis-compatible client
+
+    The client only needs redis-py style ``get``, ``set(ex=...)``, ``delete``
+    and ``scan_iter`` methods, so local stand-ins such as fakeredis work as well.
+    """
+
+    name = "redis"
+
+    def __init__(self, client, ttl_seconds: Optional[int] = None, prefix: str = "beshak:"):
+        self.client = client
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str, ttl_seconds: Optional[int] = None) -> "RedisCacheBackend":
+        """Create a backend from a redis:// URL"""
+        try:
+            import redis
+        except ImportError:
+            raise ValueError("Redis cache backend requires the 'redis' package")
+
+        return cls(redis.Redis.from_url(url), ttl_seconds=ttl_seconds)
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.client.get(self.prefix + key)
+        if isinstance(value, bytes):
+            value = value.decode('utf-8')
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        self.client.set(self.prefix + key, value, ex=self.ttl_seconds or None)
+
+    def delete(self, key: str) -> None:
+        self.client.delete(self.prefix + key)
+
+    def iter_keys(self, prefix: str) -> Iterator[str]:
+        for key in self.client.scan_iter(match=f"{self.prefix}{prefix}*"):
+            if isinstance(key, bytes):
+                key = key.decode('utf-8')
+            yield key[len(self.prefix):]
+
+
+class ResultCache:
+    """Content-addressed cache of JSON entries (OCR pages or extraction results)"""
+
+    def __init__(self, backend: CacheBackend, namespace: str = "result"):
+        self.backend = backend
+        self.namespace = namespace
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def document_hash(file_content: Union[bytes, Path]) -> str:
+        """SHA-256 hex digest of the document bytes or of a file on disk"""
+        if isinstance(file_content, Path):
+            digest = hashlib.sha256()
+            with open(file_content, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(chunk)
+            return digest.hexdigest()
+
+        return hashlib.sha256(file_content).hexdigest()
+
+    def make_key(self, document_hash: str, version: str) -> str:
+        """Build a cache key from the document hash and pipeline version"""
+        return f"{self.namespace}:{version}:{document_hash}"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached entry for key, counting hits and misses"""
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            # A broken cache must never fail the request
+            print(f"Warning: Cache - {str(e)}")
+            value = None
+
+        if value is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return json.loads(value)
+
+    def set(self, key: str, entry: Dict[str, Any]) -> None:
+        """Store an entry under key"""
+        try:
+            self.backend.set(key, json.dumps(entry))
+        except Exception as e:
+            print(f"Warning: Cache - {str(e)}")
+
+    def iter_entries(self, version: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Iterate over cached entries for a version without touching counters
+
+        Yields:
+            (document_hash, entry) tuples
+        """
+        prefix = f"{self.namespace}:{version}:"
+        for key in self.backend.iter_keys(prefix):
+            value = self.backend.get(key)
+            if value is not None:
+                yield key[len(prefix):], json.loads(value)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for the health endpoint"""
+        lookups = self.hits + self.misses
+        return {
+            "backend": self.backend.name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+def build_cache_backend(
+    backend: str,
+    ttl_seconds: Optional[int] = None,
+    max_entries: int = 1024,
+    sqlite_path: str = "cache.sqlite3",
+    redis_url: str = "redis://localhost:6379/0"
+) -> Optional[CacheBackend]:
+    """
+    Create a cache backend by name
+
+    Args:
+        backend: One of memory, sqlite, redis or none
+        ttl_seconds: Entry lifetime, or None/0 to never expire
+        max_entries: LRU size for the memory backend
+        sqlite_path: Database file for the sqlite backend
+        redis_url: Server URL for the redis backend
+
+    Returns:
+        Configured backend, or None when caching is disabled
+    """
+    backend = backend.lower()
+    ttl_seconds = ttl_seconds or None
+
+    if backend == "none":
+        return None
+    if backend == "memory":
+        return MemoryCacheBackend(max_entries=max_entries, ttl_seconds=ttl_seconds)
+    if backend == "sqlite":
+        return SQLiteCacheBackend(sqlite_path, ttl_seconds=ttl_seconds)
+    if backend == "redis":
+        return RedisCacheBackend.from_url(redis_url, ttl_seconds=ttl_seconds)
+
+    raise ValueError(f"Unknown cache backend: {backend}")
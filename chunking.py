@@ -0,0 +1,100 @@
+import re
+from typing import Any, Dict, List, Optional
+
+
+def split_into_chunks(pages: List[str], max_chars: int) -> List[str]:
+    """
+    Group consecutive pages into chunks of at most max_chars characters
+
+    Pages are never reordered. A single page longer than max_chars is split
+    on paragraph boundaries, and hard-cut only if one paragraph is too long.
+
+    Args:
+        pages: Markdown of each page in document order
+        max_chars: Maximum characters per chunk
+
+    Returns:
+        Chunk texts in document order
+    """
+    if max_chars <= 0:
+        raise ValueError("Chunk size must be positive")
+
+    pieces = []
+    for page in pages:
+        if len(page) <= max_chars:
+            pieces.append(page)
+            continue
+
+        for paragraph in page.split('\n\n'):
+            for start in range(0, len(paragraph), max_chars):
+                pieces.append(paragraph[start:start + max_chars])
+
+    chunks = []
+    current: List[str] = []
+    current_size = 0
+
+    for piece in pieces:
+        # Account for the '\n\n' separator between pieces
+        added_size = len(piece) + (2 if current else 0)
+        if current and current_size + added_size > max_chars:
+            chunks.append('\n\n'.join(current))
+            current = []
+            current_size = 0
+            added_size = len(piece)
+
+        current.append(piece)
+        current_size += added_size
+
+    if current:
+        chunks.append('\n\n'.join(current))
+
+    return chunks
+
+
+def _normalize(value: str) -> str:
+    """Comparison key for a field value: case- and whitespace-insensitive"""
+    return re.sub(r'\s+', ' ', value).strip().casefold()
+
+
+def merge_chunk_results(chunk_results: List[Dict[str, Any]], fields: List[str]) -> Dict[str, Any]:
+    """
+    Resolve per-chunk extractions into a single result
+
+    For each field the value reported by the most chunks wins (compared
+    case- and whitespace-insensitively). Ties go to the value that first
+    appears earliest in the document, so the merge is deterministic and
+    independent of the order in which chunk calls completed.
+
+    Args:
+        chunk_results: Extraction result of each chunk, in document order
+        fields: Field names to resolve
+
+    Returns:
+        Dictionary with one value (or None) per field
+    """
+    merged: Dict[str, Optional[Any]] = {}
+
+    for field in fields:
+        votes: Dict[str, int] = {}
+        first_seen: Dict[str, int] = {}
+        original: Dict[str, Any] = {}
+
+        for position, result in enumerate(chunk_results):
+            value = result.get(field)
+            if value is None or (isinstance(value, str) and not value.strip()):
+                continue
+
+            key = _normalize(str(value))
+            votes[key] = votes.get(key, 0) + 1
+            if key not in first_seen:
+                first_seen[key] = position
+                original[key] = value
+
+        if not votes:
+            merged[field] = None
+            continue
+
+        winner = min(votes, key=lambda key: (-votes[key], first_seen[key]))
+        merged[field] = original[winner]
+
+    return merged
@@ -1,3 +1,4 @@
+from typing import Optional
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -8,6 +9,152 @@ class Settings(BaseSettings):
     mistral_api_key: str
     api_auth_token: str
 
+    # Maximum number of documents processed concurrently per worker
+    max_concurrent_extractions: int = 32
+
+    # LLM extraction: single, chunked or auto (chunk documents longer
+    # than chunk_max_chars and merge the per-chunk results)
+    extraction_mode: str = "auto"
+    chunk_max_chars: int = 60000
+    chunk_concurrency: int = 4
+
+    # Stream single-call completions and stop reading once every
+    # requested field has closed
+    llm_streaming_enabled: bool = True
+
+    # Resolve predictable fields (email, policy number, ...) with rules
+    # and ask the LLM only for the rest
+    rule_extraction_enabled: bool = True
+
+    # Send only the pages most relevant to the 8 fields (plus neighbours)
+    # when a document exceeds the token budget
+    page_pruning_enabled: bool = True
+    page_token_budget: int = 16000
+    page_neighbours: int = 1
+
+    # Read text-layer PDF, DOCX and TXT files locally and OCR only the
+    # pages with less than local_min_page_chars characters of text
+    local_extraction_enabled: bool = True
+    local_min_page_chars: int = 100
+
+    # PDFs with more pages to OCR than this are split into page-range
+    # shards OCR'd concurrently; a failed shard is retried on its own
+    ocr_shard_pages: int = 50
+    ocr_shard_concurrency: int = 4
+
+    # Retries of transient provider errors (429, 5xx, timeouts) with
+    # exponential backoff and full jitter, honouring Retry-After. Each
+    # request earns retry_budget_ratio retries, banked up to the reserve.
+    provider_max_attempts: int = 4
+    provider_backoff_base_seconds: float = 0.5
+    provider_backoff_max_seconds: float = 30.0
+    provider_retry_budget_ratio: float = 0.2
+    provider_retry_budget_reserve: float = 10.0
+
+    # Send a second request when one runs past the observed p95 latency
+    provider_hedging_enabled: bool = False
+    provider_hedge_min_samples: int = 20
+
+    # OpenTelemetry tracing: none, otlp, console or memory (spans kept in
+    # tracing.memory_exporter, for tests). New traces are sampled at
+    # tracing_sample_ratio; requests with a traceparent header follow the
+    # caller's sampling decision. Needs the opentelemetry-sdk package
+    # (plus opentelemetry-exporter-otlp-proto-http for otlp).
+    tracing_exporter: str = "none"
+    tracing_sample_ratio: float = 0.1
+    tracing_service_name: str = "beshak-extraction"
+    tracing_otlp_endpoint: Optional[str] = None
+
+    # Connection pools shared by the Mistral and OpenAI clients (per worker
+    # process). http_max_connections=0 sizes the pool from
+    # max_concurrent_extractions x max(ocr_shard_concurrency, chunk_concurrency);
+    # 0 keep-alive connections means the same as the pool size. HTTP/2
+    # needs the optional 'h2' package.
+    http_max_connections: int = 0
+    http_max_keepalive_connections: int = 0
+    http_keepalive_expiry_seconds: float = 60.0
+    http_connect_timeout_seconds: float = 10.0
+    http_read_timeout_seconds: float = 180.0
+    http_write_timeout_seconds: float = 60.0
+    http_pool_timeout_seconds: float = 30.0
+    http2_enabled: bool = False
+
+    # Per-provider circuit breaker: opens when the share of transient
+    # failures or of calls slower than circuit_slow_call_seconds in the last
+    # circuit_window calls reaches its threshold, then fails calls fast for
+    # circuit_open_seconds before letting a probe call through. Only the
+    # provider request is timed, not the wait for rate limit capacity. In
+    # degraded mode, which is opt-in, an open circuit is answered from local
+    # text and rule-based fields instead of a 503.
+    circuit_breaker_enabled: bool = True
+    circuit_failure_rate_threshold: float = 0.5
+    circuit_slow_call_rate_threshold: float = 0.5
+    circuit_slow_call_seconds: float = 60.0
+    circuit_window: int = 20
+    circuit_min_calls: int = 10
+    circuit_open_seconds: float = 30.0
+    degraded_mode_enabled: bool = False
+
+    # Client-side provider quotas per minute (0 = unlimited). The memory
+    # backend limits each worker process separately; sqlite shares the
+    # buckets between processes on a host and redis between hosts.
+    rate_limit_backend: str = "memory"
+    rate_limit_sqlite_path: str = "rate_limit.sqlite3"
+    rate_limit_redis_url: str = "redis://localhost:6379/0"
+    openai_requests_per_minute: int = 0
+    openai_tokens_per_minute: int = 0
+    mistral_requests_per_minute: int = 0
+    mistral_pages_per_minute: int = 0
+
+    # Alternative API URLs, e.g. for a local fault-injecting stub server
+    openai_base_url: Optional[str] = None
+    mistral_server_url: Optional[str] = None
+
+    # Request embedded page images from Mistral OCR (unused by extraction)
+    mistral_include_images: bool = False
+
+    # Uploads larger than this are sent to Mistral via the files API
+    # instead of an inline base64 data URL
+    mistral_inline_max_bytes: int = 1024 * 1024
+
+    # Batch extraction limits; zip archives are rejected as soon as their
+    # members pass the document count or the total unpacked size
+    batch_max_documents: int = 500
+    batch_max_upload_bytes: int = 512 * 1024 * 1024
+    batch_max_unpacked_bytes: int = 1024 * 1024 * 1024
+    batch_concurrency: int = 8
+
+    # Asynchronous jobs: worker count is per process and independent of
+    # the HTTP workers (0 = accept jobs but leave them to other processes,
+    # such as `python -m jobs`). Webhooks to loopback, private and other
+    # non-public addresses are refused unless job_webhook_allow_private.
+    # On shutdown, running jobs get job_shutdown_seconds to finish and are
+    # then requeued; keep it well under GRACEFUL_TIMEOUT, which also
+    # covers draining HTTP requests.
+    job_workers: int = 4
+    job_db_path: str = "jobs.sqlite3"
+    job_storage_dir: str = "job_uploads"
+    job_lease_seconds: int = 1800
+    job_max_attempts: int = 3
+    job_poll_interval_seconds: float = 1.0
+    job_webhook_allow_private: bool = False
+    job_shutdown_seconds: float = 60.0
+
+    # Directory for spooled uploads (system temp dir if unset)
+    upload_spool_dir: Optional[str] = None
+
+    # Result cache: memory, sqlite, redis or none
+    cache_backend: str = "memory"
+    cache_max_entries: int = 1024
+    cache_ttl_seconds: int = 7 * 24 * 60 * 60
+    cache_sqlite_path: str = "cache.sqlite3"
+    cache_redis_url: str = "redis://localhost:6379/0"
+
+    # OCR page cache, persistent by default so prompt changes don't force re-OCR
+    ocr_cache_backend: str = "sqlite"
+    ocr_cache_ttl_seconds: int = 0
+    ocr_cache_sqlite_path: str = "ocr_cache.sqlite3"
+
     model_config = SettingsConfigDict(
         env_file=".env",
         env_file_encoding="utf-8",
@@ -0,0 +1,345 @@
+"""
+Local stand-in for the OpenAI and Mistral APIs that injects faults
+
+Usage:
+    FAULT_ERROR_RATE=0.2 FAULT_RATE_LIMIT_RATE=0.1 uvicorn fault_stub:app --port 9000
+
+    OPENAI_BASE_URL=http://localhost:9000/v1 MISTRAL_SERVER_URL=http://localhost:9000 \\
+        uvicorn app:app --port 8000
+
+Serves chat completions (streamed or not), OCR, the files endpoints and
+the OpenAI and Mistral batch APIs used by the app and provider_batch.py,
+with canned content. Every request first rolls
+for a fault, configured through environment variables:
+
+    FAULT_ERROR_RATE        Fraction of requests answered with a 503
+    FAULT_RATE_LIMIT_RATE   Fraction answered with a 429
+    FAULT_RETRY_AFTER       Retry-After seconds sent with 429s (default 1)
+    FAULT_LATENCY_MS        Base latency of every request (default 50)
+    FAULT_SLOW_RATE         Fraction of requests that are slow
+    FAULT_SLOW_MS           Latency of slow requests (default 5000)
+    FAULT_BATCH_SECONDS     Seconds before a batch job completes (default 2)
+    FAULT_TRUNCATE_RATE     Fraction of completions cut off as if at max_tokens
+    FAULT_IMAGE_KB          Size of the page image OCR returns per page when
+                            include_image_base64 is set (default 200)
+
+Chat usage imitates OpenAI's prompt cache: a prompt whose first 1024+
+tokens (counted as 4 characters each, in 128-token steps) match an
+earlier prompt reports that prefix as cached_tokens. As at OpenAI, the
+response_format schema is part of the prompt, in front of the messages.
+
+GET /stats reports how many requests and faults each endpoint has seen.
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import random
+import time
+import uuid
+from collections import Counter
+
+from fastapi import FastAPI, Request, UploadFile, File, Form
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+from pdf_pages import page_count, pdf_support_available
+
+ERROR_RATE = float(os.getenv("FAULT_ERROR_RATE", "0"))
+RATE_LIMIT_RATE = float(os.getenv("FAULT_RATE_LIMIT_RATE", "0"))
+RETRY_AFTER = os.getenv("FAULT_RETRY_AFTER", "1")
+LATENCY_MS = float(os.getenv("FAULT_LATENCY_MS", "50"))
+SLOW_RATE = float(os.getenv("FAULT_SLOW_RATE", "0"))
+SLOW_MS = float(os.getenv("FAULT_SLOW_MS", "5000"))
+BATCH_SECONDS = float(os.getenv("FAULT_BATCH_SECONDS", "2"))
+TRUNCATE_RATE = float(os.getenv("FAULT_TRUNCATE_RATE", "0"))
+IMAGE_KB = int(os.getenv("FAULT_IMAGE_KB", "200"))
+
+EXTRACTION = {
+    "name": "Jane Doe",
+    "policy_number": "P/123456/01/2024/000001",
+    "email": "jane.doe@example.com",
+    "policy_name": "Family Health Optima Insurance Plan",
+    "plan_type": "SHAHLIP21211V042021",
+    "sum_assured": "Rs. 5,00,000",
+    "room_rent_limit": None,
+    "waiting_period": "30 days"
+}
+
+app = FastAPI(title="Provider Fault Stub")
+counts: Counter = Counter()
+files = {}
+batches = {}
+prompt_prefixes = set()
+
+
+def _usage(body: dict) -> dict:
+    """Usage for a chat request, with prefixes seen before reported as cached"""
+    prompt = json.dumps(body.get("response_format") or {}, sort_keys=True)
+    prompt += "".join(str(message.get("content", "")) for message in body.get("messages", []))
+    prompt_tokens = max(1, len(prompt) // 4)
+
+    cached = 0
+    for tokens in range(1024, prompt_tokens + 1, 128):
+        prefix = hashlib.sha256(prompt[:tokens * 4].encode("utf-8")).hexdigest()
+        if prefix in prompt_prefixes:
+            cached = tokens
+        prompt_prefixes.add(prefix)
+
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": 100,
+        "total_tokens": prompt_tokens + 100,
+        "prompt_tokens_details": {"cached_tokens": cached}
+    }
+
+
+async def inject_fault(endpoint: str):
+    """Sleep for the configured latency, then maybe return an error response"""
+    counts[endpoint] += 1
+    slow = random.random() < SLOW_RATE
+    await asyncio.sleep((SLOW_MS if slow else LATENCY_MS) / 1000)
+
+    roll = random.random()
+    if roll < RATE_LIMIT_RATE:
+        counts[f"{endpoint}:429"] += 1
+        return JSONResponse({"error": {"message": "Rate limit exceeded"}}, status_code=429, headers={"Retry-After": RETRY_AFTER})
+    if roll < RATE_LIMIT_RATE + ERROR_RATE:
+        counts[f"{endpoint}:503"] += 1
+        return JSONResponse({"error": {"message": "Service unavailable"}}, status_code=503)
+    return None
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    fault = await inject_fault("chat")
+    if fault is not None:
+        return fault
+
+    body = await request.json()
+    content, finish_reason = _reply(body)
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+    usage = _usage(body)
+
+    if body.get("stream"):
+        async def events():
+            for start in range(0, len(content), 8):
+                chunk = {
+                    "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": body["model"],
+                    "choices": [{"index": 0, "delta": {"content": content[start:start + 8]}, "finish_reason": None}]
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+            chunk = {
+                "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": body["model"],
+                "choices": [{"index": 0, "delta": {}, "finish_reason": finish_reason}]
+            }
+            yield f"data: {json.dumps(chunk)}\n\n"
+            if (body.get("stream_options") or {}).get("include_usage"):
+                chunk = {
+                    "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": body["model"],
+                    "choices": [], "usage": usage
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return _chat_completion(body, completion_id, created, usage, content, finish_reason)
+
+
+def _reply(body: dict) -> tuple:
+    """Completion text and finish reason: the fields a JSON schema asks for, maybe cut off"""
+    fields = list(EXTRACTION)
+    response_format = body.get("response_format") or {}
+    if response_format.get("type") == "json_schema":
+        fields = list(response_format["json_schema"]["schema"]["properties"])
+
+    content = json.dumps({field: EXTRACTION.get(field) for field in fields})
+    if random.random() < TRUNCATE_RATE:
+        counts["chat:truncated"] += 1
+        return content[:len(content) * 3 // 5], "length"
+    return content, "stop"
+
+
+def _chat_completion(body: dict, completion_id: str, created: int, usage: dict, content: str, finish_reason: str) -> dict:
+    return {
+        "id": completion_id, "object": "chat.completion", "created": created, "model": body["model"],
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": finish_reason}],
+        "usage": usage
+    }
+
+
+def _document_bytes(document: dict) -> bytes:
+    url = document.get("document_url") or document.get("image_url") or ""
+    if url.startswith("data:"):
+        return base64.b64decode(url.split(",", 1)[1])
+    return files.get(url.rsplit("/", 1)[-1], b"")
+
+
+@app.post("/v1/ocr")
+async def ocr(request: Request):
+    fault = await inject_fault("ocr")
+    if fault is not None:
+        return fault
+
+    return _ocr_response(await request.json())
+
+
+def _ocr_response(body: dict) -> dict:
+    content = _document_bytes(body["document"])
+
+    pages = 1
+    if content.startswith(b"%PDF") and pdf_support_available():
+        pages = page_count(content)
+    page_numbers = body.get("pages") or list(range(pages))
+
+    # A scanned page comes back as one full-page image, like Mistral's
+    images = []
+    if body.get("include_image_base64"):
+        image = "data:image/jpeg;base64," + base64.b64encode(os.urandom(IMAGE_KB * 1024)).decode('ascii')
+        images = [{
+            "id": "img-0.jpeg", "top_left_x": 0, "top_left_y": 0,
+            "bottom_right_x": 1700, "bottom_right_y": 2200, "image_base64": image
+        }]
+
+    return {
+        "model": body["model"],
+        "pages": [
+            {
+                "index": number,
+                "markdown": f"Policy Holder Name: {EXTRACTION['name']}\n\nPage {number + 1} of the stub document",
+                "images": images,
+                "dimensions": {"dpi": 200, "height": 2200, "width": 1700}
+            }
+            for number in page_numbers
+        ],
+        "usage_info": {"pages_processed": len(page_numbers), "doc_size_bytes": len(content)}
+    }
+
+
+@app.post("/v1/files")
+async def upload_file(file: UploadFile = File(...), purpose: str = Form("ocr")):
+    fault = await inject_fault("files")
+    if fault is not None:
+        return fault
+
+    return _file_object(uuid.uuid4().hex, await file.read(), file.filename, purpose)
+
+
+def _file_object(file_id: str, content: bytes, filename: str, purpose: str) -> dict:
+    """Store a file and describe it in both the OpenAI and the Mistral shape"""
+    files[file_id] = content
+    return {
+        "id": file_id, "object": "file", "bytes": len(content), "size_bytes": len(content), "created_at": int(time.time()),
+        "filename": filename, "purpose": purpose, "status": "processed", "sample_type": "instruct", "source": "upload"
+    }
+
+
+@app.get("/v1/files/{file_id}/content")
+async def file_content(file_id: str):
+    return Response(files.get(file_id, b""), media_type="application/octet-stream")
+
+
+@app.get("/v1/files/{file_id}/url")
+async def signed_url(file_id: str, request: Request):
+    return {"url": f"{request.base_url}v1/files/{file_id}"}
+
+
+@app.delete("/v1/files/{file_id}")
+async def delete_file(file_id: str):
+    files.pop(file_id, None)
+    return {"id": file_id, "object": "file", "deleted": True}
+
+
+def _run_batch(input_file_id: str, respond) -> dict:
+    """
+    Answer every line of a batch input file
+
+    Each line rolls for a fault like a synchronous request, without the
+    latency; failed lines go to the error file as the providers do.
+    """
+    outputs, errors = [], []
+    for line in files.get(input_file_id, b"").decode("utf-8").splitlines():
+        if not line.strip():
+            continue
+        request = json.loads(line)
+        if random.random() < ERROR_RATE:
+            counts["batch:503"] += 1
+            errors.append({
+                "id": uuid.uuid4().hex, "custom_id": request["custom_id"],
+                "response": {"status_code": 503, "body": {"error": {"message": "Service unavailable"}}}, "error": None
+            })
+            continue
+        outputs.append({
+            "id": uuid.uuid4().hex, "custom_id": request["custom_id"],
+            "response": {"status_code": 200, "body": respond(request["body"])}, "error": None
+        })
+
+    result = {"total": len(outputs) + len(errors), "completed": len(outputs), "failed": len(errors), "output": None, "errors": None}
+    for kind, lines in (("output", outputs), ("errors", errors)):
+        if lines:
+            result[kind] = _file_object(uuid.uuid4().hex, "".join(json.dumps(line) + "\n" for line in lines).encode("utf-8"), f"batch_{kind}.jsonl", "batch")["id"]
+    return result
+
+
+def _batch_ready(batch: dict) -> bool:
+    return time.time() - batch["created_at"] >= BATCH_SECONDS
+
+
+@app.post("/v1/batches")
+async def create_openai_batch(request: Request):
+    body = await request.json()
+    batch_id = f"batch_{uuid.uuid4().hex}"
+    batches[batch_id] = {
+        "id": batch_id, "object": "batch", "endpoint": body["endpoint"], "input_file_id": body["input_file_id"],
+        "completion_window": body["completion_window"], "status": "in_progress", "created_at": int(time.time()),
+        "metadata": body.get("metadata"), "request_counts": {"total": 0, "completed": 0, "failed": 0}
+    }
+    return batches[batch_id]
+
+
+@app.get("/v1/batches/{batch_id}")
+async def get_openai_batch(batch_id: str):
+    batch = batches[batch_id]
+    if batch["status"] == "in_progress" and _batch_ready(batch):
+        result = _run_batch(
+            batch["input_file_id"],
+            lambda body: _chat_completion(body, f"chatcmpl-{uuid.uuid4().hex}", int(time.time()), _usage(body), *_reply(body))
+        )
+        batch.update(
+            status="completed", output_file_id=result["output"], error_file_id=result["errors"],
+            request_counts={"total": result["total"], "completed": result["completed"], "failed": result["failed"]}
+        )
+    return batch
+
+
+@app.post("/v1/batch/jobs")
+async def create_mistral_batch(request: Request):
+    body = await request.json()
+    job_id = uuid.uuid4().hex
+    batches[job_id] = {
+        "id": job_id, "object": "batch", "input_files": body["input_files"], "endpoint": body["endpoint"],
+        "model": body.get("model"), "metadata": body.get("metadata"), "errors": [], "status": "RUNNING",
+        "created_at": int(time.time()), "total_requests": 0, "completed_requests": 0,
+        "succeeded_requests": 0, "failed_requests": 0
+    }
+    return batches[job_id]
+
+
+@app.get("/v1/batch/jobs/{job_id}")
+async def get_mistral_batch(job_id: str):
+    job = batches[job_id]
+    if job["status"] == "RUNNING" and _batch_ready(job):
+        result = _run_batch(job["input_files"][0], lambda body: _ocr_response({**body, "model": job["model"]}))
+        job.update(
+            status="SUCCESS", output_file=result["output"], error_file=result["errors"],
+            total_requests=result["total"], completed_requests=result["total"],
+            succeeded_requests=result["completed"], failed_requests=result["failed"]
+        )
+    return job
+
+
+@app.get("/stats")
+async def stats():
+    return dict(counts)
@@ -0,0 +1,116 @@
+"""
+Gunicorn settings for serving the API with several worker processes
+
+Usage:
+    gunicorn -c gunicorn.conf.py main:app
+
+Each worker is a uvicorn event loop; the app is imported once in the
+master before forking, so the SDK and model imports (about 1.5s) are paid
+once and their memory is shared copy-on-write. Tuned through environment
+variables:
+
+    WEB_CONCURRENCY      Worker processes (default: derived from CPU and memory)
+    WORKER_MEMORY_MB     Memory budget per worker when deriving the count (default 512)
+    PORT                 Port to listen on (default 8086)
+    MAX_REQUESTS         Requests before a worker is replaced, capping memory creep (default 1000)
+    MAX_REQUESTS_JITTER  Random extra requests, so workers are not all replaced together (default 100)
+    WORKER_TIMEOUT       Seconds a worker may go without a heartbeat before it is killed (default 120)
+    GRACEFUL_TIMEOUT     Seconds a replaced or stopping worker gets to finish in-flight extractions (default 300)
+                         (background jobs get JOB_SHUTDOWN_SECONDS of it, then are requeued)
+
+Provider clients, caches and the job store are created in the master.
+That is safe because no provider connection is opened before the fork
+and the SQLite-backed stores reopen their connections in each worker.
+Per-process state (/health counters, the memory rate limit and cache
+backends, MAX_CONCURRENT_EXTRACTIONS and the HTTP pool size) is per
+worker; use the sqlite or redis backends to share limits and caches.
+"""
+import math
+import os
+import shutil
+import tempfile
+
+# Must be set before the app imports prometheus_client, so every worker
+# writes its metrics where /metrics can add them up
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "beshak-prometheus"))
+os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+
+def _read_cgroup(*paths: str) -> str:
+    """First readable cgroup file (v2, then v1 paths), or an empty string"""
+    for path in paths:
+        try:
+            with open(path) as f:
+                return f.read().strip()
+        except OSError:
+            continue
+    return ""
+
+
+def cpu_limit() -> int:
+    """CPUs available to this container: the scheduler affinity, capped by any cgroup quota"""
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+
+    quota = _read_cgroup("/sys/fs/cgroup/cpu.max").split()
+    if len(quota) == 2 and quota[0] != "max":
+        return max(1, min(cpus, math.ceil(int(quota[0]) / int(quota[1]))))
+
+    quota_us = _read_cgroup("/sys/fs/cgroup/cpu/cpu.cfs_quota_us")
+    period_us = _read_cgroup("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+    if quota_us and period_us and int(quota_us) > 0:
+        return max(1, min(cpus, math.ceil(int(quota_us) / int(period_us))))
+
+    return cpus
+
+
+def memory_limit_bytes() -> int:
+    """Memory available to this container: the cgroup limit, else physical memory"""
+    physical = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    limit = _read_cgroup("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes")
+    if limit.isdigit():
+        # cgroup v1 reports "no limit" as a huge number
+        return min(int(limit), physical)
+    return physical
+
+
+def default_workers() -> int:
+    """
+    One worker per CPU, as far as memory allows
+
+    Workers are async, so a single one keeps many provider calls in flight;
+    more workers only help with the CPU-bound parts (PDF parsing, base64,
+    JSON), which scale with cores, not with 2 x cores + 1 as for sync workers.
+    """
+    per_worker = int(os.getenv("WORKER_MEMORY_MB", "512")) * 1024 * 1024
+    return max(1, min(cpu_limit(), memory_limit_bytes() // per_worker))
+
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8086')}"
+workers = int(os.getenv("WEB_CONCURRENCY") or default_workers())
+worker_class = "uvicorn_worker.UvicornWorker"
+preload_app = True
+
+max_requests = int(os.getenv("MAX_REQUESTS", "1000"))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", "100"))
+
+# An extraction can take minutes (OCR plus LLM with retries); the worker
+# stays responsive meanwhile, so the heartbeat timeout can stay short
+timeout = int(os.getenv("WORKER_TIMEOUT", "120"))
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "300"))
+keepalive = 5
+
+accesslog = "-"
+
+
+def on_starting(server):
+    # Metric files left by a previous run would be added to this one's
+    metrics_dir = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+    server.log.info(f"Starting {workers} workers (CPU limit {cpu_limit()}, memory {memory_limit_bytes() // 2 ** 20} MB)")
+
+
+def child_exit(server, worker):
+    # Drop the live gauges of a worker that was replaced or died
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,182 @@
+import importlib.util
+import threading
+import time
+from typing import Any, Dict
+
+import httpx
+
+
+def http2_available() -> bool:
+    """Whether httpx can speak HTTP/2 (needs the optional 'h2' package)"""
+    return importlib.util.find_spec("h2") is not None
+
+
+class ConnectionStats:
+    """
+    Counts provider requests against the connections opened for them
+
+    Uses the httpcore "trace" request extension, which reports each TCP
+    connect and TLS handshake. A request that triggers neither went out on
+    a pooled keep-alive connection.
+    """
+
+    # httpcore trace events (minus .started / .complete) that mean a new connection
+    CONNECT = "connection.connect_tcp"
+    TLS = "connection.start_tls"
+
+    def __init__(self):
+        self.stats = {
+            "requests": 0,
+            "connections_opened": 0,
+            "tls_handshakes": 0,
+            "connect_seconds_total": 0.0,
+            "tls_seconds_total": 0.0
+        }
+        self._lock = threading.Lock()
+
+    def _trace(self, started: Dict[str, float], name: str) -> None:
+        phase, _, stage = name.rpartition(".")
+        if phase not in (self.CONNECT, self.TLS):
+            return
+
+        if stage == "started":
+            started[phase] = time.monotonic()
+        elif stage == "complete" and phase in started:
+            seconds = time.monotonic() - started.pop(phase)
+            with self._lock:
+                if phase == self.CONNECT:
+                    self.stats["connections_opened"] += 1
+                    self.stats["connect_seconds_total"] += seconds
+                else:
+                    self.stats["tls_handshakes"] += 1
+                    self.stats["tls_seconds_total"] += seconds
+
+    def on_request(self, request: httpx.Request) -> None:
+        """Request event hook for httpx.Client"""
+        with self._lock:
+            self.stats["requests"] += 1
+        started: Dict[str, float] = {}
+        request.extensions["trace"] = lambda name, info: self._trace(started, name)
+
+    async def on_request_async(self, request: httpx.Request) -> None:
+        """Request event hook for httpx.AsyncClient (its trace callback must be async too)"""
+        with self._lock:
+            self.stats["requests"] += 1
+        started: Dict[str, float] = {}
+
+        async def trace(name: str, info: Dict[str, Any]) -> None:
+            self._trace(started, name)
+
+        request.extensions["trace"] = trace
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+
+        opened = stats["connections_opened"]
+        handshakes = stats["tls_handshakes"]
+        connect_seconds = stats.pop("connect_seconds_total")
+        tls_seconds = stats.pop("tls_seconds_total")
+        stats["reused_requests"] = max(0, stats["requests"] - opened)
+        stats["reuse_ratio"] = round(stats["reused_requests"] / stats["requests"], 3) if stats["requests"] else 0.0
+        stats["avg_connect_ms"] = round(connect_seconds * 1000 / opened, 1) if opened else None
+        stats["avg_tls_ms"] = round(tls_seconds * 1000 / handshakes, 1) if handshakes else None
+        return stats
+
+
+class SharedHttpClients:
+    """
+    Sync and async httpx clients shared by the Mistral and OpenAI SDKs
+
+    One pool per process keeps connections to both providers alive between
+    documents, so only the first request to each host pays for the TCP and
+    TLS handshakes.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 128,
+        max_keepalive_connections: int = 128,
+        keepalive_expiry: float = 60.0,
+        connect_timeout: float = 10.0,
+        read_timeout: float = 180.0,
+        write_timeout: float = 60.0,
+        pool_timeout: float = 30.0,
+        http2: bool = False
+    ):
+        """
+        Args:
+            max_connections: Open connections allowed across both providers
+            max_keepalive_connections: Idle connections kept for reuse
+            keepalive_expiry: Seconds an idle connection is kept
+            connect_timeout: Seconds to establish a connection
+            read_timeout: Seconds to wait for response data
+            write_timeout: Seconds to send request data
+            pool_timeout: Seconds to wait for a free connection from the pool
+            http2: Negotiate HTTP/2, multiplexing requests to a provider over
+                one connection (falls back to HTTP/1.1 without 'h2')
+        """
+        if http2 and not http2_available():
+            print("Warning: HTTP transport - HTTP/2 requires the 'h2' package (pip install 'httpx[http2]'); using HTTP/1.1")
+            http2 = False
+
+        self.http2 = http2
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=min(max_keepalive_connections, max_connections),
+            keepalive_expiry=keepalive_expiry
+        )
+        self.timeout = httpx.Timeout(connect=connect_timeout, read=read_timeout, write=write_timeout, pool=pool_timeout)
+        self.stats = ConnectionStats()
+
+        # The Mistral SDK follows redirects by default; keep that behaviour
+        self.client = httpx.Client(
+            limits=self.limits,
+            timeout=self.timeout,
+            http2=http2,
+            follow_redirects=True,
+            event_hooks={"request": [self.stats.on_request]}
+        )
+        self.async_client = httpx.AsyncClient(
+            limits=self.limits,
+            timeout=self.timeout,
+            http2=http2,
+            follow_redirects=True,
+            event_hooks={"request": [self.stats.on_request_async]}
+        )
+
+    def report(self) -> Dict[str, Any]:
+        """Pool settings and connection reuse counters for the health endpoint"""
+        return {
+            **self.stats.report(),
+            "http2": self.http2,
+            "max_connections": self.limits.max_connections,
+            "max_keepalive_connections": self.limits.max_keepalive_connections
+        }
+
+    async def aclose(self) -> None:
+        await self.async_client.aclose()
+        self.client.close()
+
+
+def http_clients_from_settings(settings) -> SharedHttpClients:
+    """
+    Build the shared provider clients from the HTTP_* settings
+
+    With HTTP_MAX_CONNECTIONS unset (0), the pool is sized for the worst
+    case of one worker: every document slot making its maximum number of
+    concurrent provider calls (OCR shards or LLM chunks).
+    """
+    max_connections = settings.http_max_connections or settings.max_concurrent_extractions * max(
+        settings.ocr_shard_concurrency, settings.chunk_concurrency, 1
+    )
+    return SharedHttpClients(
+        max_connections=max_connections,
+        max_keepalive_connections=settings.http_max_keepalive_connections or max_connections,
+        keepalive_expiry=settings.http_keepalive_expiry_seconds,
+        connect_timeout=settings.http_connect_timeout_seconds,
+        read_timeout=settings.http_read_timeout_seconds,
+        write_timeout=settings.http_write_timeout_seconds,
+        pool_timeout=settings.http_pool_timeout_seconds,
+        http2=settings.http2_enabled
+    )
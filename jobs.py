@@ -0,0 +1,451 @@
+"""
+SQLite-backed job queue for asynchronous extraction
+
+Usage:
+    python -m jobs [--workers 4]
+
+Run as a module, it works through the queue on its own, with the same
+pipeline, caches and provider clients as the API. Give the web processes
+JOB_WORKERS=0 so they only accept jobs, and scale this worker separately.
+"""
+import argparse
+import asyncio
+import ipaddress
+import json
+import os
+import signal
+import socket
+import sqlite3
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from pipeline import ExtractionPipeline
+from sqlite_fork import ForkSafeSQLite
+from upload import SpooledUpload
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+
+class JobStore(ForkSafeSQLite):
+    """
+    SQLite-backed job table that doubles as a work queue
+
+    Jobs are claimed atomically, so several worker processes can share one
+    database file without an external broker. Workers renew the lease of a
+    running job; one whose lease has expired (its worker died) is handed out
+    again up to max_attempts times. A claim is identified by the job's
+    attempt count, and only the current claim can finish or release it.
+    """
+
+    def __init__(self, path: str, lease_seconds: float = 1800, max_attempts: int = 3):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._open()
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, status TEXT NOT NULL, filename TEXT NOT NULL, "
+            "path TEXT NOT NULL, document_hash TEXT NOT NULL, webhook_url TEXT, "
+            "result TEXT, error TEXT, attempts INTEGER NOT NULL DEFAULT 0, "
+            "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def create(self, upload: SpooledUpload, webhook_url: Optional[str] = None) -> Dict[str, Any]:
+        """Insert a queued job for a spooled upload"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, status, filename, path, document_hash, webhook_url, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, JOB_QUEUED, upload.filename, str(upload.path), upload.sha256, webhook_url, now, now)
+            )
+
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return a job by id, or None if it does not exist"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row is not None else None
+
+    def claim_next(self) -> Optional[Dict[str, Any]]:
+        """Atomically mark the oldest runnable job as running and return it"""
+        now = time.time()
+
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Give up on jobs whose workers kept dying
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, error = ?, updated_at = ? "
+                    "WHERE status = ? AND updated_at < ? AND attempts >= ?",
+                    (JOB_FAILED, "Job abandoned after repeated worker failures", now,
+                     JOB_RUNNING, now - self.lease_seconds, self.max_attempts)
+                )
+
+                row = self._conn.execute(
+                    "SELECT id FROM jobs WHERE status = ? OR (status = ? AND updated_at < ?) "
+                    "ORDER BY created_at LIMIT 1",
+                    (JOB_QUEUED, JOB_RUNNING, now - self.lease_seconds)
+                ).fetchone()
+
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                    (JOB_RUNNING, now, row["id"])
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        return self.get(row["id"])
+
+    def heartbeat(self, job_id: str, attempt: int) -> bool:
+        """
+        Renew the lease of a running job
+
+        Returns:
+            False if the claim has been lost, i.e. the lease expired and the
+            job was claimed again
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET updated_at = ? WHERE id = ? AND status = ? AND attempts = ?",
+                (time.time(), job_id, JOB_RUNNING, attempt)
+            )
+        return cursor.rowcount > 0
+
+    def release(self, job_id: str, attempt: int) -> None:
+        """Put a running job back in the queue without counting its attempt"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, attempts = MAX(attempts - 1, 0), updated_at = ? "
+                "WHERE id = ? AND status = ? AND attempts = ?",
+                (JOB_QUEUED, time.time(), job_id, JOB_RUNNING, attempt)
+            )
+
+    def complete(self, job_id: str, attempt: int, result: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Mark a job as succeeded with its result
+
+        Args:
+            job_id: Job to update
+            attempt: The attempt count the job was claimed with
+            result: Extraction result
+
+        Returns:
+            The job, or None if the claim was lost and the job left as it was
+        """
+        return self._finish(job_id, attempt, "status = ?, result = ?, error = NULL", (JOB_SUCCEEDED, json.dumps(result)))
+
+    def fail(self, job_id: str, attempt: int, error: str) -> Optional[Dict[str, Any]]:
+        """Mark a job as failed with an error message; None if the claim was lost (see complete)"""
+        return self._finish(job_id, attempt, "status = ?, error = ?", (JOB_FAILED, error))
+
+    def _finish(self, job_id: str, attempt: int, assignments: str, values: tuple) -> Optional[Dict[str, Any]]:
+        # Only the run that holds the claim may finish the job, so a run
+        # whose lease expired cannot overwrite the result of the next one
+        with self._lock:
+            cursor = self._conn.execute(
+                f"UPDATE jobs SET {assignments}, updated_at = ? WHERE id = ? AND status = ? AND attempts = ?",
+                (*values, time.time(), job_id, JOB_RUNNING, attempt)
+            )
+        if cursor.rowcount == 0:
+            return None
+        return self.get(job_id)
+
+    def counts(self) -> Dict[str, int]:
+        """Number of jobs per status"""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+
+def check_webhook_url(url: str, allow_private: bool = False) -> None:
+    """
+    Reject a webhook URL that is not http(s) or that resolves to a
+    loopback, private, link-local or otherwise non-public address, so jobs
+    cannot be used to reach services inside the network
+
+    Args:
+        url: Webhook URL supplied by the client
+        allow_private: Accept internal hosts too, e.g. for local testing
+
+    Raises:
+        ValueError: If the URL is not acceptable
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise ValueError("webhook_url must be an http(s) URL")
+
+    if allow_private:
+        return
+
+    try:
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        addresses = {info[4][0] for info in socket.getaddrinfo(parts.hostname, port, proto=socket.IPPROTO_TCP)}
+    except (socket.gaierror, UnicodeError) as e:
+        raise ValueError(f"webhook_url host could not be resolved: {str(e)}")
+
+    for address in addresses:
+        ip = ipaddress.ip_address(address.split('%')[0])
+        if ip.version == 6 and ip.ipv4_mapped is not None:
+            ip = ip.ipv4_mapped
+        if not ip.is_global or ip.is_multicast:
+            raise ValueError("webhook_url must not point to a loopback, private or reserved address")
+
+
+class JobQueue:
+    """In-process worker pool that runs queued jobs through the pipeline"""
+
+    def __init__(
+        self,
+        store: JobStore,
+        pipeline: ExtractionPipeline,
+        workers: int = 4,
+        poll_interval: float = 1.0,
+        webhook_timeout: float = 10.0,
+        webhook_attempts: int = 3,
+        webhook_allow_private: bool = False,
+        shutdown_seconds: float = 60.0
+    ):
+        """
+        Args:
+            store: Job table shared by all processes
+            pipeline: Extraction pipeline
+            workers: Number of concurrent jobs, independent of HTTP workers
+            poll_interval: Seconds between checks for jobs submitted elsewhere
+            webhook_timeout: Timeout in seconds for each webhook delivery
+            webhook_attempts: Delivery attempts per webhook
+            webhook_allow_private: Allow webhooks to internal hosts
+            shutdown_seconds: How long stop() waits for running jobs
+        """
+        self.store = store
+        self.pipeline = pipeline
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.webhook_timeout = webhook_timeout
+        self.webhook_attempts = webhook_attempts
+        self.webhook_allow_private = webhook_allow_private
+        self.shutdown_seconds = shutdown_seconds
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self._http: Optional[httpx.AsyncClient] = None
+
+    async def start(self) -> None:
+        """Start the worker tasks"""
+        self._http = httpx.AsyncClient(timeout=self.webhook_timeout)
+        self._stopping = False
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        """
+        Stop claiming jobs and give running ones shutdown_seconds to finish
+
+        Jobs still running then are cancelled and put back in the queue
+        without counting the attempt, so recycling a worker process neither
+        leaves them stuck until their lease expires nor uses up their
+        max_attempts.
+        """
+        self._stopping = True
+        self._wakeup.set()
+        if self._tasks:
+            _, pending = await asyncio.wait(self._tasks, timeout=self.shutdown_seconds)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    async def check_webhook(self, url: str) -> None:
+        """
+        Validate a webhook URL before a job is accepted (see check_webhook_url)
+
+        Raises:
+            ValueError: If the URL is not acceptable
+        """
+        await asyncio.to_thread(check_webhook_url, url, self.webhook_allow_private)
+
+    def submit(self, upload: SpooledUpload, webhook_url: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Queue a spooled upload for extraction
+
+        Args:
+            upload: Document spooled to the job storage directory
+            webhook_url: Optional URL to POST the finished job to
+
+        Returns:
+            The queued job
+        """
+        job = self.store.create(upload, webhook_url)
+        self._wakeup.set()
+        return job
+
+    async def _worker(self) -> None:
+        while not self._stopping:
+            job = self.store.claim_next()
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._run(job)
+
+    async def _run(self, job: Dict[str, Any]) -> None:
+        path = Path(job["path"])
+        attempt = job["attempts"]
+        heartbeat = asyncio.create_task(self._heartbeat(job["id"], attempt))
+
+        try:
+            result = await self.pipeline.run(path, job["filename"], job["document_hash"])
+            finished = self.store.complete(job["id"], attempt, result)
+        except asyncio.CancelledError:
+            # Stopped mid-job; another worker takes it up from the start
+            self.store.release(job["id"], attempt)
+            raise
+        except (ValueError, RuntimeError) as e:
+            finished = self.store.fail(job["id"], attempt, str(e))
+        except Exception as e:
+            finished = self.store.fail(job["id"], attempt, f"Unexpected error: {str(e)}")
+        finally:
+            heartbeat.cancel()
+
+        if finished is None:
+            # The lease was lost and another run owns the job and its upload
+            print(f"Warning: Jobs - job {job['id']} was claimed again, discarding this run's outcome")
+            return
+
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+        if finished["webhook_url"]:
+            await self._notify(finished)
+
+    async def _heartbeat(self, job_id: str, attempt: int) -> None:
+        """Renew a running job's lease, so a long job is not handed out twice"""
+        while True:
+            await asyncio.sleep(self.store.lease_seconds / 3)
+            if not self.store.heartbeat(job_id, attempt):
+                return
+
+    async def _notify(self, job: Dict[str, Any]) -> None:
+        """POST the finished job to its webhook, retrying with backoff"""
+        try:
+            # Checked again, as the host may resolve elsewhere by now
+            await self.check_webhook(job["webhook_url"])
+        except ValueError as e:
+            print(f"Warning: Webhook - not delivering job {job['id']}: {str(e)}")
+            return
+
+        payload = job_payload(job)
+
+        for attempt in range(self.webhook_attempts):
+            try:
+                response = await self._http.post(job["webhook_url"], json=payload)
+                if response.status_code < 500:
+                    return
+                error = f"HTTP {response.status_code}"
+            except httpx.HTTPError as e:
+                error = str(e)
+
+            if attempt + 1 < self.webhook_attempts:
+                await asyncio.sleep(2 ** attempt)
+
+        print(f"Warning: Webhook - delivery for job {job['id']} failed: {error}")
+
+
+def job_payload(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Public representation of a job for API responses and webhooks"""
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "filename": job["filename"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+        "result": job["result"],
+        "error": job["error"]
+    }
+
+
+async def run_workers(queue: JobQueue) -> None:
+    """Run the queue's workers until SIGINT or SIGTERM, then stop them"""
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stopping.set)
+
+    await queue.start()
+    print(f"Running {queue.workers} job workers on {queue.store.path}")
+    await stopping.wait()
+    await queue.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run asynchronous extraction jobs outside the web processes")
+    parser.add_argument("--workers", type=int, default=None, help="Concurrent jobs (default: JOB_WORKERS, or 4 if that is 0)")
+    args = parser.parse_args()
+
+    # The API's pipeline, caches and clients, built from the same settings;
+    # importing it does not start its job workers, which run in its lifespan
+    from config import settings
+    from main import httpClients, jobQueue
+
+    if jobQueue is None:
+        raise SystemExit("Job queue is not available")
+
+    queue = JobQueue(
+        jobQueue.store,
+        jobQueue.pipeline,
+        workers=args.workers or settings.job_workers or 4,
+        poll_interval=jobQueue.poll_interval,
+        webhook_allow_private=jobQueue.webhook_allow_private,
+        shutdown_seconds=jobQueue.shutdown_seconds
+    )
+
+    async def run() -> None:
+        try:
+            await run_workers(queue)
+        finally:
+            await httpClients.aclose()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
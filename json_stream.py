@@ -0,0 +1,99 @@
+import json
+from typing import Any, Dict, List, Tuple
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+
+
+class IncrementalObjectParser:
+    """
+    Parses a JSON object that arrives in pieces, such as streamed LLM output
+
+    Each top-level member is reported as soon as its value is complete,
+    without waiting for the closing brace. Values are decoded with the
+    standard json decoder; numbers are only accepted once a delimiter
+    follows them, since "12" may still become "125" or "12.5".
+    """
+
+    def __init__(self):
+        self.text = ''
+        self.result: Dict[str, Any] = {}
+        self.done = False
+        self._pos = 0
+        self._state = 'start'
+        self._key = None
+
+    def feed(self, text: str) -> List[Tuple[str, Any]]:
+        """
+        Add the next piece of the document
+
+        Args:
+            text: Next piece of the JSON text
+
+        Returns:
+            (key, value) pairs completed by this piece, in document order
+
+        Raises:
+            ValueError: If the text cannot be the start of a JSON object
+        """
+        self.text += text
+        completed = []
+
+        while not self.done:
+            while self._pos < len(self.text) and self.text[self._pos] in _WHITESPACE:
+                self._pos += 1
+            if self._pos >= len(self.text):
+                break
+
+            char = self.text[self._pos]
+
+            if self._state == 'start':
+                self._expect(char, '{')
+                self._state = 'key'
+                self._pos += 1
+
+            elif self._state == 'key':
+                if char == '}' and not self.result:
+                    self.done = True
+                    self._pos += 1
+                    break
+                self._expect(char, '"')
+                try:
+                    self._key, self._pos = _decoder.raw_decode(self.text, self._pos)
+                except json.JSONDecodeError:
+                    break  # key still arriving
+                self._state = 'colon'
+
+            elif self._state == 'colon':
+                self._expect(char, ':')
+                self._state = 'value'
+                self._pos += 1
+
+            elif self._state == 'value':
+                try:
+                    value, end = _decoder.raw_decode(self.text, self._pos)
+                except json.JSONDecodeError:
+                    break  # value still arriving
+                if isinstance(value, (int, float)) and not isinstance(value, bool) and (
+                    end >= len(self.text) or self.text[end] not in _WHITESPACE + ',}'
+                ):
+                    break  # more digits, a fraction or an exponent may follow
+
+                self.result[self._key] = value
+                completed.append((self._key, value))
+                self._pos = end
+                self._state = 'comma'
+
+            elif self._state == 'comma':
+                if char == '}':
+                    self.done = True
+                else:
+                    self._expect(char, ',')
+                    self._state = 'key'
+                self._pos += 1
+
+        return completed
+
+    def _expect(self, char: str, expected: str) -> None:
+        if char != expected:
+            raise ValueError(f"Expected '{expected}' at position {self._pos}, found '{char}'")
@@ -0,0 +1,94 @@
+"""
+Closed-loop load generator for /extract
+
+Usage:
+    python loadtest.py --url http://localhost:8086 --file sample.pdf [--concurrency 32] [--duration 30]
+
+Keeps --concurrency uploads in flight for --duration seconds and reports
+throughput and latency percentiles. Point the app at fault_stub.py and
+disable the result cache (CACHE_BACKEND=none), otherwise every request
+after the first is a cache hit and only the upload path is measured.
+"""
+import argparse
+import asyncio
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+
+async def run_load(
+    url: str,
+    content: bytes,
+    filename: str,
+    concurrency: int,
+    duration: float,
+    api_key: Optional[str] = None
+) -> Dict[str, float]:
+    """
+    Post the file to /extract from concurrency clients until duration has passed
+
+    Returns:
+        Request and error counts, requests per second and latency percentiles in ms
+    """
+    latencies: List[float] = []
+    errors = 0
+    headers = {"X-API-Key": api_key} if api_key else {}
+    deadline = time.monotonic() + duration
+
+    async with httpx.AsyncClient(
+        base_url=url,
+        timeout=300,
+        limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    ) as client:
+
+        async def user():
+            nonlocal errors
+            while time.monotonic() < deadline:
+                started = time.monotonic()
+                try:
+                    response = await client.post("/extract", files={"file": (filename, content)}, headers=headers)
+                    if response.status_code != 200:
+                        errors += 1
+                        continue
+                except httpx.HTTPError:
+                    errors += 1
+                    continue
+                latencies.append(time.monotonic() - started)
+
+        started = time.monotonic()
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+        elapsed = time.monotonic() - started
+
+    latencies.sort()
+
+    def percentile(fraction: float) -> float:
+        return round(latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] * 1000, 1) if latencies else 0.0
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "requests_per_second": round(len(latencies) / elapsed, 1),
+        "p50_ms": percentile(0.5),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure /extract throughput and latency")
+    parser.add_argument("--url", default="http://localhost:8086", help="Base URL of the app")
+    parser.add_argument("--file", required=True, help="Document to upload")
+    parser.add_argument("--concurrency", type=int, default=32, help="Uploads kept in flight")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to run")
+    parser.add_argument("--api-key", default=None, help="X-API-Key header, for app.py")
+    args = parser.parse_args()
+
+    path = Path(args.file)
+    report = asyncio.run(run_load(args.url, path.read_bytes(), path.name, args.concurrency, args.duration, args.api_key))
+    print(" ".join(f"{key}={value}" for key, value in report.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import io
+import zipfile
+from pathlib import Path
+from typing import List, Optional, Union
+from xml.etree import ElementTree
+
+try:
+    from pypdf import PdfReader
+except ImportError:
+    PdfReader = None
+
+WORD_NAMESPACE = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+
+class LocalTextExtractor:
+    """
+    Extracts text locally from TXT, DOCX and born-digital PDF files
+
+    Pages are returned in document order. A PDF page without a usable text
+    layer (a scanned or image-only page) is returned as None so the caller
+    can OCR just those pages; a TXT or DOCX file without text is not read
+    locally at all.
+    """
+
+    def __init__(self, min_page_chars: int = 100):
+        """
+        Args:
+            min_page_chars: Pages with less extractable text than this are
+                treated as scanned and left for OCR
+        """
+        self.min_page_chars = min_page_chars
+
+    def supports(self, filename: str) -> bool:
+        """Whether the file format can be read locally"""
+        file_ext = Path(filename).suffix.lower()
+        if file_ext == '.pdf':
+            return PdfReader is not None
+        return file_ext in ('.txt', '.docx')
+
+    def extract_pages(self, file_content: Union[bytes, Path], filename: str) -> Optional[List[Optional[str]]]:
+        """
+        Extract per-page text from a document
+
+        Args:
+            file_content: Binary content of the file, or path to it on disk
+            filename: Name of the file
+
+        Returns:
+            Text of each page (None for pages that need OCR), or None if the
+            document cannot be read locally at all
+        """
+        file_ext = Path(filename).suffix.lower()
+
+        try:
+            if file_ext == '.txt':
+                return self._extract_txt(file_content)
+            if file_ext == '.docx':
+                return self._extract_docx(file_content)
+            if file_ext == '.pdf' and PdfReader is not None:
+                return self._extract_pdf(file_content)
+        except Exception as e:
+            # Encrypted, malformed or unusual files are left to OCR
+            print(f"Warning: Local extraction - {filename}: {str(e)}")
+
+        return None
+
+    @staticmethod
+    def _read_bytes(file_content: Union[bytes, Path]) -> bytes:
+        if isinstance(file_content, Path):
+            return file_content.read_bytes()
+        return file_content
+
+    def _extract_txt(self, file_content: Union[bytes, Path]) -> Optional[List[str]]:
+        text = self._read_bytes(file_content).decode('utf-8', errors='replace')
+        # Form feeds mark page breaks in exported text files
+        pages = [page.strip() for page in text.split('\f')]
+        return [page for page in pages if page] or None
+
+    def _extract_pdf(self, file_content: Union[bytes, Path]) -> List[Optional[str]]:
+        source = file_content if isinstance(file_content, Path) else io.BytesIO(file_content)
+        reader = PdfReader(source)
+
+        pages = []
+        for page in reader.pages:
+            text = (page.extract_text() or '').strip()
+            pages.append(text if len(text) >= self.min_page_chars else None)
+
+        return pages
+
+    def _extract_docx(self, file_content: Union[bytes, Path]) -> Optional[List[str]]:
+        source = file_content if isinstance(file_content, Path) else io.BytesIO(file_content)
+        with zipfile.ZipFile(source) as archive:
+            root = ElementTree.fromstring(archive.read('word/document.xml'))
+
+        body = root.find(f'{WORD_NAMESPACE}body')
+        pages: List[List[str]] = [[]]
+
+        for element in body:
+            if element.tag == f'{WORD_NAMESPACE}p':
+                text = self._paragraph_text(element)
+                if text:
+                    pages[-1].append(self._heading_prefix(element) + text)
+                if self._has_page_break(element):
+                    pages.append([])
+            elif element.tag == f'{WORD_NAMESPACE}tbl':
+                pages[-1].append(self._table_markdown(element))
+
+        texts = ['\n\n'.join(blocks) for blocks in pages if blocks]
+        if sum(len(text) for text in texts) < self.min_page_chars:
+            # Probably an image-only document; DOCX can only be OCR'd whole
+            return None
+
+        return texts
+
+    @staticmethod
+    def _paragraph_text(paragraph) -> str:
+        parts = []
+        for node in paragraph.iter():
+            if node.tag == f'{WORD_NAMESPACE}t' and node.text:
+                parts.append(node.text)
+            elif node.tag == f'{WORD_NAMESPACE}tab':
+                parts.append('\t')
+            elif node.tag == f'{WORD_NAMESPACE}br' and node.get(f'{WORD_NAMESPACE}type') != 'page':
+                parts.append('\n')
+        return ''.join(parts).strip()
+
+    @staticmethod
+    def _heading_prefix(paragraph) -> str:
+        style = paragraph.find(f'{WORD_NAMESPACE}pPr/{WORD_NAMESPACE}pStyle')
+        if style is None:
+            return ''
+
+        name = style.get(f'{WORD_NAMESPACE}val', '')
+        if name.lower().startswith('heading') and name[7:].isdigit():
+            return '#' * min(int(name[7:]), 6) + ' '
+        if name.lower() == 'title':
+            return '# '
+        return ''
+
+    @staticmethod
+    def _has_page_break(paragraph) -> bool:
+        return any(
+            node.get(f'{WORD_NAMESPACE}type') == 'page'
+            for node in paragraph.iter(f'{WORD_NAMESPACE}br')
+        )
+
+    def _table_markdown(self, table) -> str:
+        rows = []
+        for row in table.iter(f'{WORD_NAMESPACE}tr'):
+            cells = [
+                ' '.join(filter(None, (self._paragraph_text(p) for p in cell.iter(f'{WORD_NAMESPACE}p'))))
+                for cell in row.iter(f'{WORD_NAMESPACE}tc')
+            ]
+            rows.append('| ' + ' | '.join(cell.replace('|', '\\|').replace('\n', ' ') for cell in cells) + ' |')
+
+        if rows:
+            # Markdown header separator after the first row
+            column_count = rows[0].count(' | ') + 1
+            rows.insert(1, '|' + '---|' * column_count)
+
+        return '\n'.join(rows)
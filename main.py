@@ -1,30 +1,192 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+import math
+import os
+import sqlite3
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Header, Request
+from fastapi.responses import Response, StreamingResponse
+from starlette.background import BackgroundTask
 from pathlib import Path
+from typing import List, Optional
 
-from models import InsuranceDataResponse, ErrorResponse
+from models import InsuranceDataResponse, ErrorResponse, BatchExtractionResponse, JobStatusResponse
 from mistral_parser import MistralDocumentParser
 from openai_extractor import OpenAIExtractor
+from cache import ResultCache, build_cache_backend
+from pipeline import ExtractionPipeline
+from relevance import PageRanker
+from rules import RuleExtractor
+from http_transport import http_clients_from_settings
+from local_extractor import LocalTextExtractor
+from metrics import extension_label, observe_stage, render as render_metrics
+from rate_limit import rate_limiters_from_settings
+from resilience import CircuitOpenError, caller_from_settings
+from tracing import configure_tracing, current_context, span
+from upload import BodySizeLimitMiddleware, spool_upload
+from batch import collect_batch_documents, run_batch, stop_batch
+from streaming import negotiate_media_type, stream_extraction
+from jobs import JobQueue, JobStore, job_payload
 from config import settings
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start and stop the background job workers, then close provider connections"""
+    if jobQueue is not None and settings.job_workers > 0:
+        await jobQueue.start()
+    yield
+    if jobQueue is not None:
+        await jobQueue.stop()
+    await httpClients.aclose()
+
+
 app = FastAPI(
     title="Insurance Document Data Extraction API",
     description="Extract structured data from insurance policy documents using Mistral AI + OpenAI",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan
 )
 
+# Reject oversized uploads before the multipart body is fully read
+# (allowing some headroom for multipart boundaries and headers)
+app.add_middleware(
+    BodySizeLimitMiddleware,
+    max_body_size=MistralDocumentParser.MAX_FILE_SIZE + 64 * 1024,
+    paths=["/extract", "/jobs"]
+)
+app.add_middleware(
+    BodySizeLimitMiddleware,
+    max_body_size=settings.batch_max_upload_bytes,
+    paths=["/extract/batch"]
+)
+
+# Initialize OCR cache
+try:
+    ocr_cache_backend = build_cache_backend(
+        settings.ocr_cache_backend,
+        ttl_seconds=settings.ocr_cache_ttl_seconds,
+        max_entries=settings.cache_max_entries,
+        sqlite_path=settings.ocr_cache_sqlite_path,
+        redis_url=settings.cache_redis_url
+    )
+    ocrCache = ResultCache(ocr_cache_backend, namespace="ocr") if ocr_cache_backend is not None else None
+except ValueError as e:
+    print(f"Warning: OCR cache - {str(e)}")
+    ocrCache = None
+
+# Initialize tracing
+try:
+    configure_tracing(
+        settings.tracing_exporter,
+        sample_ratio=settings.tracing_sample_ratio,
+        service_name=settings.tracing_service_name,
+        otlp_endpoint=settings.tracing_otlp_endpoint
+    )
+except ValueError as e:
+    print(f"Warning: Tracing - {str(e)}")
+
+# Initialize connection pools shared by the provider clients
+httpClients = http_clients_from_settings(settings)
+
+# Initialize client-side provider quotas
+rateLimiters = rate_limiters_from_settings(settings)
+
 # Initialize Mistral and OpenAI clients
 try:
-    mistralClient = MistralDocumentParser(api_key=settings.mistral_api_key)
+    mistralClient = MistralDocumentParser(
+        api_key=settings.mistral_api_key,
+        ocr_cache=ocrCache,
+        include_images=settings.mistral_include_images,
+        inline_max_bytes=settings.mistral_inline_max_bytes,
+        local_extractor=LocalTextExtractor(settings.local_min_page_chars) if settings.local_extraction_enabled else None,
+        shard_pages=settings.ocr_shard_pages,
+        shard_concurrency=settings.ocr_shard_concurrency,
+        resilience=caller_from_settings("Mistral", settings),
+        server_url=settings.mistral_server_url,
+        rate_limiter=rateLimiters["mistral"],
+        http_clients=httpClients
+    )
 except ValueError as e:
     print(f"Warning: Mistral - {str(e)}")
     mistralClient = None
 
 try:
-    openaiClient = OpenAIExtractor(api_key=settings.openai_api_key)
+    openaiClient = OpenAIExtractor(
+        api_key=settings.openai_api_key,
+        resilience=caller_from_settings("OpenAI", settings),
+        base_url=settings.openai_base_url,
+        rate_limiter=rateLimiters["openai"],
+        http_clients=httpClients
+    )
 except ValueError as e:
     print(f"Warning: OpenAI - {str(e)}")
     openaiClient = None
 
+# Initialize result cache
+try:
+    cache_backend = build_cache_backend(
+        settings.cache_backend,
+        ttl_seconds=settings.cache_ttl_seconds,
+        max_entries=settings.cache_max_entries,
+        sqlite_path=settings.cache_sqlite_path,
+        redis_url=settings.cache_redis_url
+    )
+    resultCache = ResultCache(cache_backend) if cache_backend is not None else None
+except ValueError as e:
+    print(f"Warning: Cache - {str(e)}")
+    resultCache = None
+
+pipeline = ExtractionPipeline(
+    mistralClient,
+    openaiClient,
+    cache=resultCache,
+    max_concurrency=settings.max_concurrent_extractions,
+    extraction_mode=settings.extraction_mode,
+    chunk_max_chars=settings.chunk_max_chars,
+    chunk_concurrency=settings.chunk_concurrency,
+    page_ranker=PageRanker.from_prompt(OpenAIExtractor.SYSTEM_PROMPT) if settings.page_pruning_enabled else None,
+    page_token_budget=settings.page_token_budget,
+    page_neighbours=settings.page_neighbours,
+    rule_extractor=RuleExtractor() if settings.rule_extraction_enabled else None,
+    llm_streaming=settings.llm_streaming_enabled,
+    degraded_mode=settings.degraded_mode_enabled
+)
+
+# Initialize background job queue
+try:
+    os.makedirs(settings.job_storage_dir, exist_ok=True)
+    jobStore = JobStore(
+        settings.job_db_path,
+        lease_seconds=settings.job_lease_seconds,
+        max_attempts=settings.job_max_attempts
+    )
+    jobQueue = JobQueue(
+        jobStore,
+        pipeline,
+        workers=settings.job_workers,
+        poll_interval=settings.job_poll_interval_seconds,
+        webhook_allow_private=settings.job_webhook_allow_private,
+        shutdown_seconds=settings.job_shutdown_seconds
+    )
+except (OSError, sqlite3.Error) as e:
+    print(f"Warning: Jobs - {str(e)}")
+    jobStore = None
+    jobQueue = None
+
+
+def ensure_services_configured():
+    """Raise a 500 if the Mistral or OpenAI client is not initialized"""
+    if mistralClient is None:
+        raise HTTPException(
+            status_code=500,
+            detail="Mistral API key not configured. Please set MISTRAL_API_KEY environment variable."
+        )
+
+    if openaiClient is None:
+        raise HTTPException(
+            status_code=500,
+            detail="OpenAI API key not configured. Please set OPENAI_API_KEY environment variable."
+        )
+
 
 @app.post(
     "/extract",
@@ -34,9 +196,14 @@ except ValueError as e:
         500: {"model": ErrorResponse}
     },
     summary="Extract insurance data from document",
-    description="Upload an insurance document (PDF, DOC, DOCX, TXT, PNG, JPG) and extract structured data"
+    description="Upload an insurance document (PDF, DOC, DOCX, TXT, PNG, JPG) and extract structured data. Set stream=true to receive progress events (server-sent events if the Accept header includes text/event-stream, NDJSON otherwise)"
 )
-async def extract_insurance_data(file: UploadFile = File(...)):
+async def extract_insurance_data(
+    request: Request,
+    file: UploadFile = File(...),
+    stream: bool = False,
+    accept: Optional[str] = Header(None)
+):
     """
     Extract insurance data from uploaded document
 
@@ -45,25 +212,158 @@ async def extract_insurance_data(file: UploadFile = File(...)):
     2. Extract structured data using OpenAI
 
     Args:
+        request: Incoming request, whose headers may continue a trace
         file: Insurance document file (PDF, DOC, DOCX, TXT, PNG, JPG, JPEG)
+        stream: Stream progress events instead of waiting for the result
+        accept: Accept header, used to choose SSE or NDJSON when streaming
 
     Returns:
-        Extracted insurance data in JSON format
+        Extracted insurance data in JSON format, or an event stream
     """
 
     # Check if services are initialized
-    if mistralClient is None:
+    ensure_services_configured()
+
+    # Validate file format
+    file_ext = Path(file.filename).suffix.lower()
+    if file_ext not in MistralDocumentParser.SUPPORTED_FORMATS:
         raise HTTPException(
-            status_code=500,
-            detail="Mistral API key not configured. Please set MISTRAL_API_KEY environment variable."
+            status_code=400,
+            detail=f"Unsupported file format: {file_ext}. Supported formats: {', '.join(MistralDocumentParser.SUPPORTED_FORMATS)}"
         )
 
-    if openaiClient is None:
-        raise HTTPException(
-            status_code=500,
-            detail="OpenAI API key not configured. Please set OPENAI_API_KEY environment variable."
+    # Continue the caller's trace if the request carries a traceparent header
+    with span("POST /extract", headers=request.headers, kind="server", **{"document.extension": extension_label(file.filename)}):
+        try:
+            # Spool the upload to disk in chunks, rejecting oversized files early
+            with observe_stage("upload_read", "none", extension_label(file.filename)), span("upload.read"):
+                upload = await spool_upload(file, MistralDocumentParser.MAX_FILE_SIZE, settings.upload_spool_dir)
+
+            if stream:
+                # The stream owns the spooled file from here on
+                media_type = negotiate_media_type(accept)
+                return StreamingResponse(
+                    stream_extraction(pipeline, upload, media_type, trace_parent=current_context()),
+                    media_type=media_type,
+                    headers={"Cache-Control": "no-cache"},
+                    background=BackgroundTask(upload.close)
+                )
+
+            try:
+                # Parse with Mistral AI and extract with OpenAI (or serve from cache)
+                result = await pipeline.run(upload.path, upload.filename, upload.sha256)
+            finally:
+                upload.close()
+
+            # Serialise here rather than via response_model, so the time is measured
+            # and the result is validated once instead of twice
+            with observe_stage("response_serialization", OpenAIExtractor.MODEL, extension_label(upload.filename)), span("response.serialize"):
+                body = InsuranceDataResponse(**result).model_dump_json()
+            return Response(content=body, media_type="application/json")
+
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except CircuitOpenError as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(math.ceil(e.retry_in))})
+        except RuntimeError as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
+
+
+@app.post(
+    "/extract/batch",
+    response_model=BatchExtractionResponse,
+    responses={
+        400: {"model": ErrorResponse},
+        500: {"model": ErrorResponse}
+    },
+    summary="Extract insurance data from many documents",
+    description="Upload several insurance documents and/or zip archives of documents and extract structured data from each. Set stream=true to receive NDJSON results as each document completes."
+)
+async def extract_insurance_data_batch(
+    files: List[UploadFile] = File(...),
+    stream: bool = False
+):
+    """
+    Extract insurance data from a batch of uploaded documents
+
+    Documents are processed concurrently; a failure in one document is
+    reported in its own result and does not fail the batch.
+
+    Args:
+        files: Insurance documents and/or zip archives of documents
+        stream: Stream per-document results as NDJSON in completion order
+
+    Returns:
+        Per-document results in upload order, or an NDJSON stream
+    """
+    ensure_services_configured()
+
+    try:
+        documents = await collect_batch_documents(
+            files,
+            max_documents=settings.batch_max_documents,
+            max_archive_size=settings.batch_max_upload_bytes,
+            max_unpacked_bytes=settings.batch_max_unpacked_bytes,
+            spool_dir=settings.upload_spool_dir
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    results = run_batch(pipeline, documents, settings.batch_concurrency)
+
+    if stream:
+        async def ndjson():
+            async for item in results:
+                yield item.model_dump_json() + "\n"
+
+        # Runs even if the client disconnects before the stream starts
+        return StreamingResponse(
+            ndjson(),
+            media_type="application/x-ndjson",
+            background=BackgroundTask(stop_batch, results, documents)
         )
 
+    try:
+        items = sorted([item async for item in results], key=lambda item: item.index)
+    finally:
+        await stop_batch(results, documents)
+    failed = sum(1 for item in items if item.error is not None)
+
+    return BatchExtractionResponse(results=items, succeeded=len(items) - failed, failed=failed)
+
+
+@app.post(
+    "/jobs",
+    response_model=JobStatusResponse,
+    status_code=202,
+    responses={
+        400: {"model": ErrorResponse},
+        500: {"model": ErrorResponse}
+    },
+    summary="Submit an asynchronous extraction job",
+    description="Upload an insurance document and return a job id immediately. Poll GET /jobs/{job_id} for the result, or pass webhook_url to have the finished job POSTed to you."
+)
+async def create_extraction_job(
+    file: UploadFile = File(...),
+    webhook_url: Optional[str] = Form(None)
+):
+    """
+    Queue a document for background extraction
+
+    Args:
+        file: Insurance document file (PDF, DOC, DOCX, TXT, PNG, JPG, JPEG)
+        webhook_url: Optional public http(s) URL that receives the finished job
+
+    Returns:
+        The queued job
+    """
+    ensure_services_configured()
+
+    if jobQueue is None:
+        raise HTTPException(status_code=500, detail="Job queue is not available")
+
     # Validate file format
     file_ext = Path(file.filename).suffix.lower()
     if file_ext not in MistralDocumentParser.SUPPORTED_FORMATS:
@@ -72,31 +372,45 @@ async def extract_insurance_data(file: UploadFile = File(...)):
             detail=f"Unsupported file format: {file_ext}. Supported formats: {', '.join(MistralDocumentParser.SUPPORTED_FORMATS)}"
         )
 
+    if webhook_url:
+        try:
+            await jobQueue.check_webhook(webhook_url)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
     try:
-        # Read file content
-        file_content = await file.read()
+        # Spool into job storage so the file outlives this request
+        upload = await spool_upload(file, MistralDocumentParser.MAX_FILE_SIZE, settings.job_storage_dir)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        # Validate file size
-        if len(file_content) > MistralDocumentParser.MAX_FILE_SIZE:
-            raise HTTPException(
-                status_code=400,
-                detail=f"File size exceeds maximum limit of {MistralDocumentParser.MAX_FILE_SIZE // (1024*1024)}MB"
-            )
+    return job_payload(jobQueue.submit(upload, webhook_url or None))
 
-        # Step 1: Parse document with Mistral AI to extract text
-        document_text = mistralClient.parse_document(file_content, file.filename)
 
-        # Step 2: Extract structured data using OpenAI
-        result = openaiClient.extract_insurance_data(document_text)
+@app.get(
+    "/jobs/{job_id}",
+    response_model=JobStatusResponse,
+    responses={
+        404: {"model": ErrorResponse}
+    },
+    summary="Get extraction job status"
+)
+async def get_extraction_job(job_id: str):
+    """
+    Return the status of a job, and its result once finished
 
-        return InsuranceDataResponse(**result)
+    Args:
+        job_id: Identifier returned by POST /jobs
 
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
-    except RuntimeError as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
+    Returns:
+        Job status, result and error
+    """
+
+    job = jobStore.get(job_id) if jobStore is not None else None
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+
+    return job_payload(job)
 
 
 @app.get("/", summary="Health check")
@@ -109,6 +423,13 @@ async def root():
     }
 
 
+@app.get("/metrics", summary="Prometheus metrics", include_in_schema=False)
+async def metrics():
+    """Stage latency histograms and pipeline counters in the Prometheus text format"""
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
+
+
 @app.get("/health", summary="Health check")
 async def health_check():
     """Detailed health check"""
@@ -117,9 +438,38 @@ async def health_check():
 
     all_configured = mistral_configured and openai_configured
 
+    breakers = {
+        name: client.resilience.breaker.report()
+        if client is not None and client.resilience.breaker is not None else None
+        for name, client in (("mistral", mistralClient), ("openai", openaiClient))
+    }
+    circuits_closed = all(breaker is None or breaker["state"] == "closed" for breaker in breakers.values())
+
     return {
-        "status": "healthy" if all_configured else "degraded",
+        "status": "healthy" if all_configured and circuits_closed else "degraded",
         "mistral_configured": mistral_configured,
         "openai_configured": openai_configured,
+        "cache": resultCache.stats() if resultCache is not None else None,
+        "ocr_cache": ocrCache.stats() if ocrCache is not None else None,
+        "jobs": jobStore.counts() if jobStore is not None else None,
+        "page_pruning": pipeline.pruning_report() if pipeline.page_ranker is not None else None,
+        "rule_extraction": dict(pipeline.rule_stats) if pipeline.rule_extractor is not None else None,
+        "retries": {
+            "mistral": mistralClient.resilience.report() if mistralClient is not None else None,
+            "openai": openaiClient.resilience.report() if openaiClient is not None else None
+        },
+        "circuit_breakers": breakers,
+        "prompt_cache": openaiClient.prompt_cache_report() if openaiClient is not None else None,
+        "structured_output": dict(openaiClient.validation_stats) if openaiClient is not None else None,
+        "degraded_responses": dict(pipeline.degraded_stats) if pipeline.degraded_mode else None,
+        "http_connections": httpClients.report(),
+        "rate_limits": {
+            name: limiter.report() if limiter is not None else None
+            for name, limiter in rateLimiters.items()
+        },
+        "local_extraction": (
+            dict(mistralClient.page_stats)
+            if mistralClient is not None and mistralClient.local_extractor is not None else None
+        ),
         "supported_formats": list(MistralDocumentParser.SUPPORTED_FORMATS)
     }
@@ -0,0 +1,124 @@
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Iterator, Optional, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+
+# Extensions used as label values; anything else is reported as "other" so
+# arbitrary upload names cannot blow up label cardinality
+KNOWN_EXTENSIONS = {'pdf', 'doc', 'docx', 'txt', 'png', 'jpg', 'jpeg', 'zip'}
+
+# Extension of the document being extracted, for code that only sees its text
+document_extension: ContextVar[str] = ContextVar("document_extension", default="unknown")
+
+STAGE_SECONDS = Histogram(
+    "beshak_stage_duration_seconds",
+    "Time spent in each extraction stage",
+    ["stage", "extension", "model"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+)
+OCR_PAGES = Counter(
+    "beshak_ocr_pages",
+    "Pages sent to Mistral OCR",
+    ["extension", "model"]
+)
+LLM_TOKENS = Counter(
+    "beshak_llm_tokens",
+    "LLM tokens reported in response usage (cached is the part of input served from the prompt cache)",
+    ["direction", "extension", "model"]
+)
+PROMPT_CACHE_HIT_RATIO = Gauge(
+    "beshak_llm_prompt_cache_hit_ratio",
+    "Share of LLM input tokens served from the provider's prompt cache since startup",
+    ["model"],
+    # A ratio cannot be summed across worker processes; each reports its own
+    multiprocess_mode="liveall"
+)
+CACHE_HITS = Counter(
+    "beshak_cache_hits",
+    "Documents served from a cache instead of a provider call",
+    ["cache", "extension", "model"]
+)
+ERRORS = Counter(
+    "beshak_errors",
+    "Failed document extractions by exception type",
+    ["type", "extension", "model"]
+)
+IN_FLIGHT = Gauge(
+    "beshak_documents_in_flight",
+    "Documents currently being extracted",
+    ["extension", "model"],
+    multiprocess_mode="livesum"
+)
+
+
+def extension_label(filename: Optional[str]) -> str:
+    """Bounded label value for a file's extension"""
+    if not filename:
+        return "unknown"
+    extension = Path(filename).suffix.lower().lstrip('.')
+    return extension if extension in KNOWN_EXTENSIONS else "other"
+
+
+@contextmanager
+def observe_stage(stage: str, model: str, extension: Optional[str] = None) -> Iterator[None]:
+    """
+    Record how long the block takes in the stage histogram
+
+    Args:
+        stage: Stage name, e.g. "ocr_call" or "llm_call"
+        model: Model the stage runs against ("none" for local work)
+        extension: Extension label; defaults to the current document's
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(stage, extension or document_extension.get(), model).observe(time.perf_counter() - started)
+
+
+def observe_seconds(stage: str, model: str, seconds: float, extension: Optional[str] = None) -> None:
+    """Record an already measured duration in the stage histogram"""
+    STAGE_SECONDS.labels(stage, extension or document_extension.get(), model).observe(seconds)
+
+
+def cached_tokens(usage) -> int:
+    """Input tokens served from the prompt cache, from an OpenAI usage object"""
+    details = getattr(usage, 'prompt_tokens_details', None)
+    return getattr(details, 'cached_tokens', None) or 0
+
+
+def record_usage(usage, model: str, input_total: int, cached_total: int) -> None:
+    """
+    Count input, cached and output tokens from an OpenAI usage object
+
+    Args:
+        usage: Usage object of a completion
+        model: Model label
+        input_total: Input tokens counted so far, for the hit ratio
+        cached_total: Cached input tokens counted so far, for the hit ratio
+    """
+    extension = document_extension.get()
+    LLM_TOKENS.labels("input", extension, model).inc(usage.prompt_tokens or 0)
+    LLM_TOKENS.labels("cached", extension, model).inc(cached_tokens(usage))
+    LLM_TOKENS.labels("output", extension, model).inc(usage.completion_tokens or 0)
+    if input_total:
+        PROMPT_CACHE_HIT_RATIO.labels(model).set(cached_total / input_total)
+
+
+def render() -> Tuple[bytes, str]:
+    """
+    Current metrics in the Prometheus text format, with their content type
+
+    Under a multi-worker server (PROMETHEUS_MULTIPROC_DIR set), every
+    worker writes its values to that directory, and whichever worker
+    serves the scrape reports the sum over all of them.
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -1,5 +1,21 @@
+import asyncio
 import base64
+import hashlib
+import json
+import tempfile
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Union
 from mistralai import Mistral
+from mistralai.models import OCRResponse
+
+from cache import ResultCache
+from http_transport import SharedHttpClients
+from local_extractor import LocalTextExtractor
+from metrics import CACHE_HITS, OCR_PAGES, document_extension, extension_label, observe_stage
+from pdf_pages import pack_pages, page_count, pdf_support_available
+from rate_limit import RateLimiter
+from resilience import CircuitOpenError, ResilientCaller, latency_kind
+from tracing import set_attributes, span
 
 
 class MistralDocumentParser:
@@ -7,73 +23,685 @@ class MistralDocumentParser:
 
     SUPPORTED_FORMATS = {'.pdf', '.doc', '.docx', '.txt', '.png', '.jpg', '.jpeg'}
     MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB (Mistral OCR limit)
+    OCR_MODEL = "mistral-ocr-latest"
+    IMAGE_FORMATS = {'png', 'jpg', 'jpeg'}
+
+    def __init__(
+        self,
+        api_key: str,
+        ocr_cache: Optional[ResultCache] = None,
+        include_images: bool = False,
+        inline_max_bytes: int = 1024 * 1024,
+        local_extractor: Optional[LocalTextExtractor] = None,
+        shard_pages: int = 50,
+        shard_concurrency: int = 4,
+        resilience: Optional[ResilientCaller] = None,
+        server_url: Optional[str] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        http_clients: Optional[SharedHttpClients] = None
+    ):
+        """
+        Initialize Mistral client
 
-    def __init__(self, api_key: str):
-        """Initialize Mistral client"""
+        Args:
+            api_key: Mistral API key
+            ocr_cache: Optional cache of OCR pages keyed on file hash and
+                ocr_version
+            include_images: Request base64 page images from the OCR API.
+                Only markdown is used, so this is off by default.
+            inline_max_bytes: Files on disk up to this size are sent inline as a
+                data URL; larger files are streamed through the files API.
+            local_extractor: Optional extractor for text-layer PDF, DOCX and TXT
+                files; only pages it cannot read are sent to OCR.
+            shard_pages: PDFs with more pages to OCR than this are split into
+                page-range shards that are OCR'd concurrently (0 disables)
+            shard_concurrency: Maximum shards in flight per document
+            resilience: Retry and hedging policy for OCR calls; each shard is
+                retried on its own, so one failure doesn't restart the document
+            server_url: Alternative Mistral API URL, e.g. a local stub server
+            rate_limiter: Optional limiter for the requests and pages per
+                minute quotas; each OCR call waits for its page count
+            http_clients: Optional connection pools shared with the OpenAI
+                client; the SDK otherwise creates its own, without timeouts
+        """
         if not api_key:
             raise ValueError("Mistral API key not provided")
 
         self.api_key = api_key
-        self.client = Mistral(api_key=self.api_key)
+        # Retries are handled by self.resilience, not the SDK
+        if http_clients is not None:
+            # The SDK passes an explicit timeout with every request, which
+            # would override the client's; use the read timeout for all of it
+            self.client = Mistral(
+                api_key=self.api_key,
+                server_url=server_url,
+                client=http_clients.client,
+                async_client=http_clients.async_client,
+                timeout_ms=int(http_clients.timeout.read * 1000)
+            )
+        else:
+            self.client = Mistral(api_key=self.api_key, server_url=server_url)
+        self.ocr_cache = ocr_cache
+        self.include_images = include_images
+        self.inline_max_bytes = inline_max_bytes
+        self.local_extractor = local_extractor
+        self.shard_pages = shard_pages
+        self.shard_concurrency = max(1, shard_concurrency)
+        self.resilience = resilience or ResilientCaller("Mistral")
+        self.rate_limiter = rate_limiter
+        self.page_stats = {"local": 0, "ocr": 0}
 
-    def parse_document(self, file_content: bytes, filename: str) -> str:
+    @property
+    def ocr_version(self) -> str:
+        """
+        Identifier of the OCR model and of the local extraction settings that
+        decide which pages are sent to it; pages cached under another version
+        are not served
+        """
+        options = {
+            "local_min_page_chars": self.local_extractor.min_page_chars if self.local_extractor is not None else None
+        }
+        options_hash = hashlib.sha256(json.dumps(options, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+        return f"{self.OCR_MODEL}:{options_hash}"
+
+    def parse_document(self, file_content: Union[bytes, Path], filename: str, document_hash: Optional[str] = None) -> str:
         """
         Parse document using Mistral AI OCR and extract text content
 
         Args:
-            file_content: Binary content of the file
+            file_content: Binary content of the file, or path to it on disk
             filename: Name of the file
+            document_hash: SHA-256 of file_content, if already computed
 
         Returns:
             Extracted text content from the document
         """
-        try:
-            # Encode file as base64
-            base64_content = base64.b64encode(file_content).decode('utf-8')
+        # Join all pages with double newlines
+        return '\n\n'.join(self.parse_pages(file_content, filename, document_hash))
+
+    async def parse_document_async(self, file_content: Union[bytes, Path], filename: str, document_hash: Optional[str] = None) -> str:
+        """
+        Parse document using Mistral AI OCR without blocking the event loop
+
+        Args:
+            file_content: Binary content of the file, or path to it on disk
+            filename: Name of the file
+            document_hash: SHA-256 of file_content, if already computed
+
+        Returns:
+            Extracted text content from the document
+        """
+        pages = await self.parse_pages_async(file_content, filename, document_hash)
+        return '\n\n'.join(pages)
+
+    def parse_pages(self, file_content: Union[bytes, Path], filename: str, document_hash: Optional[str] = None) -> List[str]:
+        """
+        Parse document, reading text locally where possible and using Mistral
+        AI OCR for the rest, consulting the OCR cache first
+
+        Args:
+            file_content: Binary content of the file, or path to it on disk
+            filename: Name of the file
+            document_hash: SHA-256 of file_content, if already computed
+
+        Returns:
+            Markdown content of each page that contains text
+        """
+        with span("mistral.parse_document", **self._span_attributes(file_content, filename)):
+            cache_key = self._cache_key(file_content, document_hash)
+            cached = self._get_cached(cache_key)
+            if cached is not None:
+                return cached
+
+            local_pages = self._extract_local(file_content, filename)
+            ocr_page_numbers = self._pages_to_ocr(local_pages)
+
+            try:
+                if ocr_page_numbers == []:
+                    # Every page has a text layer, so OCR is not needed at all
+                    pages = self._merge_pages(local_pages, [], [])
+                else:
+                    ocr_pages = self._run_ocr(file_content, filename, ocr_page_numbers)
+                    pages = self._merge_pages(local_pages, ocr_page_numbers, ocr_pages)
+            except CircuitOpenError:
+                raise
+            except Exception as e:
+                raise RuntimeError(f"Mistral OCR error: {str(e)}")
+
+            self._record_page_sources(local_pages, ocr_page_numbers, pages)
+
+            self._store_cached(cache_key, pages)
+            return pages
+
+    async def parse_pages_async(
+        self,
+        file_content: Union[bytes, Path],
+        filename: str,
+        document_hash: Optional[str] = None,
+        on_event: Optional[Callable[[str, Dict[str, Any]], None]] = None
+    ) -> List[str]:
+        """
+        Async variant of parse_pages
+
+        Args:
+            file_content: Binary content of the file, or path to it on disk
+            filename: Name of the file
+            document_hash: SHA-256 of file_content, if already computed
+            on_event: Optional callback receiving "ocr_progress" events with
+                pages_done and pages_total (None when the count is unknown)
+
+        Returns:
+            Markdown content of each page that contains text
+        """
+        with span("mistral.parse_document", **self._span_attributes(file_content, filename)):
+            cache_key = self._cache_key(file_content, document_hash)
+            cached = self._get_cached(cache_key)
+            if cached is not None:
+                return cached
 
-            # Determine file type
-            file_ext = filename.lower().split('.')[-1]
-
-            # Map file extensions to MIME types
-            mime_types = {
-                'pdf': 'application/pdf',
-                'png': 'image/png',
-                'jpg': 'image/jpeg',
-                'jpeg': 'image/jpeg',
-                'txt': 'text/plain',
-                'doc': 'application/msword',
-                'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+            # PDF text extraction is CPU-bound, so keep it off the event loop
+            local_pages = await asyncio.to_thread(self._extract_local, file_content, filename)
+            ocr_page_numbers = self._pages_to_ocr(local_pages)
+
+            pages_total = len(local_pages) if local_pages is not None else None
+            pages_done = 0
+            if local_pages is not None:
+                pages_done = sum(1 for page in local_pages if page is not None)
+
+            def report_progress(count: int) -> None:
+                nonlocal pages_done
+                pages_done += count
+                if on_event is not None:
+                    on_event("ocr_progress", {"pages_done": pages_done, "pages_total": pages_total})
+
+            if local_pages is not None:
+                report_progress(0)
+
+            try:
+                if ocr_page_numbers == []:
+                    pages = self._merge_pages(local_pages, [], [])
+                else:
+                    ocr_pages = await self._run_ocr_async(file_content, filename, ocr_page_numbers, report_progress)
+                    pages = self._merge_pages(local_pages, ocr_page_numbers, ocr_pages)
+            except CircuitOpenError:
+                raise
+            except Exception as e:
+                raise RuntimeError(f"Mistral OCR error: {str(e)}")
+
+            self._record_page_sources(local_pages, ocr_page_numbers, pages)
+
+            self._store_cached(cache_key, pages)
+            return pages
+
+    def parse_local_pages(self, file_content: Union[bytes, Path], filename: str) -> List[str]:
+        """
+        Text of the pages that can be read without OCR, for use while
+        Mistral is unavailable; scanned pages are left out
+
+        Args:
+            file_content: Binary content of the file, or path to it on disk
+            filename: Name of the file
+
+        Returns:
+            Text of each readable page (empty if nothing is readable)
+        """
+        return [page for page in self._extract_local(file_content, filename) or [] if page]
+
+    def batch_request(self, custom_id: str, file_content: Union[bytes, Path], filename: str) -> Dict[str, Any]:
+        """
+        Build one line of a Mistral batch OCR input file
+
+        The document is embedded as a data URL; the OCR model is set on the
+        batch job rather than per line.
+
+        Args:
+            custom_id: Identifier the result line is matched back on
+            file_content: Binary content of the file, or path to it on disk
+            filename: Name of the file
+        """
+        return {
+            "custom_id": custom_id,
+            "body": {
+                "document": self._build_document(self._read_bytes(file_content), filename),
+                "include_image_base64": self.include_images
             }
+        }
+
+    def store_batch_response(self, document_hash: str, filename: str, body: Dict[str, Any]) -> List[str]:
+        """
+        Read the pages of a batch OCR output line and cache them like a synchronous call's
+
+        Args:
+            document_hash: Hash of the document the line belongs to
+            filename: Name of the file, for the page metrics
+            body: OCR response body of the output line
+
+        Returns:
+            Markdown content of each page that contains text
+        """
+        ocr_response = OCRResponse.model_validate(body)
+        self._count_ocr_pages(ocr_response, filename)
+        pages = self._merge_pages(None, None, self._page_markdown(ocr_response))
+        # Every page was OCR'd, which serves in place of whatever the local
+        # settings would have read, so the pages go under this parser's version
+        self._store_cached(self._cache_key(None, document_hash), pages)
+        return pages
+
+    def _run_ocr(self, file_content: Union[bytes, Path], filename: str, page_numbers: Optional[List[int]] = None) -> List[str]:
+        """
+        OCR a document, one page-range shard at a time if it is long
+
+        Args:
+            file_content: Binary content of the file, or path to it on disk
+            filename: Name of the file
+            page_numbers: Zero-based pages to OCR, or None for all pages
+
+        Returns:
+            Markdown of each OCR'd page, in page order
+        """
+        shards = self._plan_shards(file_content, filename, page_numbers)
+        if shards is None:
+            return self._ocr_pages(file_content, filename, page_numbers)
+
+        return [
+            page
+            for shard in shards
+            for page in self._ocr_pages(file_content, filename, shard)
+        ]
+
+    async def _run_ocr_async(
+        self,
+        file_content: Union[bytes, Path],
+        filename: str,
+        page_numbers: Optional[List[int]] = None,
+        on_pages_done: Optional[Callable[[int], None]] = None
+    ) -> List[str]:
+        """
+        OCR a document, splitting long PDFs into page-range shards that are
+        OCR'd concurrently and reassembled in page order
 
-            mime_type = mime_types.get(file_ext, 'application/octet-stream')
+        Args:
+            file_content: Binary content of the file, or path to it on disk
+            filename: Name of the file
+            page_numbers: Zero-based pages to OCR, or None for all pages
+            on_pages_done: Optional callback with the number of pages each
+                completed OCR call covered
+
+        Returns:
+            Markdown of each OCR'd page, in page order
+        """
+        shards = await asyncio.to_thread(self._plan_shards, file_content, filename, page_numbers)
+        if shards is None:
+            ocr_pages = await self._ocr_pages_async(file_content, filename, page_numbers)
+            if on_pages_done is not None:
+                on_pages_done(len(ocr_pages))
+            return ocr_pages
+
+        semaphore = asyncio.Semaphore(self.shard_concurrency)
+
+        async def run_shard(shard: List[int]) -> List[str]:
+            async with semaphore:
+                shard_pages = await self._ocr_pages_async(file_content, filename, shard)
+            if on_pages_done is not None:
+                on_pages_done(len(shard))
+            return shard_pages
+
+        tasks = [asyncio.create_task(run_shard(shard)) for shard in shards]
+        try:
+            results = await asyncio.gather(*tasks)
+        except BaseException:
+            # One shard ran out of retries; don't leave the others running
+            for task in tasks:
+                task.cancel()
+            raise
+
+        return [page for shard_pages in results for page in shard_pages]
+
+    def _plan_shards(self, file_content: Union[bytes, Path], filename: str, page_numbers: Optional[List[int]]) -> Optional[List[List[int]]]:
+        """Split the pages to OCR into shards, or None to OCR them in one call"""
+        if self.shard_pages <= 0 or Path(filename).suffix.lower() != '.pdf' or not pdf_support_available():
+            return None
+
+        if page_numbers is None:
+            try:
+                page_numbers = list(range(page_count(file_content)))
+            except Exception:
+                # Unreadable by pypdf; let Mistral take the whole file
+                return None
+
+        if len(page_numbers) <= self.shard_pages:
+            return None
+
+        return [
+            page_numbers[start:start + self.shard_pages]
+            for start in range(0, len(page_numbers), self.shard_pages)
+        ]
+
+    def _ocr_pages(self, file_content: Union[bytes, Path], filename: str, page_numbers: Optional[List[int]] = None) -> List[str]:
+        """
+        OCR a document, or just some of its pages
+
+        Selected PDF pages are packed into a smaller PDF first, so only
+        those pages are uploaded; otherwise the whole file is sent with the
+        page list. Packing happens once, before the resilience layer, and
+        rate limit capacity is waited for before each attempt; neither is
+        timed as provider latency by the circuit breaker or hedging.
+
+        Args:
+            file_content: Binary content of the file, or path to it on disk
+            filename: Name of the file
+            page_numbers: Zero-based pages to OCR, or None for all pages
 
-            # Create data URL for the document
-            data_url = f"data:{mime_type};base64,{base64_content}"
+        Returns:
+            Markdown of each OCR'd page, in page order
+        """
+        cost = self._request_cost(file_content, filename, page_numbers)
+        kind = latency_kind("ocr", cost["pages"])
+        acquire = None
+        if self.rate_limiter is not None:
+            acquire = lambda: self.rate_limiter.acquire_sync(cost)
+
+        packed = self._pack_pages(file_content, filename, page_numbers)
+        try:
+            if packed is not None:
+                ocr_response = self.resilience.call_sync(lambda: self._process_ocr(packed, filename), acquire, kind)
+            else:
+                ocr_response = self.resilience.call_sync(
+                    lambda: self._process_ocr(file_content, filename, page_numbers), acquire, kind
+                )
+        finally:
+            self._discard_packed(packed)
+
+        return self._page_markdown(ocr_response)
+
+    async def _ocr_pages_async(self, file_content: Union[bytes, Path], filename: str, page_numbers: Optional[List[int]] = None) -> List[str]:
+        """Async variant of _ocr_pages"""
+        cost = await asyncio.to_thread(self._request_cost, file_content, filename, page_numbers)
+        kind = latency_kind("ocr", cost["pages"])
+        acquire = None
+        if self.rate_limiter is not None:
+            acquire = lambda: self.rate_limiter.acquire(cost)
+
+        packed = await asyncio.to_thread(self._pack_pages, file_content, filename, page_numbers)
+        try:
+            if packed is not None:
+                ocr_response = await self.resilience.call(
+                    lambda: self._process_ocr_async(packed, filename), acquire, kind
+                )
+            else:
+                ocr_response = await self.resilience.call(
+                    lambda: self._process_ocr_async(file_content, filename, page_numbers), acquire, kind
+                )
+        finally:
+            self._discard_packed(packed)
+
+        return self._page_markdown(ocr_response)
+
+    def _process_ocr(self, file_content: Union[bytes, Path], filename: str, page_numbers: Optional[List[int]] = None):
+        """
+        Call the Mistral OCR API for a document
+
+        Args:
+            file_content: Binary content of the file, or path to it on disk
+            filename: Name of the file
+            page_numbers: Zero-based pages to OCR, or None for all pages
+
+        Returns:
+            The OCR API response
+        """
+        uploaded_file_id = None
+        try:
+            if self._should_upload(file_content):
+                # Stream the file to Mistral instead of building a data URL
+                with open(file_content, 'rb') as f:
+                    uploaded = self.client.files.upload(
+                        file={"file_name": filename, "content": f},
+                        purpose="ocr"
+                    )
+                uploaded_file_id = uploaded.id
+                signed_url = self.client.files.get_signed_url(file_id=uploaded_file_id)
+                document = self._build_url_document(signed_url.url, filename)
+            else:
+                document = self._build_document(self._read_bytes(file_content), filename)
 
             # Use Mistral's OCR API with correct document format
-            ocr_response = self.client.ocr.process(
-                model="mistral-ocr-latest",
-                document={
-                    "type": "document_url",
-                    "document_url": data_url
-                },
-                include_image_base64=True
-            )
+            with observe_stage("ocr_call", self.OCR_MODEL, extension_label(filename)):
+                ocr_response = self.client.ocr.process(
+                    model=self.OCR_MODEL,
+                    document=document,
+                    pages=page_numbers,
+                    include_image_base64=self.include_images
+                )
+            self._count_ocr_pages(ocr_response, filename)
+            return ocr_response
+        finally:
+            if uploaded_file_id is not None:
+                try:
+                    self.client.files.delete(file_id=uploaded_file_id)
+                except Exception as e:
+                    print(f"Warning: Mistral - failed to delete uploaded file: {str(e)}")
 
-            # Extract text from OCR response pages
-            extracted_text = []
+    async def _process_ocr_async(self, file_content: Union[bytes, Path], filename: str, page_numbers: Optional[List[int]] = None):
+        """Async variant of _process_ocr"""
+        uploaded_file_id = None
+        try:
+            if self._should_upload(file_content):
+                with open(file_content, 'rb') as f:
+                    uploaded = await self.client.files.upload_async(
+                        file={"file_name": filename, "content": f},
+                        purpose="ocr"
+                    )
+                uploaded_file_id = uploaded.id
+                signed_url = await self.client.files.get_signed_url_async(file_id=uploaded_file_id)
+                document = self._build_url_document(signed_url.url, filename)
+            else:
+                document = self._build_document(self._read_bytes(file_content), filename)
 
-            # The response contains pages with markdown content
-            if hasattr(ocr_response, 'pages') and ocr_response.pages:
-                for page in ocr_response.pages:
-                    if hasattr(page, 'markdown') and page.markdown:
-                        extracted_text.append(page.markdown)
+            with observe_stage("ocr_call", self.OCR_MODEL, extension_label(filename)):
+                ocr_response = await self.client.ocr.process_async(
+                    model=self.OCR_MODEL,
+                    document=document,
+                    pages=page_numbers,
+                    include_image_base64=self.include_images
+                )
+            self._count_ocr_pages(ocr_response, filename)
+            return ocr_response
+        finally:
+            if uploaded_file_id is not None:
+                try:
+                    await self.client.files.delete_async(file_id=uploaded_file_id)
+                except Exception as e:
+                    print(f"Warning: Mistral - failed to delete uploaded file: {str(e)}")
 
-            if not extracted_text:
-                raise ValueError("No text content found in OCR response")
+    def _count_ocr_pages(self, ocr_response, filename: str) -> None:
+        pages = len(getattr(ocr_response, 'pages', None) or [])
+        OCR_PAGES.labels(extension_label(filename), self.OCR_MODEL).inc(pages)
+        set_attributes(**{"ocr.pages": pages})
 
-            # Join all pages with double newlines
-            return '\n\n'.join(extracted_text)
+    @staticmethod
+    def _request_cost(file_content: Union[bytes, Path], filename: str, page_numbers: Optional[List[int]]) -> Dict[str, float]:
+        """Quota cost of an OCR call: one request and the pages it covers"""
+        pages = 1
+        if page_numbers is not None:
+            pages = len(page_numbers)
+        elif Path(filename).suffix.lower() == '.pdf' and pdf_support_available():
+            try:
+                pages = page_count(file_content)
+            except Exception:
+                pass  # Mistral will reject it anyway; count it as one page
+        return {"requests": 1, "pages": pages}
 
+    def _pack_pages(self, file_content: Union[bytes, Path], filename: str, page_numbers: Optional[List[int]]) -> Optional[Union[bytes, Path]]:
+        """Copy the PDF pages to OCR into a smaller PDF, or None to send the original"""
+        if page_numbers is None or Path(filename).suffix.lower() != '.pdf' or not pdf_support_available():
+            return None
+
+        try:
+            packed = pack_pages(file_content, page_numbers)
         except Exception as e:
-            raise RuntimeError(f"Mistral OCR error: {str(e)}")
+            print(f"Warning: Mistral - could not pack pages, sending whole document: {str(e)}")
+            return None
+
+        if len(packed) <= self.inline_max_bytes:
+            return packed
+
+        # Large packs go through the files API like any other large upload
+        directory = file_content.parent if isinstance(file_content, Path) else None
+        with tempfile.NamedTemporaryFile(suffix='.pdf', dir=directory, delete=False) as f:
+            f.write(packed)
+        return Path(f.name)
+
+    @staticmethod
+    def _discard_packed(packed: Optional[Union[bytes, Path]]) -> None:
+        """Remove a packed PDF written to disk by _pack_pages"""
+        if isinstance(packed, Path):
+            packed.unlink(missing_ok=True)
+
+    def _extract_local(self, file_content: Union[bytes, Path], filename: str) -> Optional[List[Optional[str]]]:
+        """Per-page text read without OCR, or None if the file must be OCR'd whole"""
+        if self.local_extractor is None or not self.local_extractor.supports(filename):
+            return None
+        return self.local_extractor.extract_pages(file_content, filename)
+
+    def _record_page_sources(self, local_pages: Optional[List[Optional[str]]], ocr_page_numbers: Optional[List[int]], pages: List[str]) -> None:
+        """Count how many pages were read locally and how many were OCR'd"""
+        if local_pages is None or ocr_page_numbers is None:
+            local, ocr = 0, len(pages)
+        else:
+            local, ocr = len(local_pages) - len(ocr_page_numbers), len(ocr_page_numbers)
+
+        self.page_stats["local"] += local
+        self.page_stats["ocr"] += ocr
+        set_attributes(**{"document.pages": len(pages), "document.pages_local": local, "document.pages_ocr": ocr})
+
+    def _span_attributes(self, file_content: Union[bytes, Path], filename: str) -> Dict[str, Any]:
+        size = len(file_content) if isinstance(file_content, bytes) else Path(file_content).stat().st_size
+        return {"document.bytes": size, "document.extension": extension_label(filename), "ocr.model": self.OCR_MODEL}
+
+    @staticmethod
+    def _pages_to_ocr(local_pages: Optional[List[Optional[str]]]) -> Optional[List[int]]:
+        """Zero-based pages that still need OCR, or None for the whole document"""
+        if local_pages is None:
+            return None
+
+        page_numbers = [number for number, page in enumerate(local_pages) if page is None]
+        if len(page_numbers) == len(local_pages):
+            # Nothing was readable, so skip the page list entirely
+            return None
+        return page_numbers
+
+    def _should_upload(self, file_content: Union[bytes, Path]) -> bool:
+        """Whether a document should go through the files API rather than inline"""
+        return isinstance(file_content, Path) and file_content.stat().st_size > self.inline_max_bytes
+
+    @staticmethod
+    def _read_bytes(file_content: Union[bytes, Path]) -> bytes:
+        """Return document bytes, reading small spooled files from disk"""
+        if isinstance(file_content, Path):
+            return file_content.read_bytes()
+        return file_content
+
+    def _cache_key(self, file_content: Union[bytes, Path], document_hash: Optional[str]) -> Optional[str]:
+        """OCR cache key for a document, or None when caching is disabled"""
+        if self.ocr_cache is None:
+            return None
+
+        document_hash = document_hash or ResultCache.document_hash(file_content)
+        return self.ocr_cache.make_key(document_hash, self.ocr_version)
+
+    def _get_cached(self, cache_key: Optional[str]) -> Optional[List[str]]:
+        """Return cached OCR pages for cache_key, if any"""
+        if cache_key is None:
+            return None
+
+        with span("ocr_cache.lookup") as lookup:
+            entry = self.ocr_cache.get(cache_key)
+            if lookup is not None:
+                lookup.set_attribute("cache.hit", entry is not None)
+        if entry is None:
+            return None
+
+        CACHE_HITS.labels("ocr", document_extension.get(), self.OCR_MODEL).inc()
+        return entry["pages"]
+
+    def _store_cached(self, cache_key: Optional[str], pages: List[str]) -> None:
+        """Store OCR pages under cache_key"""
+        if cache_key is not None:
+            self.ocr_cache.set(cache_key, {"pages": pages})
+
+    @staticmethod
+    def _build_document(file_content: bytes, filename: str) -> dict:
+        """Build the OCR document payload as a base64 data URL"""
+        # Encode file as base64
+        with observe_stage("base64_encode", "none", extension_label(filename)):
+            base64_content = base64.b64encode(file_content).decode('utf-8')
+
+        # Determine file type
+        file_ext = filename.lower().split('.')[-1]
+
+        # Map file extensions to MIME types
+        mime_types = {
+            'pdf': 'application/pdf',
+            'png': 'image/png',
+            'jpg': 'image/jpeg',
+            'jpeg': 'image/jpeg',
+            'txt': 'text/plain',
+            'doc': 'application/msword',
+            'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+        }
+
+        mime_type = mime_types.get(file_ext, 'application/octet-stream')
+
+        # Create data URL for the document
+        data_url = f"data:{mime_type};base64,{base64_content}"
+
+        return {
+            "type": "document_url",
+            "document_url": data_url
+        }
+
+    @classmethod
+    def _build_url_document(cls, url: str, filename: str) -> dict:
+        """Build the OCR document payload for a file reachable at url"""
+        if filename.lower().split('.')[-1] in cls.IMAGE_FORMATS:
+            return {
+                "type": "image_url",
+                "image_url": url
+            }
+
+        return {
+            "type": "document_url",
+            "document_url": url
+        }
+
+    @staticmethod
+    def _merge_pages(local_pages: Optional[List[Optional[str]]], ocr_page_numbers: Optional[List[int]], ocr_pages: List[str]) -> List[str]:
+        """
+        Combine locally extracted pages with OCR output in page order
+
+        Args:
+            local_pages: Per-page local text (None entries were OCR'd), or None
+            ocr_page_numbers: Pages that were sent to OCR, or None for all
+            ocr_pages: Markdown of each OCR'd page, in page order
+
+        Returns:
+            Markdown content of each page that contains text
+        """
+        if local_pages is None or ocr_page_numbers is None:
+            merged = list(ocr_pages)
+        else:
+            merged = list(local_pages)
+            for page_number, markdown in zip(ocr_page_numbers, ocr_pages):
+                merged[page_number] = markdown
+
+        pages = [page for page in merged if page]
+        if not pages:
+            raise ValueError("No text content found in document")
+
+        return pages
+
+    @staticmethod
+    def _page_markdown(ocr_response) -> List[str]:
+        """Markdown of every OCR response page, in page order"""
+        pages = sorted(getattr(ocr_response, 'pages', None) or [], key=lambda page: page.index)
+        return [page.markdown or '' for page in pages]
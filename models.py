@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import Dict, List, Optional
 
 
 class InsuranceDataResponse(BaseModel):
@@ -12,9 +12,45 @@ class InsuranceDataResponse(BaseModel):
     sum_assured: Optional[str] = Field(None, description="Coverage amount")
     room_rent_limit: Optional[str] = Field(None, description="Room rent limit per day")
     waiting_period: Optional[str] = Field(None, description="Waiting period duration")
+    field_sources: Optional[Dict[str, str]] = Field(
+        None,
+        description="How each field was extracted: 'rule' (pattern match), 'llm', or 'unavailable' "
+                    "(the LLM was skipped in degraded mode)"
+    )
+    degraded: Optional[List[str]] = Field(
+        None,
+        description="Providers skipped because their circuit breaker was open ('mistral', 'openai'); "
+                    "pages or fields they would have supplied are missing"
+    )
 
 
 class ErrorResponse(BaseModel):
     """Error response model"""
     error: str = Field(..., description="Error message")
     detail: Optional[str] = Field(None, description="Detailed error information")
+
+
+class BatchItemResult(BaseModel):
+    """Extraction result or error for one document of a batch"""
+    index: int = Field(..., description="Position of the document in the batch")
+    filename: str = Field(..., description="Uploaded or archived file name")
+    result: Optional[InsuranceDataResponse] = Field(None, description="Extracted data, if successful")
+    error: Optional[str] = Field(None, description="Error message, if extraction failed")
+
+
+class BatchExtractionResponse(BaseModel):
+    """Response model for batch extraction"""
+    results: List[BatchItemResult] = Field(..., description="Per-document results in upload order")
+    succeeded: int = Field(..., description="Number of documents extracted successfully")
+    failed: int = Field(..., description="Number of documents that failed")
+
+
+class JobStatusResponse(BaseModel):
+    """Status and result of an asynchronous extraction job"""
+    job_id: str = Field(..., description="Job identifier")
+    status: str = Field(..., description="queued, running, succeeded or failed")
+    filename: str = Field(..., description="Uploaded file name")
+    created_at: float = Field(..., description="Submission time (Unix timestamp)")
+    updated_at: float = Field(..., description="Last status change (Unix timestamp)")
+    result: Optional[InsuranceDataResponse] = Field(None, description="Extracted data, once succeeded")
+    error: Optional[str] = Field(None, description="Error message, if failed")
@@ -0,0 +1,97 @@
+"""
+Latency and memory cost of requesting page images from Mistral OCR
+
+Usage:
+    uvicorn fault_stub:app --port 9000
+    python ocr_image_bench.py [--server-url http://127.0.0.1:9000] [--pages 100] [--runs 5]
+
+Parses a blank PDF of --pages pages --runs times through
+MistralDocumentParser, once with include_images off and once on, each in
+a fresh process so that peak RSS belongs to that setting alone. The stub
+returns FAULT_IMAGE_KB of image data per page when images are requested.
+"""
+import argparse
+import asyncio
+import io
+import json
+import resource
+import subprocess
+import sys
+import time
+from typing import Any, Dict
+
+
+def blank_pdf(pages: int) -> bytes:
+    """A PDF of blank Letter pages"""
+    from pypdf import PdfWriter
+
+    writer = PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(612, 792)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure(server_url: str, pages: int, runs: int, include_images: bool) -> Dict[str, Any]:
+    """
+    Parse the PDF runs times in this process
+
+    Returns:
+        Page count, median and min parse seconds, and RSS before and at peak in MB
+    """
+    from mistral_parser import MistralDocumentParser
+
+    parser = MistralDocumentParser("benchmark", include_images=include_images, server_url=server_url)
+    content = blank_pdf(pages)
+    rss_before = peak_rss_mb()
+
+    async def parse_all():
+        seconds = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            parsed = await parser.parse_pages_async(content, "benchmark.pdf")
+            seconds.append(time.perf_counter() - started)
+        return parsed, sorted(seconds)
+
+    parsed, seconds = asyncio.run(parse_all())
+    return {
+        "include_images": include_images,
+        "pages": len(parsed),
+        "median_s": round(seconds[len(seconds) // 2], 3),
+        "min_s": round(seconds[0], 3),
+        "rss_before_mb": round(rss_before),
+        "peak_rss_mb": round(peak_rss_mb())
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare OCR parse time and memory with and without page images")
+    parser.add_argument("--server-url", default="http://127.0.0.1:9000", help="Mistral API URL, e.g. fault_stub.py")
+    parser.add_argument("--pages", type=int, default=100, help="Pages in the test PDF")
+    parser.add_argument("--runs", type=int, default=5, help="Parses per setting")
+    parser.add_argument("--include-images", choices=["true", "false"], default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.include_images is not None:
+        # Child process: measure one setting and report it as JSON
+        print(json.dumps(measure(args.server_url, args.pages, args.runs, args.include_images == "true")))
+        return
+
+    for include_images in ("false", "true"):
+        output = subprocess.run(
+            [sys.executable, __file__, "--server-url", args.server_url, "--pages", str(args.pages),
+             "--runs", str(args.runs), "--include-images", include_images],
+            check=True, capture_output=True, text=True
+        ).stdout
+        report = json.loads(output.strip().splitlines()[-1])
+        print(" ".join(f"{key}={value}" for key, value in report.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,55 @@
+import asyncio
+import hashlib
 import json
-from openai import OpenAI
-from typing import Dict, Any
+import time
+from functools import lru_cache
+from openai import OpenAI, AsyncOpenAI
+from openai.types.chat import ChatCompletion
+from pydantic import TypeAdapter, ValidationError
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+from chunking import merge_chunk_results, split_into_chunks
+from http_transport import SharedHttpClients
+from json_stream import IncrementalObjectParser
+from metrics import cached_tokens, observe_seconds, observe_stage, record_usage
+from models import InsuranceDataResponse
+from rate_limit import RateLimiter
+from relevance import estimate_tokens
+from resilience import CircuitOpenError, ResilientCaller, latency_kind
+from tracing import add_event, set_attributes, span
+
+# Response fields filled in by the pipeline rather than the model
+NON_EXTRACTED_FIELDS = {"field_sources", "degraded"}
+
+
+@lru_cache(maxsize=None)
+def response_schema(fields: Tuple[str, ...]) -> Dict[str, Any]:
+    """
+    Strict JSON schema for InsuranceDataResponse fields
+
+    Structured outputs in strict mode need every property listed as
+    required and no additional properties; a field that may be absent
+    stays nullable instead. Defaults and titles are not supported there
+    and are left out.
+
+    Args:
+        fields: Fields in the schema, in the order the model should write them
+    """
+    properties = InsuranceDataResponse.model_json_schema()["properties"]
+    return {
+        "type": "object",
+        "properties": {
+            field: {key: value for key, value in properties[field].items() if key not in ("default", "title")}
+            for field in fields
+        },
+        "required": list(fields),
+        "additionalProperties": False
+    }
+
+
+@lru_cache(maxsize=None)
+def _field_adapter(field: str) -> TypeAdapter:
+    return TypeAdapter(InsuranceDataResponse.model_fields[field].annotation)
 
 
 class OpenAIExtractor:
@@ -124,57 +173,512 @@ Return a JSON object with exactly these keys: name, policy_number, email, policy
 
 If a field is not found anywhere in the document after thorough search, set its value to null."""
 
-    def __init__(self, api_key: str):
-        """Initialize OpenAI client"""
+    MODEL = "gpt-4o-mini"  # Using gpt-4o-mini for cost-efficient structured extraction
+
+    BATCH_ENDPOINT = "/v1/chat/completions"
+
+    # Output read past the last requested field before a stream is closed
+    # early; enough for the closing brace, not for extra keys
+    STREAM_TAIL_CHARS = 64
+
+    REQUIRED_FIELDS = [field for field in InsuranceDataResponse.model_fields if field not in NON_EXTRACTED_FIELDS]
+
+    # Times fields that fail validation are requested again on their own
+    FIELD_RETRIES = 1
+
+    def __init__(
+        self,
+        api_key: str,
+        resilience: Optional[ResilientCaller] = None,
+        base_url: Optional[str] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        http_clients: Optional[SharedHttpClients] = None
+    ):
+        """
+        Initialize OpenAI clients
+
+        Args:
+            api_key: OpenAI API key
+            resilience: Retry and hedging policy for completion calls
+            base_url: Alternative OpenAI API URL, e.g. a local stub server
+            rate_limiter: Optional limiter for the requests and tokens per
+                minute quotas; each call waits for its estimated cost
+            http_clients: Optional connection pools shared with the Mistral
+                client; their timeouts replace the SDK's 10 minute default
+        """
         if not api_key:
             raise ValueError("OpenAI API key not provided")
 
         self.api_key = api_key
-        self.client = OpenAI(api_key=self.api_key)
-
-    def extract_insurance_data(self, document_text: str) -> Dict[str, Any]:
+        # Retries are handled by self.resilience, not the SDK
+        self.client = OpenAI(
+            api_key=self.api_key,
+            base_url=base_url,
+            max_retries=0,
+            http_client=http_clients.client if http_clients is not None else None
+        )
+        self.async_client = AsyncOpenAI(
+            api_key=self.api_key,
+            base_url=base_url,
+            max_retries=0,
+            http_client=http_clients.async_client if http_clients is not None else None
+        )
+        self.resilience = resilience or ResilientCaller("OpenAI")
+        self.rate_limiter = rate_limiter
+        # Calls with usage, calls that hit the prompt cache, and their tokens
+        self.prompt_cache_stats = {"calls": 0, "cache_hits": 0, "input_tokens": 0, "cached_tokens": 0}
+        # Replies with fields that failed validation, and what became of those fields
+        self.validation_stats = {"responses": 0, "invalid_responses": 0, "fields_retried": 0, "fields_failed": 0}
+
+    @property
+    def version(self) -> str:
+        """Identifier of the model, prompt and response schema, used to key cached results"""
+        schema = json.dumps(response_schema(tuple(self.REQUIRED_FIELDS)), sort_keys=True)
+        prompt_hash = hashlib.sha256((self.SYSTEM_PROMPT + schema).encode('utf-8')).hexdigest()[:12]
+        return f"{self.MODEL}:{prompt_hash}"
+
+    def extract_insurance_data(self, document_text: str, fields: Optional[List[str]] = None) -> Dict[str, Any]:
         """
         Extract structured insurance data from document text using OpenAI
 
+        The reply is constrained to the strict schema of the requested
+        fields. Fields that still come back missing or invalid (e.g. a reply
+        cut off at max_tokens) are requested again on their own, and are
+        null if still invalid after FIELD_RETRIES re-requests.
+
         Args:
             document_text: Extracted text content from the insurance document
+            fields: Fields to request (all REQUIRED_FIELDS if None)
 
         Returns:
             Dictionary with extracted insurance data
         """
         try:
-            # Call OpenAI API with structured output
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",  # Using gpt-4o-mini for cost-efficient structured extraction
-                messages=[
-                    {"role": "system", "content": self.SYSTEM_PROMPT},
-                    {
-                        "role": "user",
-                        "content": f"Extract insurance data from this document text:\n\n{document_text}"
-                    }
-                ],
-                response_format={"type": "json_object"},
-                temperature=0,
-                max_tokens=1000
-            )
+            with span("openai.extract", **self._span_attributes(fields, streaming=False)):
+                # Call OpenAI API with schema-constrained structured output
+                wanted = fields or self.REQUIRED_FIELDS
+                request = self._build_request(document_text, fields)
+                response = self._call_sync(request)
+                result, failed = self._parse_response(response, wanted)
+
+                for attempt in range(self.FIELD_RETRIES):
+                    if not failed:
+                        break
+                    self._record_retry(failed, attempt)
+
+                    request = self._build_request(document_text, failed)
+                    response = self._call_sync(request)
+                    retried, failed = self._parse_response(response, failed)
+                    result.update(retried)
+
+                return self._complete_result(result, wanted, failed)
+
+        except ValueError:
+            raise
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            raise RuntimeError(f"OpenAI API error: {str(e)}")
+
+    async def extract_insurance_data_async(self, document_text: str, fields: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Extract structured insurance data without blocking the event loop
+
+        Args:
+            document_text: Extracted text content from the insurance document
+            fields: Fields to request (all REQUIRED_FIELDS if None)
 
-            # Parse the response
-            result = json.loads(response.choices[0].message.content)
+        Returns:
+            Dictionary with extracted insurance data
+        """
+        try:
+            with span("openai.extract", **self._span_attributes(fields, streaming=False)):
+                wanted = fields or self.REQUIRED_FIELDS
+                request = self._build_request(document_text, fields)
+                response = await self._call(request)
+                result, failed = self._parse_response(response, wanted)
+
+                return await self._retry_fields_async(document_text, result, wanted, failed)
+
+        except ValueError:
+            raise
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            raise RuntimeError(f"OpenAI API error: {str(e)}")
 
-            # Ensure all required fields are present
-            required_fields = [
-                "name", "policy_number", "email", "policy_name",
-                "plan_type", "sum_assured", "room_rent_limit", "waiting_period"
-            ]
+    async def extract_insurance_data_stream_async(
+        self,
+        document_text: str,
+        fields: Optional[List[str]] = None,
+        on_field: Optional[Callable[[str, Any], None]] = None
+    ) -> Dict[str, Any]:
+        """
+        Extract structured insurance data, parsing the streamed JSON as it arrives
 
-            # Add missing fields as null
-            for field in required_fields:
-                if field not in result:
-                    result[field] = None
+        Each requested field is passed to on_field as soon as its value is
+        complete, and the stream is closed as soon as every requested field
+        has been seen, without waiting for the rest of the completion.
 
-            return result
+        Args:
+            document_text: Extracted text content from the insurance document
+            fields: Fields to request (all REQUIRED_FIELDS if None)
+            on_field: Optional callback receiving (field, value) as fields close
 
-        except json.JSONDecodeError as e:
-            raise ValueError(f"Failed to parse OpenAI response as JSON: {str(e)}")
+        Returns:
+            Dictionary with extracted insurance data
+        """
+        wanted = fields or self.REQUIRED_FIELDS
+        parser = IncrementalObjectParser()
+
+        try:
+            with span("openai.extract", **self._span_attributes(fields, streaming=True)):
+                # Only opening the stream is retried; a stream that fails midway
+                # has already reported fields and is surfaced as an error
+                request = self._build_request(document_text, fields)
+                started = time.perf_counter()
+                first_token = None
+                parse_seconds = 0.0
+                fields_complete_at = None
+                usage = None
+                stream = await self._call(request, stream=True, stream_options={"include_usage": True})
+
+                try:
+                    async for chunk in stream:
+                        # Usage arrives in a final chunk of its own, after the object closes
+                        if getattr(chunk, 'usage', None) is not None:
+                            usage = chunk.usage
+                        if not chunk.choices or not chunk.choices[0].delta.content or parser.done:
+                            continue
+
+                        if first_token is None:
+                            first_token = time.perf_counter() - started
+
+                        parse_started = time.perf_counter()
+                        try:
+                            completed = parser.feed(chunk.choices[0].delta.content)
+                        except ValueError:
+                            # Not a JSON object past this point; the fields
+                            # not yet read are requested again below
+                            break
+                        finally:
+                            parse_seconds += time.perf_counter() - parse_started
+
+                        for field, value in completed:
+                            if field in wanted and on_field is not None and self._valid(field, value):
+                                on_field(field, value)
+
+                        if not parser.done and all(field in parser.result for field in wanted):
+                            # Normally only the closing brace is left, and reading on
+                            # yields the usage chunk; stop if the model adds other keys
+                            if fields_complete_at is None:
+                                fields_complete_at = len(parser.text)
+                            elif len(parser.text) - fields_complete_at > self.STREAM_TAIL_CHARS:
+                                break
+                finally:
+                    # Closing early stops generation of anything after the last field
+                    await stream.close()
+                    observe_seconds("llm_call", self.MODEL, time.perf_counter() - started - parse_seconds)
+                    observe_seconds("json_parse", self.MODEL, parse_seconds)
+
+                self._record_usage(usage)
+                if first_token is not None and usage is not None:
+                    # Split so the prompt cache's effect on latency is visible
+                    stage = "llm_first_token_cached" if cached_tokens(usage) else "llm_first_token_uncached"
+                    observe_seconds(stage, self.MODEL, first_token)
+
+                # Fields cut off by truncation or of the wrong type are requested again
+                result, failed = self._validate(parser.result, wanted)
+                self.validation_stats["responses"] += 1
+                self.validation_stats["invalid_responses"] += int(bool(failed))
+
+                return await self._retry_fields_async(document_text, result, wanted, failed, on_field)
+
+        except ValueError:
+            raise
+        except CircuitOpenError:
+            raise
         except Exception as e:
             raise RuntimeError(f"OpenAI API error: {str(e)}")
+
+    async def extract_insurance_data_chunked_async(
+        self,
+        pages: List[str],
+        max_chunk_chars: int,
+        concurrency: int = 4,
+        fields: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """
+        Extract insurance data from a long document by map-reduce over chunks
+
+        Pages are grouped into chunks that fit the model context, each chunk
+        is extracted in parallel, and the per-chunk fields are merged with
+        deterministic tie-breaking (see chunking.merge_chunk_results).
+
+        Args:
+            pages: Markdown of each page in document order
+            max_chunk_chars: Maximum characters of document text per call
+            concurrency: Maximum number of concurrent OpenAI calls
+            fields: Fields to request (all REQUIRED_FIELDS if None)
+
+        Returns:
+            Dictionary with extracted insurance data
+        """
+        chunks = split_into_chunks(pages, max_chunk_chars)
+        if len(chunks) == 1:
+            return await self.extract_insurance_data_async(chunks[0], fields)
+
+        slots = asyncio.Semaphore(concurrency)
+
+        async def extract_chunk(chunk: str) -> Dict[str, Any]:
+            async with slots:
+                return await self.extract_insurance_data_async(chunk, fields)
+
+        chunk_results = await asyncio.gather(*(extract_chunk(chunk) for chunk in chunks))
+        return merge_chunk_results(chunk_results, fields or self.REQUIRED_FIELDS)
+
+    def batch_request(self, custom_id: str, document_text: str, fields: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Build one line of an OpenAI Batch API input file
+
+        Args:
+            custom_id: Identifier the result line is matched back on
+            document_text: Text content from the document
+            fields: Fields to request (all REQUIRED_FIELDS if None)
+
+        Returns:
+            Batch request with the same body as a synchronous call
+        """
+        return {
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": self.BATCH_ENDPOINT,
+            "body": self._build_request(document_text, fields)
+        }
+
+    def parse_batch_response(self, body: Dict[str, Any], fields: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Parse the chat completion body of a batch output line like a synchronous response
+
+        Batches are not re-requested, so fields that failed validation are null.
+        """
+        wanted = fields or self.REQUIRED_FIELDS
+        result, failed = self._parse_response(ChatCompletion.model_validate(body), wanted)
+        return self._complete_result(result, wanted, failed)
+
+    def _span_attributes(self, fields: Optional[List[str]], streaming: bool) -> Dict[str, Any]:
+        return {
+            "llm.model": self.MODEL,
+            "llm.fields": len(fields or self.REQUIRED_FIELDS),
+            "llm.streaming": streaming
+        }
+
+    def _record_usage(self, usage) -> None:
+        """Report token usage, including prompt cache hits, to the stats, metrics and current span"""
+        if usage is None:
+            return
+
+        cached = cached_tokens(usage)
+        self.prompt_cache_stats["calls"] += 1
+        self.prompt_cache_stats["cache_hits"] += int(cached > 0)
+        self.prompt_cache_stats["input_tokens"] += usage.prompt_tokens or 0
+        self.prompt_cache_stats["cached_tokens"] += cached
+
+        record_usage(usage, self.MODEL, self.prompt_cache_stats["input_tokens"], self.prompt_cache_stats["cached_tokens"])
+        set_attributes(**{
+            "llm.usage.input_tokens": usage.prompt_tokens,
+            "llm.usage.cached_tokens": cached,
+            "llm.usage.output_tokens": usage.completion_tokens
+        })
+
+    def prompt_cache_report(self) -> Dict[str, Any]:
+        """Prompt cache counters for the health endpoint"""
+        stats = dict(self.prompt_cache_stats)
+        stats["hit_ratio"] = round(stats["cached_tokens"] / stats["input_tokens"], 3) if stats["input_tokens"] else 0.0
+        return stats
+
+    def _call_sync(self, request: Dict[str, Any]):
+        """
+        One chat completion, retried through the resilience layer
+
+        Rate limit capacity is waited for before each attempt, outside the
+        breaker's timing, so our own throttling never reads as a slow provider.
+        Latencies are tracked per prompt size (see latency_kind).
+        """
+        cost = self._request_cost(request)
+        acquire = None
+        if self.rate_limiter is not None:
+            acquire = lambda: self.rate_limiter.acquire_sync(cost)
+        return self.resilience.call_sync(
+            lambda: self._create(request), acquire, latency_kind("completion", cost["tokens"])
+        )
+
+    async def _call(self, request: Dict[str, Any], **kwargs):
+        """
+        Async variant of _call_sync; each hedge waits for capacity as well
+
+        A stream returns once its headers arrive, so it is timed apart from
+        full completions and never hedged.
+        """
+        cost = self._request_cost(request)
+        acquire = None
+        if self.rate_limiter is not None:
+            acquire = lambda: self.rate_limiter.acquire(cost)
+        if kwargs.get("stream"):
+            return await self.resilience.call(
+                lambda: self._create_async(request, **kwargs), acquire, kind="stream", hedge=False
+            )
+        return await self.resilience.call(
+            lambda: self._create_async(request, **kwargs), acquire, latency_kind("completion", cost["tokens"])
+        )
+
+    def _create(self, request: Dict[str, Any]):
+        """One chat completion call"""
+        with observe_stage("llm_call", self.MODEL):
+            return self.client.chat.completions.create(**request)
+
+    async def _create_async(self, request: Dict[str, Any], **kwargs):
+        """Async variant of _create"""
+        if kwargs.get("stream"):
+            # Only the headers have arrived when this returns; the caller
+            # times the whole stream instead
+            return await self.async_client.chat.completions.create(**request, **kwargs)
+        with observe_stage("llm_call", self.MODEL):
+            return await self.async_client.chat.completions.create(**request, **kwargs)
+
+    @staticmethod
+    def _request_cost(request: Dict[str, Any]) -> Dict[str, float]:
+        """Quota cost of a request: prompt tokens estimated from its length plus max_tokens"""
+        prompt_tokens = sum(estimate_tokens(message["content"]) for message in request["messages"])
+        return {"requests": 1, "tokens": prompt_tokens + request["max_tokens"]}
+
+    def _build_request(self, document_text: str, fields: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Build the chat completion request arguments
+
+        The static system prompt comes first and the document text next, so
+        every request shares the longest possible prefix and the provider's
+        prompt cache can serve it (prefixes over 1,024 tokens are cached).
+        The provider places the response schema in front of the system
+        prompt, so it is always the full schema: a request for some of the
+        fields names them after the document text and the model returns
+        null for the rest. A re-request of failed fields then shares the
+        whole prompt of the first request as its prefix.
+        """
+        user_content = f"Extract insurance data from this document text:\n\n{document_text}"
+        if fields is not None and set(fields) != set(self.REQUIRED_FIELDS):
+            # The other fields are already known; ask only for the rest
+            user_content += (
+                f"\n\nOnly extract these fields: {', '.join(fields)}. "
+                f"Set every other field to null."
+            )
+
+        return {
+            "model": self.MODEL,
+            "messages": [
+                {"role": "system", "content": self.SYSTEM_PROMPT},
+                {"role": "user", "content": user_content}
+            ],
+            "response_format": {
+                "type": "json_schema",
+                "json_schema": {
+                    "name": "insurance_data",
+                    "strict": True,
+                    "schema": response_schema(tuple(self.REQUIRED_FIELDS))
+                }
+            },
+            "temperature": 0,
+            "max_tokens": 1000
+        }
+
+    def _parse_response(self, response, fields: List[str]) -> Tuple[Dict[str, Any], List[str]]:
+        """
+        Parse the completion JSON and validate the requested fields
+
+        A reply cut off at max_tokens, or one that stops being a JSON
+        object, still yields the fields that closed before that point; the
+        others are reported as failed, never raised.
+
+        Returns:
+            Valid fields, and the requested fields that are missing or invalid
+        """
+        self._record_usage(getattr(response, 'usage', None))
+
+        with observe_stage("json_parse", self.MODEL):
+            content = response.choices[0].message.content or ''
+            try:
+                data = json.loads(content)
+            except json.JSONDecodeError:
+                parser = IncrementalObjectParser()
+                try:
+                    parser.feed(content)
+                except ValueError:
+                    pass  # not a JSON object past this point; its fields fail below
+                data = parser.result
+            result, failed = self._validate(data if isinstance(data, dict) else {}, fields)
+
+        self.validation_stats["responses"] += 1
+        self.validation_stats["invalid_responses"] += int(bool(failed))
+        return result, failed
+
+    def _validate(self, data: Dict[str, Any], fields: List[str]) -> Tuple[Dict[str, Any], List[str]]:
+        """Split the requested fields into valid values and missing or invalid fields"""
+        result = {}
+        failed = []
+        for field in fields:
+            if field in data and self._valid(field, data[field]):
+                result[field] = data[field]
+            else:
+                failed.append(field)
+        return result, failed
+
+    @staticmethod
+    def _valid(field: str, value: Any) -> bool:
+        """Whether a value has the type InsuranceDataResponse declares for its field"""
+        try:
+            _field_adapter(field).validate_python(value, strict=True)
+            return True
+        except ValidationError:
+            return False
+
+    async def _retry_fields_async(
+        self,
+        document_text: str,
+        result: Dict[str, Any],
+        wanted: List[str],
+        failed: List[str],
+        on_field: Optional[Callable[[str, Any], None]] = None
+    ) -> Dict[str, Any]:
+        """Request fields that failed validation again, on their own, up to FIELD_RETRIES times"""
+        for attempt in range(self.FIELD_RETRIES):
+            if not failed:
+                break
+            self._record_retry(failed, attempt)
+
+            request = self._build_request(document_text, failed)
+            response = await self._call(request)
+            retried, failed = self._parse_response(response, failed)
+            result.update(retried)
+
+            if on_field is not None:
+                for field, value in retried.items():
+                    on_field(field, value)
+
+        return self._complete_result(result, wanted, failed)
+
+    def _record_retry(self, failed: List[str], attempt: int) -> None:
+        self.validation_stats["fields_retried"] += len(failed)
+        add_event("field_retry", fields=",".join(failed), attempt=attempt + 1)
+
+    def _complete_result(self, result: Dict[str, Any], wanted: List[str], failed: List[str]) -> Dict[str, Any]:
+        """
+        Requested fields in order
+
+        A field that never validated is returned as null rather than
+        failing the document (and, in chunked mode, every other chunk).
+        """
+        if failed:
+            self.validation_stats["fields_failed"] += len(failed)
+            add_event("fields_failed", fields=",".join(failed))
+            print(f"Warning: OpenAI - returning null for invalid fields: {', '.join(failed)}")
+        return {field: result.get(field) for field in wanted}
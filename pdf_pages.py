@@ -0,0 +1,47 @@
+import io
+from pathlib import Path
+from typing import List, Union
+
+try:
+    from pypdf import PdfReader, PdfWriter
+except ImportError:
+    PdfReader = PdfWriter = None
+
+
+def pdf_support_available() -> bool:
+    """Whether pypdf is installed"""
+    return PdfReader is not None
+
+
+def _source(file_content: Union[bytes, Path]):
+    return file_content if isinstance(file_content, Path) else io.BytesIO(file_content)
+
+
+def page_count(file_content: Union[bytes, Path]) -> int:
+    """Number of pages in a PDF"""
+    return len(PdfReader(_source(file_content)).pages)
+
+
+def pack_pages(file_content: Union[bytes, Path], page_numbers: List[int]) -> bytes:
+    """
+    Copy selected pages of a PDF into a new, smaller PDF
+
+    Only the objects the copied pages reference (their images, fonts and
+    content streams) are written, so packing a few scanned pages out of a
+    long document shrinks it roughly in proportion.
+
+    Args:
+        file_content: Binary content of the PDF, or path to it on disk
+        page_numbers: Zero-based pages to copy, in the order to write them
+
+    Returns:
+        The new PDF
+    """
+    reader = PdfReader(_source(file_content))
+    writer = PdfWriter()
+    for page_number in page_numbers:
+        writer.add_page(reader.pages[page_number])
+
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue()
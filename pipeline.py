@@ -0,0 +1,379 @@
+import asyncio
+import hashlib
+import json
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from cache import ResultCache
+from chunking import split_into_chunks
+from metrics import CACHE_HITS, ERRORS, IN_FLIGHT, document_extension, extension_label
+from mistral_parser import MistralDocumentParser
+from openai_extractor import OpenAIExtractor
+from relevance import PageRanker, estimate_tokens
+from resilience import CircuitOpenError
+from rules import RuleExtractor
+from tracing import set_attributes, span
+
+# Progress callback: receives an event name and its JSON-serialisable payload
+EventCallback = Callable[[str, Dict[str, Any]], None]
+
+
+class ExtractionPipeline:
+    """Runs the Mistral OCR -> OpenAI extraction pipeline for one document"""
+
+    def __init__(
+        self,
+        parser: MistralDocumentParser,
+        extractor: OpenAIExtractor,
+        cache: Optional[ResultCache] = None,
+        max_concurrency: int = 32,
+        extraction_mode: str = "auto",
+        chunk_max_chars: int = 60000,
+        chunk_concurrency: int = 4,
+        page_ranker: Optional[PageRanker] = None,
+        page_token_budget: int = 16000,
+        page_neighbours: int = 1,
+        rule_extractor: Optional[RuleExtractor] = None,
+        llm_streaming: bool = True,
+        degraded_mode: bool = False
+    ):
+        """
+        Args:
+            parser: Mistral OCR document parser
+            extractor: OpenAI structured data extractor
+            cache: Optional result cache keyed on document hash
+            max_concurrency: Maximum number of documents in flight
+            extraction_mode: "single" sends the whole document in one call,
+                "chunked" always map-reduces over chunks, "auto" chunks only
+                documents longer than chunk_max_chars
+            chunk_max_chars: Maximum characters of document text per LLM call
+            chunk_concurrency: Concurrent LLM calls per chunked document
+            page_ranker: Optional ranker used to drop irrelevant pages
+                before the LLM call
+            page_token_budget: Estimated tokens of page text to keep when pruning
+            page_neighbours: Pages either side of a relevant page to keep
+            rule_extractor: Optional rule-based pre-extractor; the LLM is only
+                asked for the fields it could not resolve
+            llm_streaming: Stream single-call completions, reporting each field
+                as it closes and stopping once all requested fields are in
+            degraded_mode: While a provider's circuit breaker is open, answer
+                from what still works instead of failing: the locally readable
+                pages in place of OCR, and rule-based fields in place of the
+                LLM. Degraded results are flagged and never cached
+        """
+        if extraction_mode not in ("single", "chunked", "auto"):
+            raise ValueError(f"Unknown extraction mode: {extraction_mode}")
+
+        self.parser = parser
+        self.extractor = extractor
+        self.cache = cache
+        self.extraction_mode = extraction_mode
+        self.chunk_max_chars = chunk_max_chars
+        self.chunk_concurrency = chunk_concurrency
+        self.page_ranker = page_ranker
+        self.page_token_budget = page_token_budget
+        self.page_neighbours = page_neighbours
+        self.pruning_stats = {"documents": 0, "pruned_documents": 0, "tokens_in": 0, "tokens_sent": 0}
+        self.rule_extractor = rule_extractor
+        self.rule_stats = {"documents": 0, "rule_fields": 0, "llm_fields": 0, "llm_calls_skipped": 0}
+        self.llm_streaming = llm_streaming
+        self.degraded_mode = degraded_mode
+        self.degraded_stats = {"mistral": 0, "openai": 0}
+        # Bound the number of documents in flight against the providers
+        self._slots = asyncio.Semaphore(max_concurrency)
+
+    @property
+    def version(self) -> str:
+        """
+        Identifier of the OCR model, LLM model and prompt, and of the
+        settings that change which text and fields reach the LLM; results
+        cached under another version are not served
+        """
+        local_extractor = self.parser.local_extractor if self.parser is not None else None
+        options = {
+            "local_min_page_chars": local_extractor.min_page_chars if local_extractor is not None else None,
+            "rules": self.rule_extractor.version if self.rule_extractor is not None else None,
+            "pruning": [self.page_token_budget, self.page_neighbours] if self.page_ranker is not None else None,
+            "chunking": [self.extraction_mode, self.chunk_max_chars]
+        }
+        options_hash = hashlib.sha256(json.dumps(options, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+        return f"{MistralDocumentParser.OCR_MODEL}:{self.extractor.version}:{options_hash}"
+
+    async def run(
+        self,
+        file_content: Union[bytes, Path],
+        filename: str,
+        document_hash: Optional[str] = None,
+        on_event: Optional[EventCallback] = None
+    ) -> Dict[str, Any]:
+        """
+        Extract insurance data from a document, consulting the cache first
+
+        Args:
+            file_content: Binary content of the file, or path to it on disk
+            filename: Name of the file
+            document_hash: SHA-256 of the document, if already computed
+            on_event: Optional callback for progress events: "cache_hit",
+                "ocr_progress", "ocr_done", "llm_started", "degraded" and one
+                "field" event per field as soon as its value is known
+
+        Returns:
+            Dictionary with extracted insurance data
+        """
+        extension = extension_label(filename)
+        model = OpenAIExtractor.MODEL
+        # Lets the OCR and LLM clients label their metrics by file type
+        token = document_extension.set(extension)
+        try:
+            with IN_FLIGHT.labels(extension, model).track_inprogress(), span(
+                "pipeline.run", **{"document.extension": extension, "document.hash": document_hash}
+            ):
+                return await self._run(file_content, filename, document_hash, on_event)
+        except Exception as e:
+            ERRORS.labels(type(e).__name__, extension, model).inc()
+            raise
+        finally:
+            document_extension.reset(token)
+
+    async def _run(
+        self,
+        file_content: Union[bytes, Path],
+        filename: str,
+        document_hash: Optional[str],
+        on_event: Optional[EventCallback]
+    ) -> Dict[str, Any]:
+        document_hash = document_hash or ResultCache.document_hash(file_content)
+
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.make_key(document_hash, self.version)
+            with span("result_cache.lookup") as lookup:
+                cached = self.cache.get(cache_key)
+                if lookup is not None:
+                    lookup.set_attribute("cache.hit", cached is not None)
+            if cached is not None:
+                CACHE_HITS.labels("result", document_extension.get(), OpenAIExtractor.MODEL).inc()
+                if on_event is not None:
+                    on_event("cache_hit", {})
+                return cached["result"]
+
+        degraded = []
+        async with self._slots:
+            # Step 1: Parse document with Mistral AI to extract page text
+            try:
+                pages = await self.parser.parse_pages_async(file_content, filename, document_hash, on_event)
+            except CircuitOpenError as e:
+                pages = await self._degraded_pages(file_content, filename, e, on_event)
+                degraded.append("mistral")
+            if on_event is not None:
+                on_event("ocr_done", {"pages": len(pages)})
+
+            # Step 2: Extract structured data using OpenAI
+            result = await self.extract(pages, on_event)
+
+        if degraded:
+            result["degraded"] = degraded + result.get("degraded", [])
+            set_attributes(**{"extraction.degraded": ",".join(result["degraded"])})
+
+        # A degraded result is incomplete; let the next upload try again
+        if cache_key is not None and not result.get("degraded"):
+            self.cache.set(cache_key, {"markdown": '\n\n'.join(pages), "result": result})
+
+        return result
+
+    async def extract(self, pages: List[str], on_event: Optional[EventCallback] = None) -> Dict[str, Any]:
+        """
+        Extract insurance data from OCR pages
+
+        Rule-based extraction runs first over the whole document; only the
+        fields it could not resolve are requested from the LLM, over the
+        pruned pages, chunking long documents.
+
+        Args:
+            pages: Markdown of each page in document order
+            on_event: Optional callback for "llm_started" and "field" events
+
+        Returns:
+            Dictionary with extracted insurance data and the source
+            ("rule", "llm" or "unavailable") of each field under
+            field_sources; "degraded" lists "openai" if the LLM was skipped
+            because its circuit breaker was open
+        """
+        rule_result, remaining = self.rule_fields(pages)
+
+        if on_event is not None:
+            # Rule fields are final, so clients can show them before the LLM returns
+            for field, value in rule_result.items():
+                if field not in remaining:
+                    on_event("field", {"field": field, "value": value, "source": "rule"})
+
+        llm_unavailable = False
+        if remaining:
+            reported = set()
+
+            def on_llm_field(field: str, value: Any) -> None:
+                if value is None and field in rule_result:
+                    return  # the rule value stands; reported below
+                reported.add(field)
+                if on_event is not None:
+                    on_event("field", {"field": field, "value": value, "source": "llm"})
+
+            if on_event is not None:
+                on_event("llm_started", {"fields": remaining})
+            try:
+                result = await self._extract_with_llm(pages, remaining, on_llm_field)
+            except CircuitOpenError as e:
+                # Rule fields alone are only worth returning if there are any
+                if not self.degraded_mode or not rule_result:
+                    raise
+                self._report_degraded("openai", e, on_event)
+                llm_unavailable = True
+                result = {"degraded": ["openai"]}
+        else:
+            result = {}
+
+        result = self.combine(result, rule_result, llm_unavailable)
+
+        if on_event is not None:
+            # Chunked extraction and fields the model omitted are only known now
+            for field in remaining:
+                if field not in reported:
+                    on_event("field", {"field": field, "value": result[field], "source": result["field_sources"][field]})
+
+        if self.rule_extractor is not None:
+            self.rule_stats["documents"] += 1
+            self.rule_stats["rule_fields"] += len(rule_result)
+            self.rule_stats["llm_fields"] += len(remaining)
+            self.rule_stats["llm_calls_skipped"] += int(not remaining)
+
+        return result
+
+    def rule_fields(self, pages: List[str]) -> Tuple[Dict[str, Any], List[str]]:
+        """
+        Run rule-based extraction over a document
+
+        If the LLM is needed for some field anyway, it is also asked for the
+        free-text fields the rules resolved, as a check (see combine).
+
+        Returns:
+            Fields the rules resolved, and the fields to request from the LLM
+        """
+        if self.rule_extractor is None:
+            return {}, list(OpenAIExtractor.REQUIRED_FIELDS)
+
+        rule_result = self.rule_extractor.extract('\n\n'.join(pages))
+        remaining = [field for field in OpenAIExtractor.REQUIRED_FIELDS if field not in rule_result]
+        if remaining:
+            remaining = [
+                field for field in OpenAIExtractor.REQUIRED_FIELDS
+                if field not in rule_result or field in self.rule_extractor.FREE_TEXT_FIELDS
+            ]
+        return rule_result, remaining
+
+    def llm_inputs(self, pages: List[str]) -> List[str]:
+        """Document texts the LLM extracts from: the pruned pages, one per chunk if chunked"""
+        pages = self._prune(pages)
+        document_text = '\n\n'.join(pages)
+        if self._chunked(document_text):
+            return split_into_chunks(pages, self.chunk_max_chars)
+        return [document_text]
+
+    @staticmethod
+    def combine(llm_result: Dict[str, Any], rule_result: Dict[str, Any], llm_unavailable: bool = False) -> Dict[str, Any]:
+        """
+        Add the rule fields and the source of every field to an LLM result
+
+        Where the LLM also returned a free-text field (a name), its reading
+        of the context wins over the pattern match.
+        """
+        rule_fields = {
+            field: value for field, value in rule_result.items()
+            if field not in RuleExtractor.FREE_TEXT_FIELDS or llm_result.get(field) is None
+        }
+        result = {field: None for field in OpenAIExtractor.REQUIRED_FIELDS}
+        result.update(llm_result)
+        result.update(rule_fields)
+        result["field_sources"] = {
+            field: "rule" if field in rule_fields else ("unavailable" if llm_unavailable else "llm")
+            for field in OpenAIExtractor.REQUIRED_FIELDS
+        }
+        return result
+
+    async def _degraded_pages(
+        self,
+        file_content: Union[bytes, Path],
+        filename: str,
+        error: CircuitOpenError,
+        on_event: Optional[EventCallback] = None
+    ) -> List[str]:
+        """Locally readable pages in place of OCR, or re-raise if there are none"""
+        if not self.degraded_mode:
+            raise error
+
+        pages = await asyncio.to_thread(self.parser.parse_local_pages, file_content, filename)
+        if not pages:
+            raise error
+
+        self._report_degraded("mistral", error, on_event)
+        return pages
+
+    def _report_degraded(self, provider: str, error: CircuitOpenError, on_event: Optional[EventCallback]) -> None:
+        self.degraded_stats[provider] += 1
+        if on_event is not None:
+            on_event("degraded", {"provider": provider, "detail": str(error)})
+
+    async def _extract_with_llm(
+        self,
+        pages: List[str],
+        fields: List[str],
+        on_field: Optional[Callable[[str, Any], None]] = None
+    ) -> Dict[str, Any]:
+        """Extract fields with OpenAI over the pruned pages, chunking long documents"""
+        pages = self._prune(pages)
+        document_text = '\n\n'.join(pages)
+
+        if self._chunked(document_text):
+            return await self.extractor.extract_insurance_data_chunked_async(
+                pages, self.chunk_max_chars, self.chunk_concurrency, fields
+            )
+
+        if self.llm_streaming:
+            return await self.extractor.extract_insurance_data_stream_async(document_text, fields, on_field)
+
+        return await self.extractor.extract_insurance_data_async(document_text, fields)
+
+    def _chunked(self, document_text: str) -> bool:
+        """Whether a document is extracted by map-reduce over chunks"""
+        return self.extraction_mode == "chunked" or (
+            self.extraction_mode == "auto" and len(document_text) > self.chunk_max_chars
+        )
+
+    def _prune(self, pages: List[str]) -> List[str]:
+        """Keep only the most relevant pages within the token budget"""
+        if self.page_ranker is None:
+            return pages
+
+        selected = self.page_ranker.select(pages, self.page_token_budget, self.page_neighbours)
+        if not selected:
+            # Not even one page fits the budget; leave it to chunking
+            return pages
+
+        tokens_in = sum(estimate_tokens(page) for page in pages)
+        kept = [pages[page] for page in selected]
+        tokens_sent = sum(estimate_tokens(page) for page in kept)
+
+        self.pruning_stats["documents"] += 1
+        self.pruning_stats["pruned_documents"] += int(len(kept) < len(pages))
+        self.pruning_stats["tokens_in"] += tokens_in
+        self.pruning_stats["tokens_sent"] += tokens_sent
+
+        return kept
+
+    def pruning_report(self) -> Dict[str, Any]:
+        """Page pruning counters for the health endpoint"""
+        stats = dict(self.pruning_stats)
+        stats["tokens_saved"] = stats["tokens_in"] - stats["tokens_sent"]
+        stats["tokens_saved_per_request"] = (
+            round(stats["tokens_saved"] / stats["documents"], 1) if stats["documents"] else 0.0
+        )
+        return stats
@@ -0,0 +1,507 @@
+"""
+Re-extract the OCR cache through the OpenAI Batch API
+
+Usage:
+    python provider_batch.py --state-dir runs/prompt-v2 --output results.jsonl \\
+        [--documents archive/] [--limit 1000] [--wait] [--poll-seconds 60]
+
+For large backlogs, e.g. after a prompt or schema change. Batch requests
+are billed at a discount and run within 24 hours, outside the synchronous
+rate limits. Each step is recorded in STATE_DIR/state.json as soon as it
+completes, so an interrupted or partly finished run is resumed by running
+the same command again:
+
+    ocr      With --documents, files in that directory without cached OCR
+             are sent as Mistral batch OCR jobs and their pages stored in
+             the OCR cache
+    prepare  Every OCR cache entry without a result for the current prompt
+             and models becomes one request (or one per chunk) in OpenAI
+             batch input files; documents the rules fully resolve are
+             finished locally
+    submit   Input files are uploaded and their batches created
+    poll     Batch status is refreshed; without --wait the run stops here
+             until every batch has finished
+    merge    Output files are downloaded, matched to documents by their
+             hash (the custom_id) and written to the result cache and the
+             output JSONL, one line per document as in reextract.py
+
+Documents that fail keep no result, so a later run with a new state
+directory picks them up again.
+
+Requests go to OPENAI_BASE_URL and MISTRAL_SERVER_URL, so fault_stub.py
+can stand in for both providers.
+"""
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from cache import ResultCache
+from chunking import merge_chunk_results
+from config import settings
+from local_extractor import LocalTextExtractor
+from mistral_parser import MistralDocumentParser
+from pipeline import ExtractionPipeline
+from reextract import caches_from_settings, pipeline_from_settings
+from resilience import caller_from_settings
+
+# Provider limits per input file are 50,000 requests and 200 MB
+MAX_REQUESTS_PER_FILE = 50000
+MAX_BYTES_PER_FILE = 190 * 1024 * 1024
+
+OPENAI_FINISHED = {"completed", "failed", "expired", "cancelled"}
+MISTRAL_FINISHED = {"SUCCESS", "FAILED", "TIMEOUT_EXCEEDED", "CANCELLED"}
+
+
+class BatchState:
+    """Progress of a batch run, saved to STATE_DIR/state.json after every step"""
+
+    def __init__(self, state_dir: str):
+        self.dir = Path(state_dir)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.path = self.dir / "state.json"
+        self.data: Dict[str, Any] = {}
+        if self.path.exists():
+            self.data = json.loads(self.path.read_text(encoding="utf-8"))
+
+    def __getitem__(self, key: str) -> Any:
+        return self.data[key]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self.data[key] = value
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.data.get(key, default)
+
+    def save(self) -> None:
+        """Write the state atomically, so a crash never leaves it half written"""
+        partial = self.path.with_suffix(".tmp")
+        partial.write_text(json.dumps(self.data), encoding="utf-8")
+        os.replace(partial, self.path)
+
+
+def write_input_files(
+    state_dir: Path,
+    prefix: str,
+    documents: Iterator[Tuple[str, List[Dict[str, Any]]]],
+    max_requests: int = MAX_REQUESTS_PER_FILE,
+    max_bytes: int = MAX_BYTES_PER_FILE
+) -> List[Dict[str, Any]]:
+    """
+    Write batch requests to as many JSONL input files as the limits need
+
+    All requests of a document go into the same file, so a document is
+    complete once that file's batch is merged.
+
+    Args:
+        state_dir: Directory to write the files to
+        prefix: File name prefix, e.g. "openai"
+        documents: (document hash, batch requests) pairs
+        max_requests: Requests per file
+        max_bytes: Bytes per file
+
+    Returns:
+        One entry per file with its name, document hashes and request count
+    """
+    files: List[Dict[str, Any]] = []
+    output = None
+    size = 0
+
+    try:
+        for document_hash, requests in documents:
+            lines = [json.dumps(request) + "\n" for request in requests]
+            document_bytes = sum(len(line.encode("utf-8")) for line in lines)
+
+            current = files[-1] if files else None
+            if current is None or current["requests"] + len(lines) > max_requests or (
+                current["requests"] and size + document_bytes > max_bytes
+            ):
+                if output is not None:
+                    output.close()
+                current = {"input": f"{prefix}-{len(files):04d}.jsonl", "documents": [], "requests": 0}
+                files.append(current)
+                output = open(state_dir / current["input"], "w", encoding="utf-8")
+                size = 0
+
+            output.writelines(lines)
+            size += document_bytes
+            current["documents"].append(document_hash)
+            current["requests"] += len(lines)
+    finally:
+        if output is not None:
+            output.close()
+
+    return files
+
+
+def read_output_lines(content: str) -> Iterator[Tuple[str, Optional[Dict[str, Any]], Optional[str]]]:
+    """
+    Parse a batch output or error file
+
+    Yields:
+        custom_id, and either the response body or an error message
+    """
+    for line in content.splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        response = record.get("response") or {}
+        if response.get("status_code") == 200 and not record.get("error"):
+            yield record["custom_id"], response.get("body"), None
+        else:
+            error = record.get("error") or (response.get("body") or {}).get("error") or {}
+            message = error.get("message") if isinstance(error, dict) else str(error)
+            yield record["custom_id"], None, message or f"Batch request failed with status {response.get('status_code')}"
+
+
+class ProviderBatchRun:
+    """Drives one resumable batch run through its steps"""
+
+    def __init__(
+        self,
+        state: BatchState,
+        pipeline: ExtractionPipeline,
+        ocr_cache: ResultCache,
+        result_cache: Optional[ResultCache],
+        output_path: str,
+        parser: Optional[MistralDocumentParser] = None
+    ):
+        """
+        Args:
+            state: State of the run, created empty for a new run
+            pipeline: Offline pipeline with the current prompt and models
+            ocr_cache: Cache of OCR pages written by MistralDocumentParser
+            result_cache: Optional result cache to refresh
+            output_path: JSONL file results are appended to
+            parser: Mistral parser for the ocr step, if documents are given
+        """
+        self.state = state
+        self.pipeline = pipeline
+        self.extractor = pipeline.extractor
+        self.ocr_cache = ocr_cache
+        self.result_cache = result_cache
+        self.output_path = output_path
+        self.parser = parser
+
+        if self.state.get("version") is None:
+            self.state["version"] = pipeline.version
+        elif self.state["version"] != pipeline.version:
+            raise ValueError(
+                f"State directory belongs to a run for {self.state['version']}, not {pipeline.version}; use a new one"
+            )
+
+    def prepare_ocr(self, documents_dir: str, limit: Optional[int] = None) -> None:
+        """Pack the files without cached OCR into Mistral batch OCR input files"""
+        if self.state.get("ocr_jobs") is not None:
+            return
+
+        filenames: Dict[str, str] = {}
+
+        def documents() -> Iterator[Tuple[str, List[Dict[str, Any]]]]:
+            for path in sorted(Path(documents_dir).rglob("*")):
+                if limit is not None and len(filenames) >= limit:
+                    return
+                if not path.is_file() or path.suffix.lower() not in MistralDocumentParser.SUPPORTED_FORMATS:
+                    continue
+                if path.stat().st_size > MistralDocumentParser.MAX_FILE_SIZE:
+                    print(f"Warning: Batch - skipping {path}: larger than the OCR limit")
+                    continue
+
+                document_hash = ResultCache.document_hash(path)
+                if document_hash in filenames or self.ocr_cache.get(
+                    self.ocr_cache.make_key(document_hash, self.pipeline.parser.ocr_version)
+                ) is not None:
+                    continue
+
+                filenames[document_hash] = path.name
+                yield document_hash, [self.parser.batch_request(document_hash, path, path.name)]
+
+        self.state["ocr_jobs"] = write_input_files(self.state.dir, "mistral-ocr", documents())
+        self.state["ocr_filenames"] = filenames
+        self.state.save()
+        print(f"OCR: {len(filenames)} documents in {len(self.state['ocr_jobs'])} batch files")
+
+    def submit_ocr(self) -> None:
+        client = self.parser.client
+        for job in self.state["ocr_jobs"]:
+            if job.get("id") is not None:
+                continue
+
+            with open(self.state.dir / job["input"], "rb") as f:
+                uploaded = self.parser.resilience.call_sync(
+                    lambda: client.files.upload(file={"file_name": job["input"], "content": f}, purpose="batch")
+                )
+            created = self.parser.resilience.call_sync(lambda: client.batch.jobs.create(
+                input_files=[uploaded.id],
+                endpoint="/v1/ocr",
+                model=MistralDocumentParser.OCR_MODEL,
+                metadata={"input": job["input"]}
+            ))
+            job.update(id=created.id, status=created.status)
+            self.state.save()
+
+    def poll_ocr(self) -> bool:
+        """Refresh the OCR jobs; True once all have finished"""
+        client = self.parser.client
+        for job in self.state["ocr_jobs"]:
+            if job["status"] in MISTRAL_FINISHED:
+                continue
+
+            current = self.parser.resilience.call_sync(lambda: client.batch.jobs.get(job_id=job["id"]))
+            # Unset file ids come back as a falsy sentinel, not None
+            job.update(status=current.status, output_file=current.output_file or None, error_file=current.error_file or None)
+            self.state.save()
+
+        return all(job["status"] in MISTRAL_FINISHED for job in self.state["ocr_jobs"])
+
+    def merge_ocr(self) -> None:
+        """Store the pages of finished OCR jobs in the OCR cache"""
+        client = self.parser.client
+        for job in self.state["ocr_jobs"]:
+            if job.get("merged") or job["status"] not in MISTRAL_FINISHED:
+                continue
+
+            stored = failed = 0
+            for file_id in (job.get("output_file"), job.get("error_file")):
+                if not file_id:
+                    continue
+                content = self.parser.resilience.call_sync(lambda: client.files.download(file_id=file_id).read())
+                for document_hash, body, error in read_output_lines(content.decode("utf-8")):
+                    try:
+                        if error is not None:
+                            raise ValueError(error)
+                        self.parser.store_batch_response(document_hash, self.state["ocr_filenames"][document_hash], body)
+                        stored += 1
+                    except ValueError as e:
+                        print(f"Warning: Batch - OCR failed for {document_hash}: {str(e)}")
+                        failed += 1
+
+            # Documents missing from both files were never processed (e.g. the job timed out)
+            missing = len(job["documents"]) - stored - failed
+            job.update(merged=True, stored=stored, failed=failed + missing)
+            self.state.save()
+            print(f"OCR {job['input']}: {stored} cached, {failed + missing} failed ({job['status']})")
+
+    def prepare(self, limit: Optional[int] = None, force: bool = False) -> None:
+        """Pack every cached document without a current result into OpenAI batch input files"""
+        if self.state.get("batches") is not None:
+            return
+
+        version = self.pipeline.version
+        plans: Dict[str, Dict[str, Any]] = {}
+        finished = 0
+
+        def documents() -> Iterator[Tuple[str, List[Dict[str, Any]]]]:
+            nonlocal finished
+            for count, (document_hash, entry) in enumerate(self.ocr_cache.iter_entries(self.pipeline.parser.ocr_version)):
+                if limit is not None and count >= limit:
+                    return
+                if not force and self.result_cache is not None and self.result_cache.get(
+                    self.result_cache.make_key(document_hash, version)
+                ) is not None:
+                    continue
+
+                pages = entry["pages"]
+                rule_result, fields = self.pipeline.rule_fields(pages)
+                if not fields:
+                    self._finish(document_hash, pages, self.pipeline.combine({}, rule_result))
+                    finished += 1
+                    continue
+
+                texts = self.pipeline.llm_inputs(pages)
+                plans[document_hash] = {"fields": fields, "chunks": len(texts), "rules": rule_result}
+                yield document_hash, [
+                    self.extractor.batch_request(f"{document_hash}:{index}", text, fields)
+                    for index, text in enumerate(texts)
+                ]
+
+        self.state["batches"] = write_input_files(self.state.dir, "openai", documents())
+        self.state["documents"] = plans
+        self.state.save()
+        print(
+            f"Prepared {len(plans)} documents in {len(self.state['batches'])} batch files; "
+            f"{finished} resolved by rules alone"
+        )
+
+    def submit(self) -> None:
+        client = self.extractor.client
+        for batch in self.state["batches"]:
+            if batch.get("id") is not None:
+                continue
+
+            if batch.get("input_file_id") is None:
+                with open(self.state.dir / batch["input"], "rb") as f:
+                    uploaded = self.extractor.resilience.call_sync(
+                        lambda: client.files.create(file=(batch["input"], f), purpose="batch")
+                    )
+                batch["input_file_id"] = uploaded.id
+                self.state.save()
+
+            created = self.extractor.resilience.call_sync(lambda: client.batches.create(
+                input_file_id=batch["input_file_id"],
+                endpoint=self.extractor.BATCH_ENDPOINT,
+                completion_window="24h",
+                metadata={"input": batch["input"], "version": self.pipeline.version}
+            ))
+            batch.update(id=created.id, status=created.status)
+            self.state.save()
+
+    def poll(self) -> bool:
+        """Refresh the batches; True once all have finished"""
+        client = self.extractor.client
+        for batch in self.state["batches"]:
+            if batch["status"] in OPENAI_FINISHED:
+                continue
+
+            current = self.extractor.resilience.call_sync(lambda: client.batches.retrieve(batch["id"]))
+            batch.update(
+                status=current.status,
+                output_file_id=current.output_file_id,
+                error_file_id=current.error_file_id
+            )
+            self.state.save()
+
+        return all(batch["status"] in OPENAI_FINISHED for batch in self.state["batches"])
+
+    def merge(self) -> None:
+        """Write the results of finished batches, one output line per document"""
+        client = self.extractor.client
+        for batch in self.state["batches"]:
+            if batch.get("merged") or batch["status"] not in OPENAI_FINISHED:
+                continue
+
+            chunks: Dict[str, Dict[int, Dict[str, Any]]] = {}
+            errors: Dict[str, str] = {}
+            for file_id in (batch.get("output_file_id"), batch.get("error_file_id")):
+                if not file_id:
+                    continue
+                content = self.extractor.resilience.call_sync(lambda: client.files.content(file_id).text)
+                for custom_id, body, error in read_output_lines(content):
+                    document_hash, _, index = custom_id.rpartition(":")
+                    plan = self.state["documents"][document_hash]
+                    try:
+                        if error is not None:
+                            raise ValueError(error)
+                        chunks.setdefault(document_hash, {})[int(index)] = self.extractor.parse_batch_response(body, plan["fields"])
+                    except (ValueError, KeyError, IndexError) as e:
+                        errors[document_hash] = str(e)
+
+            merged = failed = 0
+            for document_hash in batch["documents"]:
+                plan = self.state["documents"][document_hash]
+                results = chunks.get(document_hash, {})
+                if document_hash in errors or len(results) < plan["chunks"]:
+                    self._write({
+                        "document_hash": document_hash,
+                        "error": errors.get(document_hash, f"Batch {batch['status']} before the document was processed")
+                    })
+                    failed += 1
+                    continue
+
+                ordered = [results[index] for index in range(plan["chunks"])]
+                llm_result = ordered[0] if len(ordered) == 1 else merge_chunk_results(ordered, plan["fields"])
+                entry = self.ocr_cache.get(self.ocr_cache.make_key(document_hash, self.pipeline.parser.ocr_version))
+                pages = entry["pages"] if entry is not None else []
+                self._finish(document_hash, pages, self.pipeline.combine(llm_result, plan["rules"]))
+                merged += 1
+
+            batch.update(merged=True, results=merged, failed=failed)
+            self.state.save()
+            print(f"{batch['input']}: {merged} results, {failed} failed ({batch['status']})")
+
+    def _finish(self, document_hash: str, pages: List[str], result: Dict[str, Any]) -> None:
+        """Cache a document's result and append it to the output"""
+        if self.result_cache is not None:
+            self.result_cache.set(
+                self.result_cache.make_key(document_hash, self.pipeline.version),
+                {"markdown": '\n\n'.join(pages), "result": result}
+            )
+        self._write({"document_hash": document_hash, "result": result})
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        # Appended, so resumed runs keep earlier lines
+        with open(self.output_path, "a", encoding="utf-8") as output:
+            output.write(json.dumps(record) + "\n")
+
+    def run(
+        self,
+        documents_dir: Optional[str] = None,
+        limit: Optional[int] = None,
+        force: bool = False,
+        wait: bool = False,
+        poll_seconds: float = 60
+    ) -> bool:
+        """
+        Take the run as far as it can go
+
+        Returns:
+            True once every batch has been merged; False if batches are still
+            running (run again later, or pass wait=True)
+        """
+        if documents_dir is not None:
+            self.prepare_ocr(documents_dir, limit)
+            self.submit_ocr()
+            while not self.poll_ocr():
+                if not wait:
+                    print("OCR batches still running; run again later to continue")
+                    return False
+                time.sleep(poll_seconds)
+            self.merge_ocr()
+
+        self.prepare(limit, force)
+        self.submit()
+        while not self.poll():
+            # Merge what has finished, so results arrive as batches complete
+            self.merge()
+            if not wait:
+                print("Batches still running; run again later to continue")
+                return False
+            time.sleep(poll_seconds)
+        self.merge()
+        return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-extract cached OCR output through the provider batch APIs")
+    parser.add_argument("--state-dir", required=True, help="Directory for the run's state and batch files")
+    parser.add_argument("--output", required=True, help="JSONL file to append results to")
+    parser.add_argument("--documents", default=None, help="Directory of files to OCR with Mistral batch jobs first")
+    parser.add_argument("--limit", type=int, default=None, help="Maximum number of documents")
+    parser.add_argument("--force", action="store_true", help="Re-extract documents that already have a current result")
+    parser.add_argument("--wait", action="store_true", help="Poll until every batch has finished")
+    parser.add_argument("--poll-seconds", type=float, default=60, help="Seconds between polls with --wait")
+    args = parser.parse_args()
+
+    ocr_cache, result_cache = caches_from_settings()
+
+    mistral = None
+    if args.documents is not None:
+        mistral = MistralDocumentParser(
+            api_key=settings.mistral_api_key,
+            ocr_cache=ocr_cache,
+            include_images=settings.mistral_include_images,
+            local_extractor=LocalTextExtractor(settings.local_min_page_chars) if settings.local_extraction_enabled else None,
+            resilience=caller_from_settings("Mistral", settings),
+            server_url=settings.mistral_server_url
+        )
+
+    try:
+        run = ProviderBatchRun(
+            BatchState(args.state_dir),
+            pipeline_from_settings(mistral),
+            ocr_cache,
+            result_cache,
+            args.output,
+            parser=mistral
+        )
+    except ValueError as e:
+        raise SystemExit(str(e))
+
+    if run.run(args.documents, args.limit, args.force, args.wait, args.poll_seconds):
+        print(f"Batch run complete; results in {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+import asyncio
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlite_fork import ForkSafeSQLite
+
+# (key, amount to take, capacity, refill per second)
+Bucket = Tuple[str, float, float, float]
+
+
+def _take(levels: Dict[str, Tuple[float, float]], buckets: List[Bucket], now: float) -> Tuple[float, Dict[str, Tuple[float, float]]]:
+    """
+    Refill the buckets and take from all of them, or from none
+
+    Args:
+        levels: Stored (tokens, updated_at) per bucket key; missing keys are full
+        buckets: Buckets to take from
+        now: Current time in seconds
+
+    Returns:
+        Seconds until every bucket can cover its amount (0 if taken), and
+        the new (tokens, updated_at) of each bucket when taken
+    """
+    refilled = {}
+    wait = 0.0
+    for key, amount, capacity, rate in buckets:
+        tokens, updated = levels.get(key, (capacity, now))
+        tokens = min(capacity, tokens + max(0.0, now - updated) * rate)
+        refilled[key] = tokens
+        if tokens < amount:
+            wait = max(wait, (amount - tokens) / rate)
+
+    if wait > 0:
+        return wait, {}
+
+    return 0.0, {key: (refilled[key] - amount, now) for key, amount, _, _ in buckets}
+
+
+class RateLimitBackend:
+    """Interface for token-bucket storage"""
+
+    name = "base"
+
+    def take(self, buckets: List[Bucket]) -> float:
+        """
+        Atomically take from every bucket, or from none of them
+
+        Returns:
+            0 if taken, otherwise seconds until the buckets can cover the amounts
+        """
+        raise NotImplementedError
+
+
+class MemoryRateLimitBackend(RateLimitBackend):
+    """Buckets held in process memory (limits apply per worker process)"""
+
+    name = "memory"
+
+    def __init__(self):
+        self._levels: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def take(self, buckets: List[Bucket]) -> float:
+        with self._lock:
+            wait, updated = _take(self._levels, buckets, time.monotonic())
+            self._levels.update(updated)
+            return wait
+
+
+class SQLiteRateLimitBackend(ForkSafeSQLite, RateLimitBackend):
+    """Buckets in a SQLite file, shared by every worker process on the host"""
+
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._open()
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_limits ("
+            "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+
+    def take(self, buckets: List[Bucket]) -> float:
+        keys = [bucket[0] for bucket in buckets]
+        with self._lock:
+            # The write lock serialises takes across processes
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    f"SELECT key, tokens, updated_at FROM rate_limits WHERE key IN ({','.join('?' * len(keys))})",
+                    keys
+                ).fetchall()
+                wait, updated = _take({key: (tokens, at) for key, tokens, at in rows}, buckets, time.time())
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO rate_limits (key, tokens, updated_at) VALUES (?, ?, ?)",
+                    [(key, tokens, at) for key, (tokens, at) in updated.items()]
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            return wait
+
+
+class RedisRateLimitBackend(RateLimitBackend):
+    """Buckets in Redis, shared by every process using the same server"""
+
+    name = "redis"
+
+    # Refill and take in one atomic step, using the server clock
+    SCRIPT = """
+    local time = redis.call('TIME')
+    local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+    local levels = {}
+    local wait = 0
+    for i = 1, #KEYS do
+        local amount = tonumber(ARGV[i * 3 - 2])
+        local capacity = tonumber(ARGV[i * 3 - 1])
+        local rate = tonumber(ARGV[i * 3])
+        local state = redis.call('HMGET', KEYS[i], 'tokens', 'updated_at')
+        local tokens = tonumber(state[1]) or capacity
+        local updated = tonumber(state[2]) or now
+        tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+        levels[i] = tokens
+        if tokens < amount then
+            wait = math.max(wait, (amount - tokens) / rate)
+        end
+    end
+    if wait > 0 then
+        return tostring(wait)
+    end
+    for i = 1, #KEYS do
+        local capacity = tonumber(ARGV[i * 3 - 1])
+        local rate = tonumber(ARGV[i * 3])
+        redis.call('HSET', KEYS[i], 'tokens', tostring(levels[i] - tonumber(ARGV[i * 3 - 2])), 'updated_at', tostring(now))
+        redis.call('EXPIRE', KEYS[i], math.ceil(capacity / rate) + 60)
+    end
+    return '0'
+    """
+
+    def __init__(self, client, prefix: str = "beshak:ratelimit:"):
+        self.client = client
+        self.prefix = prefix
+        self._script = client.register_script(self.SCRIPT)
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisRateLimitBackend":
+        """Create a backend from a redis:// URL"""
+        try:
+            import redis
+        except ImportError:
+            raise ValueError("Redis rate limit backend requires the 'redis' package")
+
+        return cls(redis.Redis.from_url(url))
+
+    def take(self, buckets: List[Bucket]) -> float:
+        args = []
+        for _, amount, capacity, rate in buckets:
+            args.extend([amount, capacity, rate])
+        result = self._script(keys=[self.prefix + bucket[0] for bucket in buckets], args=args)
+        return float(result.decode('utf-8') if isinstance(result, bytes) else result)
+
+
+class RateLimiter:
+    """
+    Client-side token-bucket limiter for one provider's quotas
+
+    Each quota (e.g. requests and tokens per minute) is a bucket that holds
+    one minute's allowance and refills continuously. A request waits until
+    every bucket can cover its estimated cost, then takes from all of them
+    at once. Waiters in a process are served strictly in arrival order, so
+    a large request is not starved by a stream of small ones.
+    """
+
+    def __init__(self, name: str, limits: Dict[str, float], backend: RateLimitBackend):
+        """
+        Args:
+            name: Provider name, used in bucket keys and warnings
+            limits: Allowance per minute keyed by unit, e.g. {"requests": 500,
+                "tokens": 200000}; units that are 0 are not limited
+            backend: Where bucket levels are stored
+        """
+        self.name = name
+        self.limits = {unit: limit for unit, limit in limits.items() if limit > 0}
+        self.backend = backend
+        self._queue = asyncio.Lock()
+        self._sync_queue = threading.Lock()
+        self.stats = {"queue_depth": 0, "acquired": 0, "delayed": 0, "wait_seconds_total": 0.0, "max_wait_seconds": 0.0}
+
+    def _buckets(self, costs: Dict[str, float]) -> List[Bucket]:
+        buckets = []
+        for unit, limit in self.limits.items():
+            # A request larger than the whole allowance would never fit
+            amount = min(float(costs.get(unit, 0)), limit)
+            if amount > 0:
+                buckets.append((f"{self.name.lower()}:{unit}", amount, limit, limit / 60))
+        return buckets
+
+    def _try_take(self, buckets: List[Bucket]) -> float:
+        try:
+            return self.backend.take(buckets)
+        except Exception as e:
+            # Fail open: a broken limiter backend must not stop extraction
+            print(f"Warning: Rate limit - {self.name} {self.backend.name} backend failed: {str(e)}")
+            return 0.0
+
+    async def acquire(self, costs: Dict[str, float]) -> float:
+        """
+        Wait until the provider quotas allow a request of the given cost
+
+        Args:
+            costs: Estimated cost keyed by unit, e.g. {"requests": 1, "tokens": 3200}
+
+        Returns:
+            Seconds spent waiting
+        """
+        buckets = self._buckets(costs)
+        if not buckets:
+            return 0.0
+
+        started = time.monotonic()
+        self.stats["queue_depth"] += 1
+        try:
+            async with self._queue:
+                while True:
+                    # SQLite and Redis round trips must not block the event loop
+                    wait = await asyncio.to_thread(self._try_take, buckets)
+                    if wait <= 0:
+                        break
+                    await asyncio.sleep(wait)
+        finally:
+            self.stats["queue_depth"] -= 1
+
+        return self._record(time.monotonic() - started)
+
+    def acquire_sync(self, costs: Dict[str, float]) -> float:
+        """Blocking variant of acquire"""
+        buckets = self._buckets(costs)
+        if not buckets:
+            return 0.0
+
+        started = time.monotonic()
+        self.stats["queue_depth"] += 1
+        try:
+            with self._sync_queue:
+                while True:
+                    wait = self._try_take(buckets)
+                    if wait <= 0:
+                        break
+                    time.sleep(wait)
+        finally:
+            self.stats["queue_depth"] -= 1
+
+        return self._record(time.monotonic() - started)
+
+    def _record(self, waited: float) -> float:
+        self.stats["acquired"] += 1
+        if waited > 0.01:
+            self.stats["delayed"] += 1
+            self.stats["wait_seconds_total"] += waited
+            self.stats["max_wait_seconds"] = max(self.stats["max_wait_seconds"], waited)
+        return waited
+
+    def report(self) -> Dict[str, Any]:
+        """Queue depth and wait time counters for the health endpoint"""
+        stats = dict(self.stats)
+        stats["wait_seconds_total"] = round(stats["wait_seconds_total"], 3)
+        stats["max_wait_seconds"] = round(stats["max_wait_seconds"], 3)
+        stats["limits_per_minute"] = dict(self.limits)
+        stats["backend"] = self.backend.name
+        return stats
+
+
+def build_rate_limit_backend(
+    backend: str,
+    sqlite_path: str = "rate_limit.sqlite3",
+    redis_url: str = "redis://localhost:6379/0"
+) -> RateLimitBackend:
+    """
+    Create a rate limit backend by name
+
+    Args:
+        backend: One of memory, sqlite or redis
+        sqlite_path: Database file for the sqlite backend
+        redis_url: Server URL for the redis backend
+
+    Returns:
+        Configured backend
+    """
+    backend = backend.lower()
+
+    if backend == "memory":
+        return MemoryRateLimitBackend()
+    if backend == "sqlite":
+        return SQLiteRateLimitBackend(sqlite_path)
+    if backend == "redis":
+        return RedisRateLimitBackend.from_url(redis_url)
+
+    raise ValueError(f"Unknown rate limit backend: {backend}")
+
+
+def rate_limiters_from_settings(settings) -> Dict[str, Optional[RateLimiter]]:
+    """
+    Build the Mistral and OpenAI limiters from the *_PER_MINUTE settings
+
+    Both providers share one backend. A provider without any limit
+    configured gets None, as does every provider if the backend cannot
+    be created.
+
+    Returns:
+        Limiter (or None) keyed by provider name: "mistral" and "openai"
+    """
+    limits = {
+        "mistral": {"requests": settings.mistral_requests_per_minute, "pages": settings.mistral_pages_per_minute},
+        "openai": {"requests": settings.openai_requests_per_minute, "tokens": settings.openai_tokens_per_minute}
+    }
+    limiters: Dict[str, Optional[RateLimiter]] = {name: None for name in limits}
+    if not any(limit > 0 for provider in limits.values() for limit in provider.values()):
+        return limiters
+
+    try:
+        backend = build_rate_limit_backend(
+            settings.rate_limit_backend,
+            sqlite_path=settings.rate_limit_sqlite_path,
+            redis_url=settings.rate_limit_redis_url
+        )
+    except (ValueError, OSError, sqlite3.Error) as e:
+        print(f"Warning: Rate limit - {str(e)}")
+        return limiters
+
+    for name, provider_limits in limits.items():
+        if any(limit > 0 for limit in provider_limits.values()):
+            limiters[name] = RateLimiter("Mistral" if name == "mistral" else "OpenAI", provider_limits, backend)
+    return limiters
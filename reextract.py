@@ -0,0 +1,186 @@
+"""
+Replay cached OCR pages through the OpenAI extractor without calling Mistral
+
+Usage:
+    python reextract.py --output results.jsonl [--concurrency 8] [--limit 100]
+
+Each line of the output file is a JSON object with the document hash and
+either the extracted ``result`` or an ``error``. Fresh results are also
+written to the result cache so later uploads of the same file hit it.
+"""
+import argparse
+import asyncio
+import json
+from typing import Optional, Tuple
+
+from cache import ResultCache, build_cache_backend
+from config import settings
+from http_transport import http_clients_from_settings
+from local_extractor import LocalTextExtractor
+from mistral_parser import MistralDocumentParser
+from openai_extractor import OpenAIExtractor
+from pipeline import ExtractionPipeline
+from rate_limit import rate_limiters_from_settings
+from relevance import PageRanker
+from resilience import caller_from_settings
+from rules import RuleExtractor
+
+
+async def reextract(
+    ocr_cache: ResultCache,
+    pipeline: ExtractionPipeline,
+    output_path: str,
+    result_cache: Optional[ResultCache] = None,
+    concurrency: int = 8,
+    limit: Optional[int] = None
+) -> int:
+    """
+    Re-run extraction for every document in the OCR cache
+
+    Args:
+        ocr_cache: Cache of OCR pages written by MistralDocumentParser
+        pipeline: Pipeline whose extractor has the current prompt and model
+        output_path: JSONL file to write results to
+        result_cache: Optional result cache to refresh
+        concurrency: Number of concurrent OpenAI requests
+        limit: Maximum number of documents to process
+
+    Returns:
+        Number of documents processed
+    """
+    version = pipeline.version
+    queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+    processed = 0
+
+    with open(output_path, "w", encoding="utf-8") as output:
+
+        async def worker():
+            nonlocal processed
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+
+                document_hash, entry = item
+                record = {"document_hash": document_hash}
+
+                try:
+                    record["result"] = await pipeline.extract(entry["pages"])
+                except (ValueError, RuntimeError) as e:
+                    record["error"] = str(e)
+
+                if result_cache is not None and "result" in record:
+                    result_cache.set(
+                        result_cache.make_key(document_hash, version),
+                        {"markdown": '\n\n'.join(entry["pages"]), "result": record["result"]}
+                    )
+
+                output.write(json.dumps(record) + "\n")
+                processed += 1
+
+        workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+
+        for count, item in enumerate(ocr_cache.iter_entries(pipeline.parser.ocr_version)):
+            if limit is not None and count >= limit:
+                break
+            await queue.put(item)
+
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+
+    return processed
+
+
+def caches_from_settings() -> Tuple[ResultCache, Optional[ResultCache]]:
+    """
+    Open the OCR and result caches from the cache settings
+
+    Returns:
+        OCR cache, and the result cache (None if disabled)
+
+    Raises:
+        SystemExit: If the OCR cache is disabled
+    """
+    ocr_backend = build_cache_backend(
+        settings.ocr_cache_backend,
+        ttl_seconds=settings.ocr_cache_ttl_seconds,
+        max_entries=settings.cache_max_entries,
+        sqlite_path=settings.ocr_cache_sqlite_path,
+        redis_url=settings.cache_redis_url
+    )
+    if ocr_backend is None:
+        raise SystemExit("OCR cache is disabled (OCR_CACHE_BACKEND=none); nothing to re-extract")
+
+    result_backend = build_cache_backend(
+        settings.cache_backend,
+        ttl_seconds=settings.cache_ttl_seconds,
+        max_entries=settings.cache_max_entries,
+        sqlite_path=settings.cache_sqlite_path,
+        redis_url=settings.cache_redis_url
+    )
+
+    return (
+        ResultCache(ocr_backend, namespace="ocr"),
+        ResultCache(result_backend) if result_backend is not None else None
+    )
+
+
+def pipeline_from_settings(parser: Optional[MistralDocumentParser] = None) -> ExtractionPipeline:
+    """
+    Build an offline extraction pipeline from the settings
+
+    Args:
+        parser: Mistral parser for documents that are OCR'd; by default OCR
+            is served from the cache, and the parser built here only
+            carries the local extraction settings into the pipeline and
+            OCR cache versions
+    """
+    if parser is None:
+        parser = MistralDocumentParser(
+            api_key=settings.mistral_api_key,
+            local_extractor=LocalTextExtractor(settings.local_min_page_chars) if settings.local_extraction_enabled else None,
+            server_url=settings.mistral_server_url
+        )
+
+    return ExtractionPipeline(
+        parser,
+        OpenAIExtractor(
+            api_key=settings.openai_api_key,
+            resilience=caller_from_settings("OpenAI", settings),
+            base_url=settings.openai_base_url,
+            rate_limiter=rate_limiters_from_settings(settings)["openai"],
+            http_clients=http_clients_from_settings(settings)
+        ),
+        extraction_mode=settings.extraction_mode,
+        chunk_max_chars=settings.chunk_max_chars,
+        chunk_concurrency=settings.chunk_concurrency,
+        page_ranker=PageRanker.from_prompt(OpenAIExtractor.SYSTEM_PROMPT) if settings.page_pruning_enabled else None,
+        page_token_budget=settings.page_token_budget,
+        page_neighbours=settings.page_neighbours,
+        rule_extractor=RuleExtractor() if settings.rule_extraction_enabled else None,
+        llm_streaming=settings.llm_streaming_enabled
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-extract insurance data from cached OCR output")
+    parser.add_argument("--output", required=True, help="JSONL file to write results to")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent OpenAI requests")
+    parser.add_argument("--limit", type=int, default=None, help="Maximum number of documents")
+    args = parser.parse_args()
+
+    ocr_cache, result_cache = caches_from_settings()
+    processed = asyncio.run(reextract(
+        ocr_cache,
+        pipeline_from_settings(),
+        args.output,
+        result_cache=result_cache,
+        concurrency=args.concurrency,
+        limit=args.limit
+    ))
+    print(f"Re-extracted {processed} documents to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Dict, List
+
+FIELD_PATTERN = re.compile(
+    r'^\d+\. \*\*(\w+)\*\* \(([^)]+)\)\n\s+- Alternative labels: (.+)$',
+    re.MULTILINE
+)
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough LLM token count (about 4 characters per token)"""
+    return len(text) // 4 + 1
+
+
+def _terms(text: str) -> List[str]:
+    """Unigrams and bigrams of the lowercased word tokens in text"""
+    tokens = TOKEN_PATTERN.findall(text.lower())
+    return tokens + [f"{first} {second}" for first, second in zip(tokens, tokens[1:])]
+
+
+def _label_terms(label: str) -> List[str]:
+    """Query terms for a label: its bigrams, or the word itself if single"""
+    tokens = TOKEN_PATTERN.findall(label.lower())
+    if len(tokens) == 1:
+        return tokens
+    return [f"{first} {second}" for first, second in zip(tokens, tokens[1:])]
+
+
+class PageRanker:
+    """
+    Scores OCR pages by how strongly they mention each field's labels
+
+    Pages are indexed into an inverted index of unigrams and bigrams, and
+    each field is queried with the label variants listed for it in the
+    extraction prompt, using BM25-style saturation and IDF weighting so
+    words that appear on every page (such as "policy") count for little.
+    """
+
+    K1 = 1.2
+
+    def __init__(self, field_labels: Dict[str, List[str]]):
+        """
+        Args:
+            field_labels: Label variants to search for, keyed by field name
+        """
+        self.field_terms = {
+            field: sorted({term for label in labels for term in _label_terms(label)})
+            for field, labels in field_labels.items()
+        }
+
+    @classmethod
+    def from_prompt(cls, prompt: str) -> "PageRanker":
+        """Build a ranker from the field headings and alternative labels in a prompt"""
+        field_labels = {}
+        for field, heading, labels in FIELD_PATTERN.findall(prompt):
+            field_labels[field] = [heading] + [label.strip() for label in labels.split(',')]
+
+        if not field_labels:
+            raise ValueError("No field labels found in extraction prompt")
+
+        return cls(field_labels)
+
+    def score(self, pages: List[str]) -> Dict[str, List[float]]:
+        """
+        Score every page for every field
+
+        Returns:
+            Per-field list of page scores, in page order
+        """
+        index: Dict[str, Dict[int, int]] = defaultdict(dict)
+        for page_number, page in enumerate(pages):
+            for term, count in Counter(_terms(page)).items():
+                index[term][page_number] = count
+
+        page_count = len(pages)
+        scores = {}
+        for field, terms in self.field_terms.items():
+            field_scores = [0.0] * page_count
+            for term in terms:
+                postings = index.get(term)
+                if not postings:
+                    continue
+
+                idf = math.log(1 + (page_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for page_number, count in postings.items():
+                    field_scores[page_number] += idf * count * (self.K1 + 1) / (count + self.K1)
+            scores[field] = field_scores
+
+        return scores
+
+    def select(self, pages: List[str], token_budget: int, neighbours: int = 1) -> List[int]:
+        """
+        Choose the pages to send to the LLM within a token budget
+
+        The first page (usually the policy schedule) is always kept, then
+        the best page for every field, so each field gets its strongest
+        evidence first. Next come the neighbours of those pages, since
+        tables and clauses often run across a page break, and finally each
+        field's runner-up pages (with neighbours) while budget remains.
+
+        Args:
+            pages: Markdown of each page in document order
+            token_budget: Maximum estimated tokens of page text to keep
+            neighbours: Pages either side of a chosen page to keep too
+
+        Returns:
+            Indices of the selected pages in document order
+        """
+        page_tokens = [estimate_tokens(page) for page in pages]
+        if sum(page_tokens) <= token_budget:
+            return list(range(len(pages)))
+
+        scores = self.score(pages)
+        rankings = [
+            [page for page in sorted(range(len(pages)), key=lambda page: (-field_scores[page], page))
+             if field_scores[page] > 0]
+            for field_scores in scores.values()
+        ]
+
+        best_pages = [0] + [ranking[0] for ranking in rankings if ranking]
+        priority = best_pages + [
+            page + offset
+            for page in best_pages
+            for offset in range(-neighbours, neighbours + 1) if offset
+        ]
+        for rank in range(1, max((len(ranking) for ranking in rankings), default=0)):
+            for ranking in rankings:
+                if rank < len(ranking):
+                    page = ranking[rank]
+                    priority.extend([page] + [page + offset for offset in range(-neighbours, neighbours + 1) if offset])
+
+        selected = set()
+        used_tokens = 0
+        for page in priority:
+            if page in selected or not 0 <= page < len(pages):
+                continue
+            if used_tokens + page_tokens[page] > token_budget:
+                continue
+            selected.add(page)
+            used_tokens += page_tokens[page]
+
+        return sorted(selected)
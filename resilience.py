@@ -0,0 +1,588 @@
+import asyncio
+import math
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+import httpx
+
+from tracing import add_event, set_attributes, span
+
+T = TypeVar("T")
+
+# Statuses worth retrying: timeouts, conflicts, rate limits and server errors
+RETRYABLE_STATUS_CODES = {408, 409, 425, 429, 500, 502, 503, 504}
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    """HTTP status of a provider SDK error (OpenAI and Mistral both expose one)"""
+    status = getattr(error, "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def _headers(error: BaseException) -> Optional[httpx.Headers]:
+    headers = getattr(error, "headers", None)
+    if headers is None:
+        response = getattr(error, "response", None) or getattr(error, "raw_response", None)
+        headers = getattr(response, "headers", None)
+    return headers
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether an error is transient: a retryable status, timeout or connection failure"""
+    status = _status_code(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES
+
+    if isinstance(error, (httpx.TransportError, asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+
+    # openai.APIConnectionError / APITimeoutError wrap the httpx error
+    cause = error.__cause__ or error.__context__
+    return isinstance(cause, httpx.TransportError)
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Seconds the provider asked us to wait (Retry-After / retry-after-ms), if any"""
+    headers = _headers(error)
+    if not headers:
+        return None
+
+    milliseconds = headers.get("retry-after-ms")
+    if milliseconds:
+        try:
+            return max(0.0, float(milliseconds) / 1000)
+        except ValueError:
+            pass
+
+    value = headers.get("retry-after")
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryBudget:
+    """
+    Caps retries to a fraction of recent traffic
+
+    Every call deposits `ratio` tokens and every retry (or hedged request)
+    withdraws one, up to `reserve` tokens banked. During an outage retries
+    dry up instead of multiplying the load on the provider.
+    """
+
+    def __init__(self, ratio: float = 0.2, reserve: float = 10.0):
+        self.ratio = ratio
+        self.reserve = reserve
+        self._balance = reserve
+        self._lock = threading.Lock()
+
+    def deposit(self) -> None:
+        with self._lock:
+            self._balance = min(self.reserve, self._balance + self.ratio)
+
+    def withdraw(self) -> bool:
+        """Take one retry from the budget; False if it is exhausted"""
+        with self._lock:
+            if self._balance < 1:
+                return False
+            self._balance -= 1
+            return True
+
+    @property
+    def balance(self) -> float:
+        return self._balance
+
+
+class LatencyTracker:
+    """Sliding window of call latencies, used to pick the hedging delay"""
+
+    def __init__(self, window: int = 200):
+        self._samples: deque = deque(maxlen=window)
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+
+def latency_kind(name: str, size: float) -> str:
+    """
+    Class of calls whose latencies are comparable: a call name plus its
+    size (tokens, pages) rounded down to a power of two
+
+    A small call's p95 would hedge nearly every large call, and a large
+    call's p95 would never hedge a small one.
+    """
+    return f"{name}:{2 ** int(math.log2(max(size, 1)))}"
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling a provider whose circuit breaker is open"""
+
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"{name} is unavailable (circuit breaker open, retry in {retry_in:.0f}s)")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """
+    Fails calls to a provider fast while it is failing or too slow
+
+    Closed, it records the outcome of every call in a sliding window and
+    opens once the window holds at least `min_calls` outcomes and the
+    share of transient failures or of calls slower than
+    `slow_call_seconds` reaches its threshold. Open, it rejects calls for
+    `open_seconds`, then lets `half_open_calls` probe calls through: if
+    they all succeed it closes again, if any fails it reopens.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name: str,
+        failure_rate_threshold: float = 0.5,
+        slow_call_rate_threshold: float = 0.5,
+        slow_call_seconds: float = 60.0,
+        window: int = 20,
+        min_calls: int = 10,
+        open_seconds: float = 30.0,
+        half_open_calls: int = 1
+    ):
+        """
+        Args:
+            name: Provider name, used in errors and warnings
+            failure_rate_threshold: Share of failed calls that opens the circuit
+            slow_call_rate_threshold: Share of slow calls that opens the circuit
+            slow_call_seconds: Calls taking longer than this count as slow
+            window: Number of recent calls considered
+            min_calls: Calls needed in the window before it can open
+            open_seconds: How long the circuit stays open before probing
+            half_open_calls: Probe calls allowed while half-open
+        """
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.min_calls = max(1, min_calls)
+        self.open_seconds = open_seconds
+        self.half_open_calls = max(1, half_open_calls)
+        self.state = self.CLOSED
+        self.stats = {"opened": 0, "rejected": 0}
+        self._outcomes: deque = deque(maxlen=max(self.min_calls, window))
+        self._opened_at = 0.0
+        self._probes = 0
+        self._probe_successes = 0
+        self._lock = threading.Lock()
+
+    def before_call(self) -> None:
+        """
+        Admit a call, or reject it while the circuit is open
+
+        Raises:
+            CircuitOpenError: If the circuit is open, or half-open with
+                all probe calls already in flight
+        """
+        with self._lock:
+            if self.state == self.OPEN:
+                remaining = self._opened_at + self.open_seconds - time.monotonic()
+                if remaining > 0:
+                    self.stats["rejected"] += 1
+                    raise CircuitOpenError(self.name, remaining)
+                self.state = self.HALF_OPEN
+                self._probes = 0
+                self._probe_successes = 0
+
+            if self.state == self.HALF_OPEN:
+                if self._probes >= self.half_open_calls:
+                    self.stats["rejected"] += 1
+                    raise CircuitOpenError(self.name, self.open_seconds)
+                self._probes += 1
+
+    def after_call(self, error: Optional[BaseException], seconds: float) -> None:
+        """
+        Record the outcome of an admitted call
+
+        Only transient errors (see is_retryable) count as failures; a
+        rejected request still shows the provider is up.
+        """
+        failed = error is not None and is_retryable(error)
+        slow = seconds > self.slow_call_seconds
+
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                if failed or slow:
+                    self._open()
+                    return
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_calls:
+                    print(f"Warning: {self.name} - circuit breaker closed")
+                    self.state = self.CLOSED
+                    self._outcomes.clear()
+                return
+
+            if self.state == self.OPEN:
+                return  # a call admitted before the circuit opened
+
+            self._outcomes.append((failed, slow))
+            if len(self._outcomes) < self.min_calls:
+                return
+
+            failure_rate = sum(outcome[0] for outcome in self._outcomes) / len(self._outcomes)
+            slow_rate = sum(outcome[1] for outcome in self._outcomes) / len(self._outcomes)
+            if failure_rate >= self.failure_rate_threshold or slow_rate >= self.slow_call_rate_threshold:
+                self._open()
+
+    def cancel_call(self) -> None:
+        """Release an admitted call that was cancelled before it finished"""
+        with self._lock:
+            if self.state == self.HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+    def _open(self) -> None:
+        print(f"Warning: {self.name} - circuit breaker opened for {self.open_seconds:.0f}s")
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        self.stats["opened"] += 1
+
+    def report(self) -> Dict[str, Any]:
+        """State and counters for the health endpoint"""
+        with self._lock:
+            outcomes = list(self._outcomes)
+            retry_in = None
+            if self.state == self.OPEN:
+                retry_in = round(max(0.0, self._opened_at + self.open_seconds - time.monotonic()), 1)
+
+        return {
+            "state": self.state,
+            "retry_in_seconds": retry_in,
+            "window_calls": len(outcomes),
+            "failure_rate": round(sum(outcome[0] for outcome in outcomes) / len(outcomes), 3) if outcomes else 0.0,
+            "slow_call_rate": round(sum(outcome[1] for outcome in outcomes) / len(outcomes), 3) if outcomes else 0.0,
+            **self.stats
+        }
+
+
+class ResilientCaller:
+    """
+    Retry and hedging policy for calls to one upstream provider
+
+    Transient failures (see is_retryable) are retried with exponential
+    backoff and full jitter, honouring Retry-After when the provider sends
+    it, while the shared RetryBudget allows. With hedging enabled, an async
+    call still running after the observed p95 latency of calls of its kind
+    (see latency_kind) is duplicated and the first successful response
+    wins. Every attempt, retry and hedge passes through the optional
+    CircuitBreaker.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_attempts: int = 4,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30.0,
+        budget: Optional[RetryBudget] = None,
+        hedging: bool = False,
+        hedge_min_samples: int = 20,
+        breaker: Optional[CircuitBreaker] = None
+    ):
+        """
+        Args:
+            name: Provider name, used in warnings and stats
+            max_attempts: Attempts per call, including the first
+            backoff_base: Delay cap before the first retry, doubled per retry
+            backoff_max: Longest delay between attempts; a Retry-After
+                longer than this fails the call instead of waiting
+            budget: Retry budget shared by all calls to this provider
+            hedging: Send a second request when one exceeds p95 latency
+            hedge_min_samples: Latency samples needed before hedging starts
+            breaker: Optional circuit breaker; while it is open calls raise
+                CircuitOpenError without reaching the provider
+        """
+        self.name = name
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.budget = budget or RetryBudget()
+        self.hedging = hedging
+        self.hedge_min_samples = hedge_min_samples
+        self.latencies: Dict[str, LatencyTracker] = defaultdict(LatencyTracker)
+        self.breaker = breaker
+        self._span_name = f"{name.lower()}.attempt"
+        self.stats = {"calls": 0, "retries": 0, "budget_exhausted": 0, "hedges": 0, "hedge_wins": 0}
+
+    def backoff(self, attempt: int, error: BaseException) -> Optional[float]:
+        """
+        Delay before retrying after the given failed attempt (1-based)
+
+        Returns:
+            Seconds to wait, or None if the call should not be retried
+        """
+        if attempt >= self.max_attempts or not is_retryable(error):
+            return None
+
+        requested = retry_after(error)
+        if requested is not None:
+            return requested if requested <= self.backoff_max else None
+
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+
+    def _retry_delay(self, attempt: int, error: BaseException) -> Optional[float]:
+        delay = self.backoff(attempt, error)
+        if delay is None:
+            return None
+
+        if not self.budget.withdraw():
+            self.stats["budget_exhausted"] += 1
+            return None
+
+        self.stats["retries"] += 1
+        add_event("retry", **{"retry.delay_seconds": round(delay, 3), "error.type": type(error).__name__})
+        print(f"Warning: {self.name} - retrying in {delay:.1f}s after attempt {attempt}: {str(error)}")
+        return delay
+
+    def call_sync(
+        self,
+        fn: Callable[[], T],
+        acquire: Optional[Callable[[], None]] = None,
+        kind: str = "call"
+    ) -> T:
+        """
+        Call fn, retrying transient failures (no hedging)
+
+        Args:
+            fn: The provider request
+            acquire: Optional wait for client-side quota, run before every
+                attempt; it is not timed as provider latency
+            kind: Latency class of the call (see latency_kind)
+        """
+        self.stats["calls"] += 1
+        self.budget.deposit()
+
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                with span(self._span_name, kind="client", **{"retry.attempt": attempt}):
+                    return self._guard_sync(fn, acquire, kind)
+            except Exception as e:
+                delay = self._retry_delay(attempt, e)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+
+    def _guard_sync(self, fn: Callable[[], T], acquire: Optional[Callable[[], None]], kind: str) -> T:
+        """Wait for quota, then call fn through the circuit breaker, timing only fn"""
+        if self.breaker is not None:
+            self.breaker.before_call()
+        try:
+            if acquire is not None:
+                acquire()
+        except BaseException:
+            if self.breaker is not None:
+                self.breaker.cancel_call()
+            raise
+
+        started = time.monotonic()
+        try:
+            result = fn()
+        except Exception as e:
+            if self.breaker is not None:
+                self.breaker.after_call(e, time.monotonic() - started)
+            raise
+        except BaseException:
+            if self.breaker is not None:
+                self.breaker.cancel_call()
+            raise
+        self._record_success(kind, time.monotonic() - started)
+        return result
+
+    async def _guard(
+        self,
+        fn: Callable[[], Awaitable[T]],
+        acquire: Optional[Callable[[], Awaitable[None]]],
+        kind: str,
+        sent: Optional[asyncio.Event] = None
+    ) -> T:
+        """
+        Wait for quota, then await fn() through the circuit breaker
+
+        Only fn() is timed for the slow-call rate and the hedging latency:
+        waiting for our own rate limiter says nothing about the provider.
+        sent, if given, is set once the quota wait is over.
+        """
+        if self.breaker is not None:
+            self.breaker.before_call()
+        try:
+            if acquire is not None:
+                await acquire()
+        except BaseException:
+            if self.breaker is not None:
+                self.breaker.cancel_call()
+            raise
+        finally:
+            if sent is not None:
+                sent.set()
+
+        started = time.monotonic()
+        try:
+            result = await fn()
+        except Exception as e:
+            if self.breaker is not None:
+                self.breaker.after_call(e, time.monotonic() - started)
+            raise
+        except BaseException:
+            # A hedge that lost the race, or a disconnected client
+            if self.breaker is not None:
+                self.breaker.cancel_call()
+            raise
+        self._record_success(kind, time.monotonic() - started)
+        return result
+
+    def _record_success(self, kind: str, seconds: float) -> None:
+        if self.breaker is not None:
+            self.breaker.after_call(None, seconds)
+        self.latencies[kind].record(seconds)
+
+    async def call(
+        self,
+        fn: Callable[[], Awaitable[T]],
+        acquire: Optional[Callable[[], Awaitable[None]]] = None,
+        kind: str = "call",
+        hedge: bool = True
+    ) -> T:
+        """
+        Await fn(), retrying transient failures and hedging slow attempts
+
+        Args:
+            fn: The provider request
+            acquire: Optional wait for client-side quota, awaited before
+                every attempt and hedge; it is not timed as provider latency
+            kind: Latency class of the call (see latency_kind); it is
+                only hedged against the p95 of calls of the same kind
+            hedge: False for calls whose timing says little about their
+                cost, e.g. streams that return once headers arrive
+        """
+        self.stats["calls"] += 1
+        self.budget.deposit()
+
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                with span(self._span_name, kind="client", **{"retry.attempt": attempt}):
+                    return await self._attempt(fn, acquire, kind, hedge)
+            except Exception as e:
+                delay = self._retry_delay(attempt, e)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+
+    def _hedge_delay(self, kind: str) -> Optional[float]:
+        latency = self.latencies.get(kind)
+        if not self.hedging or latency is None or len(latency) < self.hedge_min_samples:
+            return None
+        return latency.percentile(0.95)
+
+    async def _attempt(
+        self,
+        fn: Callable[[], Awaitable[T]],
+        acquire: Optional[Callable[[], Awaitable[None]]],
+        kind: str,
+        hedge: bool
+    ) -> T:
+        """One attempt, raced against a hedged duplicate if it runs past p95"""
+        hedge_delay = self._hedge_delay(kind) if hedge else None
+        sent = asyncio.Event()
+        primary = asyncio.ensure_future(self._guard(fn, acquire, kind, sent))
+
+        if hedge_delay is None:
+            return await primary
+
+        # Time the hedge from when the request went out, not from the quota wait
+        sending = asyncio.ensure_future(sent.wait())
+        try:
+            await asyncio.wait({primary, sending}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            sending.cancel()
+
+        done, _ = await asyncio.wait({primary}, timeout=hedge_delay)
+        if done or not self.budget.withdraw():
+            return await primary
+
+        self.stats["hedges"] += 1
+        add_event("hedge", **{"hedge.delay_seconds": round(hedge_delay, 3)})
+        hedged = asyncio.ensure_future(self._guard(fn, acquire, kind))
+        pending = {primary, hedged}
+        error: Optional[BaseException] = None
+
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self.stats["hedge_wins"] += int(task is hedged)
+                        set_attributes(**{"hedge.won": task is hedged})
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def report(self) -> Dict[str, Any]:
+        """Retry and hedging counters, and the p95 latency of each kind of call, for the health endpoint"""
+        return {
+            **self.stats,
+            "retry_budget": round(self.budget.balance, 2),
+            "p95_seconds": {
+                kind: round(latency.percentile(0.95), 3)
+                for kind, latency in sorted(self.latencies.items()) if len(latency)
+            }
+        }
+
+
+def caller_from_settings(name: str, settings) -> ResilientCaller:
+    """Build a provider's ResilientCaller from the PROVIDER_* and CIRCUIT_* settings"""
+    return ResilientCaller(
+        name,
+        max_attempts=settings.provider_max_attempts,
+        backoff_base=settings.provider_backoff_base_seconds,
+        backoff_max=settings.provider_backoff_max_seconds,
+        budget=RetryBudget(settings.provider_retry_budget_ratio, settings.provider_retry_budget_reserve),
+        hedging=settings.provider_hedging_enabled,
+        hedge_min_samples=settings.provider_hedge_min_samples,
+        breaker=CircuitBreaker(
+            name,
+            failure_rate_threshold=settings.circuit_failure_rate_threshold,
+            slow_call_rate_threshold=settings.circuit_slow_call_rate_threshold,
+            slow_call_seconds=settings.circuit_slow_call_seconds,
+            window=settings.circuit_window,
+            min_calls=settings.circuit_min_calls,
+            open_seconds=settings.circuit_open_seconds
+        ) if settings.circuit_breaker_enabled else None
+    )
@@ -0,0 +1,175 @@
+import hashlib
+import re
+from typing import Dict, List, Optional
+
+# Separator between a label and its value: colon or dash. Two-cell table
+# rows are rewritten to "label: value" first (see _TABLE_ROW_PATTERN); a
+# cell border is not a separator, or header rows would read as values.
+_SEP = r'\s*(?:\*\*)?\s*[:\-–]+\s*(?:\*\*)?\s*'
+
+# A markdown table row with exactly two cells, i.e. a vertical key/value table
+_TABLE_ROW_PATTERN = re.compile(r'^[ \t]*\|?([^|\n]*)\|([^|\n]*)\|?[ \t]*$', re.MULTILINE)
+
+# Labels found on policy schedules; a free-text "value" that is one of them
+# is the next label (e.g. "Insured Name: Date Of Birth"), not a value
+FIELD_LABEL_PATTERN = re.compile(
+    r'(?:(?:policy\s*holder|proposer|insured|customer|member|nominee|plan|product|policy|scheme)(?:\'s)?\s+)?name'
+    r'|(?:policy|certificate)\s*(?:no\.?|number|#|type|period|tenure|status|(?:start|end|issue|expiry)\s+date)'
+    r'|sum\s+(?:insured|assured)|room\s+(?:rent|category)(?:\s+limit)?|(?:initial\s+)?waiting\s+period'
+    r'|e-?mail(?:\s*(?:id|address))?|plan\s+type|date\s+of\s+birth|d\.?o\.?b\.?|age|gender|sex'
+    r'|relationship|address|(?:mobile|phone|contact)(?:\s*(?:no\.?|number))?|premium(?:\s+amount)?'
+    r'|nominee|occupation|customer\s+id|period\s+of\s+insurance',
+    re.IGNORECASE
+)
+
+EMAIL_PATTERN = re.compile(
+    r'\b(?:e-?mail(?:\s*(?:id|address))?|registered\s+email|contact\s+email)' + _SEP +
+    r'([A-Za-z0-9._%+\-]+@[A-Za-z0-9\-]+(?:\.[A-Za-z0-9\-]+)+)',
+    re.IGNORECASE
+)
+
+POLICY_NUMBER_PATTERN = re.compile(
+    r'\b(?:policy\s*(?:no\.?|number|#)|certificate\s*(?:no\.?|number))' + _SEP +
+    r'([A-Z0-9][A-Z0-9/\-]{4,}[A-Z0-9])\b',
+    re.IGNORECASE
+)
+
+NAME_PATTERN = re.compile(
+    r'\b(?:policy\s*holder(?:\'s)?\s+name|proposer(?:\'s)?\s+name|insured(?:\'s)?\s+name)' + _SEP +
+    r'((?:Mr\.?|Mrs\.?|Ms\.?|Dr\.?)?\s*[A-Za-z][A-Za-z.\']*(?:[ \t]+[A-Za-z][A-Za-z.\']*){1,4})[ \t]*(?=\||\n|$)',
+    re.IGNORECASE | re.MULTILINE
+)
+
+SUM_ASSURED_PATTERN = re.compile(
+    r'\bsum\s+(?:insured|assured)(?:\s*\(SI\))?' + _SEP +
+    r'((?:Rs\.?|INR|₹)\s*\d[\d,]*(?:\.\d+)?(?:\s*(?:lakhs?|lacs?|crores?))?)',
+    re.IGNORECASE
+)
+
+# Product name, up to the end of its line or table cell; "Policy Type" and
+# a bare "Plan" are left to the LLM, which can tell them from plan types
+POLICY_NAME_PATTERN = re.compile(
+    r'\b(?:plan|product|policy|scheme)\s+name' + _SEP +
+    r'([A-Za-z][A-Za-z0-9&\'().\-]*(?:[ \t]+[A-Za-z0-9&\'().\-]+){1,11})[ \t]*(?=\||\n|$)',
+    re.IGNORECASE | re.MULTILINE
+)
+
+# Room rent in one of the common formats: an amount per day, a share of the
+# sum insured, no limit, or a room category (ICU limits are a different field)
+ROOM_RENT_PATTERN = re.compile(
+    r'(?<!ICU )\b(?:room\s+rent(?:\s+(?:limit|eligibility|capping))?|room\s+(?:category|eligibility)|daily\s+room\s+limit)' + _SEP +
+    r'((?:Rs\.?|INR|₹)\s*\d[\d,]*(?:\.\d+)?(?:\s*/-)?(?:\s*(?:per\s+day|/\s*day))?'
+    r'|\d[\d,]*\s*(?:per\s+day|/\s*day)'
+    r'|\d+(?:\.\d+)?\s*%\s*of\s+(?:the\s+)?sum\s+(?:insured|assured)(?:\s+per\s+day)?'
+    r'|no\s+(?:limit|capping|sub-?limit)|as\s+per\s+actuals?'
+    r'|(?:single|shared|private|twin[\s-]sharing)(?:\s+(?:private|a\.?c\.?))*\s+room'
+    r'|single\s+(?:private\s+)?a\.?c\.?)',
+    re.IGNORECASE
+)
+
+# Initial waiting period (which the prompt ranks above pre-existing disease
+# ones); a bare "Waiting Period" label only counts at the start of a line
+# or table cell, so "Pre-existing Disease Waiting Period" is not taken
+WAITING_PERIOD_PATTERN = re.compile(
+    r'(?:\binitial\s+(?:waiting|cooling)\s+period|(?:^|\|)[ \t]*(?:\*\*)?[ \t]*waiting\s+period)' + _SEP +
+    r'(\d+\s*(?:days?|months?|years?)|nil|none|not\s+applicable)\b',
+    re.IGNORECASE | re.MULTILINE
+)
+
+# IRDAI unique identification numbers, e.g. SHAHLIP21211V042021
+PLAN_CODE_PATTERN = re.compile(r'\b[A-Z]{6,8}\d{5}V\d{6}\b')
+
+# An explicit plan type label takes priority over a plan code (see SYSTEM_PROMPT)
+PLAN_TYPE_LABEL_PATTERN = re.compile(
+    r'\b(?:plan\s+type|type\s+of\s+plan|plan\s+category|cover(?:age)?\s+type)\b',
+    re.IGNORECASE
+)
+
+
+def _unique(values: List[str]) -> Optional[str]:
+    """Return the value if all matches agree (ignoring case and spacing), else None"""
+    distinct = {re.sub(r'\s+', ' ', value).strip().casefold(): value.strip() for value in values}
+    if len(distinct) == 1:
+        return next(iter(distinct.values()))
+    return None
+
+
+def _two_cell_rows_as_pairs(document_text: str) -> str:
+    """Rewrite "| label | value |" table rows as "label: value" lines"""
+    return _TABLE_ROW_PATTERN.sub(
+        lambda match: match.group(1).strip(' \t*:') + ': ' + match.group(2).strip(),
+        document_text
+    )
+
+
+def _values(values: List[str]) -> List[str]:
+    """Free-text matches, without those that are really the next label"""
+    return [value for value in values if not FIELD_LABEL_PATTERN.fullmatch(value.strip(' \t*'))]
+
+
+def _strip_plan_code(value: str) -> str:
+    """Product name without a trailing plan code, which belongs in plan_type"""
+    return PLAN_CODE_PATTERN.sub('', value).strip(' \t-–,')
+
+
+class RuleExtractor:
+    """
+    Deterministic pre-extractor for fields with predictable formats
+
+    Each rule only fires on a labelled value (or, for plan codes, an IRDAI
+    identifier) and only when every match in the document agrees, so it
+    either returns a value the LLM would also have returned or nothing.
+    Free-text fields are the exception: a label can still be misread, so
+    the LLM is asked for them too whenever it is called anyway, and its
+    value wins (see ExtractionPipeline.combine).
+    """
+
+    FIELDS = [
+        "name", "policy_number", "email", "policy_name", "plan_type",
+        "sum_assured", "room_rent_limit", "waiting_period"
+    ]
+
+    FREE_TEXT_FIELDS = ["name", "policy_name"]
+
+    PATTERNS = [
+        NAME_PATTERN, POLICY_NUMBER_PATTERN, EMAIL_PATTERN, POLICY_NAME_PATTERN, SUM_ASSURED_PATTERN,
+        ROOM_RENT_PATTERN, WAITING_PERIOD_PATTERN, PLAN_CODE_PATTERN, PLAN_TYPE_LABEL_PATTERN,
+        _TABLE_ROW_PATTERN, FIELD_LABEL_PATTERN
+    ]
+
+    @property
+    def version(self) -> str:
+        """Hash of the rule fields and patterns, so changed rules invalidate cached results"""
+        source = '\n'.join(self.FIELDS + self.FREE_TEXT_FIELDS + [pattern.pattern for pattern in self.PATTERNS])
+        return hashlib.sha256(source.encode('utf-8')).hexdigest()[:12]
+
+    def extract(self, document_text: str) -> Dict[str, str]:
+        """
+        Extract the fields the rules are confident about
+
+        Args:
+            document_text: OCR markdown of the whole document
+
+        Returns:
+            Field values keyed by field name; fields not found are omitted
+        """
+        document_text = _two_cell_rows_as_pairs(document_text)
+        candidates = {
+            "name": _unique(_values(NAME_PATTERN.findall(document_text))),
+            "policy_number": _unique(
+                [value for value in POLICY_NUMBER_PATTERN.findall(document_text) if any(c.isdigit() for c in value)]
+            ),
+            "email": _unique(EMAIL_PATTERN.findall(document_text)),
+            "policy_name": _unique(
+                [_strip_plan_code(value) for value in _values(POLICY_NAME_PATTERN.findall(document_text))]
+            ),
+            "sum_assured": _unique(SUM_ASSURED_PATTERN.findall(document_text)),
+            "room_rent_limit": _unique(ROOM_RENT_PATTERN.findall(document_text)),
+            "waiting_period": _unique(WAITING_PERIOD_PATTERN.findall(document_text)),
+            "plan_type": None
+        }
+
+        if not PLAN_TYPE_LABEL_PATTERN.search(document_text):
+            candidates["plan_type"] = _unique(PLAN_CODE_PATTERN.findall(document_text))
+
+        return {field: value for field, value in candidates.items() if value}
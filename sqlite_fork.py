@@ -0,0 +1,46 @@
+"""
+SQLite connections that are reopened in forked worker processes
+
+Gunicorn imports the app in its master and then forks the workers, and a
+SQLite connection must not be used on both sides of fork(). A single
+after-fork hook gives every open store a connection of its own in the child.
+"""
+import os
+import sqlite3
+import threading
+import weakref
+
+_stores = weakref.WeakSet()
+
+
+class ForkSafeSQLite:
+    """
+    Base for stores that keep one SQLite connection behind a lock
+
+    Subclasses implement _connect and call _open from __init__ before
+    using self._conn.
+    """
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a new connection to the store's database"""
+        raise NotImplementedError
+
+    def _open(self) -> None:
+        self._lock = threading.Lock()
+        self._conn = self._connect()
+        _stores.add(self)
+
+    def _reopen_after_fork(self) -> None:
+        # The inherited connection is kept referenced, not closed, so that
+        # nothing in the child touches the parent's handle
+        self._inherited_conn = self._conn
+        self._lock = threading.Lock()
+        self._conn = self._connect()
+
+
+def _reopen_all_after_fork() -> None:
+    for store in list(_stores):
+        store._reopen_after_fork()
+
+
+os.register_at_fork(after_in_child=_reopen_all_after_fork)
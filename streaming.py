@@ -0,0 +1,88 @@
+import asyncio
+import json
+from typing import Any, AsyncIterator, Dict, Optional
+
+from models import InsuranceDataResponse
+from pipeline import ExtractionPipeline
+from resilience import CircuitOpenError
+from tracing import span
+from upload import SpooledUpload
+
+SSE_MEDIA_TYPE = "text/event-stream"
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def negotiate_media_type(accept: Optional[str]) -> str:
+    """Server-sent events if the client accepts them, NDJSON otherwise"""
+    if accept and SSE_MEDIA_TYPE in accept.lower():
+        return SSE_MEDIA_TYPE
+    return NDJSON_MEDIA_TYPE
+
+
+def format_event(event: str, data: Dict[str, Any], media_type: str) -> str:
+    """Serialise one progress event as an SSE message or an NDJSON line"""
+    if media_type == SSE_MEDIA_TYPE:
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    return json.dumps({"event": event, "data": data}) + "\n"
+
+
+async def stream_extraction(
+    pipeline: ExtractionPipeline,
+    upload: SpooledUpload,
+    media_type: str,
+    trace_parent: Optional[Any] = None
+) -> AsyncIterator[str]:
+    """
+    Run one document through the pipeline, yielding progress events as they happen
+
+    The stream starts with "accepted" and ends with either "result" (the
+    InsuranceDataResponse) or "error" (with the status code the
+    non-streaming endpoint would have returned). The spooled upload is
+    deleted when the stream ends or the client disconnects.
+
+    Args:
+        pipeline: Extraction pipeline
+        upload: Spooled upload to extract from
+        media_type: SSE_MEDIA_TYPE or NDJSON_MEDIA_TYPE
+        trace_parent: Trace context of the request, which has ended by the
+            time the stream runs
+
+    Yields:
+        Serialised events
+    """
+    events: asyncio.Queue = asyncio.Queue()
+
+    def on_event(event: str, data: Dict[str, Any]) -> None:
+        events.put_nowait((event, data))
+
+    async def run() -> None:
+        try:
+            with span("extract.stream", parent=trace_parent):
+                result = await pipeline.run(upload.path, upload.filename, upload.sha256, on_event)
+            on_event("result", InsuranceDataResponse(**result).model_dump())
+        except ValueError as e:
+            on_event("error", {"status_code": 400, "detail": str(e)})
+        except CircuitOpenError as e:
+            on_event("error", {"status_code": 503, "detail": str(e)})
+        except RuntimeError as e:
+            on_event("error", {"status_code": 500, "detail": str(e)})
+        except Exception as e:
+            on_event("error", {"status_code": 500, "detail": f"Unexpected error: {str(e)}"})
+        finally:
+            events.put_nowait(None)
+
+    yield format_event("accepted", {"filename": upload.filename, "size": upload.size}, media_type)
+
+    task = asyncio.create_task(run())
+    try:
+        while True:
+            item = await events.get()
+            if item is None:
+                break
+            yield format_event(*item, media_type)
+    finally:
+        # The client may have gone away mid-extraction
+        if not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        upload.close()
@@ -0,0 +1,135 @@
+import asyncio
+import io
+import struct
+import zipfile
+from pathlib import Path
+from typing import Dict
+
+import pytest
+from fastapi import UploadFile
+
+from batch import collect_batch_documents, run_batch, stop_batch
+
+MB = 1024 * 1024
+
+
+def upload(filename: str, content: bytes) -> UploadFile:
+    return UploadFile(io.BytesIO(content), filename=filename)
+
+
+def archive(members: Dict[str, bytes]) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
+        for name, content in members.items():
+            zip_file.writestr(name, content)
+    return buffer.getvalue()
+
+
+def collect(spool_dir: Path, *files: UploadFile, max_documents: int = 10, max_unpacked_bytes: int = 10 * MB):
+    return asyncio.run(collect_batch_documents(
+        list(files),
+        max_documents=max_documents,
+        max_archive_size=10 * MB,
+        max_unpacked_bytes=max_unpacked_bytes,
+        spool_dir=str(spool_dir)
+    ))
+
+
+def test_documents_and_archive_members_are_spooled(tmp_path):
+    documents = collect(
+        tmp_path,
+        upload("a.txt", b"Policy Number: A1"),
+        upload("b.zip", archive({"b.txt": b"Policy Number: B1", "notes.csv": b"x", "__MACOSX/._b.txt": b""})),
+    )
+
+    assert [(document.index, document.filename) for document in documents] == [(0, "a.txt"), (1, "b.txt"), (2, "notes.csv")]
+    assert documents[1].upload.path.read_bytes() == b"Policy Number: B1"
+    assert documents[2].upload is None and "Unsupported file format" in documents[2].error
+    assert len(list(tmp_path.iterdir())) == 2
+
+
+def test_batch_over_the_document_limit_is_rejected(tmp_path):
+    with pytest.raises(ValueError, match="maximum of 2 documents"):
+        collect(tmp_path, *(upload(f"{index}.txt", b"x") for index in range(3)), max_documents=2)
+
+    with pytest.raises(ValueError, match="maximum of 2 documents"):
+        collect(tmp_path, upload("a.txt", b"x"), upload("b.zip", archive({"b.txt": b"x", "c.txt": b"x"})), max_documents=2)
+
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_archives_over_the_unpacked_size_limit_are_rejected(tmp_path):
+    members = {f"{index}.txt": bytes(400 * 1024) for index in range(2)}
+
+    with pytest.raises(ValueError, match="maximum of 1MB unpacked"):
+        collect(tmp_path, upload("a.zip", archive(members)), upload("b.zip", archive(members)), max_unpacked_bytes=MB)
+
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_zip_bomb_is_rejected_before_it_is_unpacked(tmp_path):
+    bomb = archive({"bomb.txt": bytes(20 * MB)})
+    assert len(bomb) < 64 * 1024
+
+    with pytest.raises(ValueError, match="unpacked"):
+        collect(tmp_path, upload("bomb.zip", bomb), max_unpacked_bytes=MB)
+
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_zip_bomb_with_a_false_size_in_its_header_is_cut_off(tmp_path):
+    bomb = bytearray(archive({"bomb.txt": bytes(20 * MB)}))
+    # Claim 1000 bytes in both the local and the central directory header
+    struct.pack_into("<I", bomb, bomb.find(b"PK\x03\x04") + 22, 1000)
+    struct.pack_into("<I", bomb, bomb.rfind(b"PK\x01\x02") + 24, 1000)
+
+    [document] = collect(tmp_path, upload("bomb.zip", bytes(bomb)), max_unpacked_bytes=MB)
+
+    assert document.upload is None
+    assert "Bad CRC-32" in document.error
+    assert list(tmp_path.iterdir()) == []
+
+
+class SlowPipeline:
+    """Stands in for the extraction pipeline, taking a fixed time per document"""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.started = 0
+
+    async def run(self, path: Path, filename: str, document_hash: str):
+        self.started += 1
+        await asyncio.sleep(self.seconds)
+        return {}
+
+
+def test_spooled_files_are_removed_when_results_are_never_read(tmp_path):
+    documents = collect(tmp_path, upload("a.txt", b"x"), upload("b.txt", b"y"))
+    pipeline = SlowPipeline(0)
+
+    async def scenario():
+        # A streaming client that disconnects before the first result
+        results = run_batch(pipeline, documents, concurrency=2)
+        await stop_batch(results, documents)
+
+    asyncio.run(scenario())
+
+    assert pipeline.started == 0
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_stopping_a_partly_read_batch_cancels_the_rest(tmp_path):
+    documents = collect(tmp_path, upload("a.txt", b"x"), upload("bad.csv", b"y"), upload("c.txt", b"z"))
+    pipeline = SlowPipeline(10)
+
+    async def scenario():
+        results = run_batch(pipeline, documents, concurrency=1)
+        first = await results.__anext__()
+        await stop_batch(results, documents)
+        return first
+
+    first = asyncio.run(asyncio.wait_for(scenario(), timeout=5))
+
+    assert first.filename == "bad.csv"
+    assert pipeline.started == 1
+    assert list(tmp_path.iterdir()) == []
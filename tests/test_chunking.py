@@ -0,0 +1,131 @@
+import asyncio
+from typing import Any, Dict, List
+
+import pytest
+
+from chunking import merge_chunk_results, split_into_chunks
+from openai_extractor import OpenAIExtractor
+
+FIELDS = ["name", "policy_number"]
+
+
+class FakeLLM:
+    """
+    Stands in for the OpenAI call of each chunk with a canned result
+
+    Chunks can be given a delay so they complete out of document order,
+    as concurrent calls do.
+    """
+
+    def __init__(self, results: Dict[str, Dict[str, Any]], delays: Dict[str, float] = None):
+        self.results = results
+        self.delays = delays or {}
+        self.calls: List[str] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def __call__(self, document_text: str, fields: List[str] = None) -> Dict[str, Any]:
+        self.calls.append(document_text)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delays.get(document_text, 0))
+            return {field: self.results[document_text].get(field) for field in fields}
+        finally:
+            self.in_flight -= 1
+
+
+def extract_chunked(chunk_results: List[Dict[str, Any]], delays: List[float] = None, concurrency: int = 4):
+    """Run extract_insurance_data_chunked_async with one page per chunk over a fake LLM"""
+    pages = [f"page-{number}" for number in range(len(chunk_results))]
+    llm = FakeLLM(
+        dict(zip(pages, chunk_results)),
+        dict(zip(pages, delays)) if delays is not None else None
+    )
+
+    extractor = OpenAIExtractor(api_key="test")
+    extractor.extract_insurance_data_async = llm
+
+    # A chunk size of one page's length keeps every page in its own chunk
+    result = asyncio.run(extractor.extract_insurance_data_chunked_async(pages, len(pages[0]), concurrency, FIELDS))
+    return result, llm
+
+
+def test_majority_value_wins():
+    result, llm = extract_chunked([
+        {"name": "Jane Doe", "policy_number": "P-1"},
+        {"name": "John Roe", "policy_number": "P-1"},
+        {"name": "Jane Doe", "policy_number": "P-2"},
+    ])
+
+    assert len(llm.calls) == 3
+    assert result == {"name": "Jane Doe", "policy_number": "P-1"}
+
+
+def test_votes_ignore_case_and_spacing_and_keep_first_spelling():
+    result, _ = extract_chunked([
+        {"name": "John Roe"},
+        {"name": "JANE  DOE"},
+        {"name": "jane doe"},
+    ])
+
+    assert result["name"] == "JANE  DOE"
+
+
+def test_tie_goes_to_earliest_chunk_whatever_the_completion_order():
+    # The later chunks complete first
+    result, _ = extract_chunked(
+        [
+            {"name": "Jane Doe", "policy_number": "P-1"},
+            {"name": "John Roe", "policy_number": "P-2"},
+            {"name": "John Roe", "policy_number": "P-3"},
+            {"name": "Jane Doe", "policy_number": "P-4"},
+        ],
+        delays=[0.03, 0.02, 0.01, 0]
+    )
+
+    assert result == {"name": "Jane Doe", "policy_number": "P-1"}
+
+
+def test_missing_and_blank_values_are_ignored():
+    result, _ = extract_chunked([
+        {"name": None, "policy_number": None},
+        {"name": "   ", "policy_number": None},
+        {"name": "", "policy_number": None},
+        {"name": "Jane Doe", "policy_number": None},
+    ])
+
+    assert result == {"name": "Jane Doe", "policy_number": None}
+
+
+def test_chunk_calls_respect_concurrency():
+    _, llm = extract_chunked([{"name": "Jane Doe"}] * 6, delays=[0.01] * 6, concurrency=2)
+
+    assert len(llm.calls) == 6
+    assert llm.max_in_flight == 2
+
+
+def test_single_chunk_is_not_merged():
+    extractor = OpenAIExtractor(api_key="test")
+    extractor.extract_insurance_data_async = FakeLLM({"short": {"name": "Jane Doe", "policy_number": "P-1"}})
+
+    result = asyncio.run(extractor.extract_insurance_data_chunked_async(["short"], 1000, 4, FIELDS))
+
+    assert result == {"name": "Jane Doe", "policy_number": "P-1"}
+
+
+def test_merge_without_any_values():
+    assert merge_chunk_results([{}, {"name": None}], FIELDS) == {"name": None, "policy_number": None}
+
+
+def test_split_keeps_page_order_and_size():
+    pages = ["a" * 40, "b" * 40, "c" * 100]
+    chunks = split_into_chunks(pages, 90)
+
+    assert chunks == ["a" * 40 + "\n\n" + "b" * 40, "c" * 90, "c" * 10]
+    assert all(len(chunk) <= 90 for chunk in chunks)
+
+
+def test_split_rejects_non_positive_size():
+    with pytest.raises(ValueError):
+        split_into_chunks(["page"], 0)
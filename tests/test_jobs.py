@@ -0,0 +1,97 @@
+import asyncio
+import time
+from pathlib import Path
+
+from jobs import JOB_QUEUED, JOB_RUNNING, JOB_SUCCEEDED, JobQueue, JobStore
+from upload import SpooledUpload
+
+
+class FakePipeline:
+    """Stands in for the extraction pipeline, taking a fixed time per job"""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.runs = 0
+
+    async def run(self, path: Path, filename: str, document_hash: str):
+        self.runs += 1
+        assert path.exists()
+        await asyncio.sleep(self.seconds)
+        return {"name": "Jane Doe"}
+
+
+def spooled_document(tmp_path: Path) -> SpooledUpload:
+    document = tmp_path / "policy.txt"
+    document.write_text("Policy Number: ABC123")
+    return SpooledUpload(path=document, filename="policy.txt", size=21, sha256="abc")
+
+
+def run_until_stopped(tmp_path: Path, job_seconds: float, shutdown_seconds: float):
+    """Submit one job, stop the queue once it is running and return the job"""
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    upload = spooled_document(tmp_path)
+    document = upload.path
+
+    async def scenario():
+        queue = JobQueue(store, FakePipeline(job_seconds), workers=1, shutdown_seconds=shutdown_seconds)
+        await queue.start()
+        job = queue.submit(upload)
+        await asyncio.sleep(0.1)
+        await queue.stop()
+        return store.get(job["id"])
+
+    return asyncio.run(scenario()), document
+
+
+def test_stop_waits_for_running_jobs(tmp_path):
+    job, document = run_until_stopped(tmp_path, job_seconds=0.3, shutdown_seconds=5)
+
+    assert job["status"] == JOB_SUCCEEDED
+    assert not document.exists()
+
+
+def test_stop_requeues_jobs_that_do_not_finish_in_time(tmp_path):
+    job, document = run_until_stopped(tmp_path, job_seconds=10, shutdown_seconds=0.1)
+
+    assert job["status"] == JOB_QUEUED
+    assert job["attempts"] == 0
+    assert document.exists()
+
+
+def test_running_job_keeps_its_lease(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"), lease_seconds=0.3)
+    pipeline = FakePipeline(1.0)
+    upload = spooled_document(tmp_path)
+
+    async def scenario():
+        # Two workers: the idle one would take the job over if its lease lapsed
+        queue = JobQueue(store, pipeline, workers=2, poll_interval=0.05)
+        await queue.start()
+        job = queue.submit(upload)
+        await asyncio.sleep(1.3)
+        await queue.stop()
+        return store.get(job["id"])
+
+    job = asyncio.run(scenario())
+
+    assert job["status"] == JOB_SUCCEEDED
+    assert job["attempts"] == 1
+    assert pipeline.runs == 1
+
+
+def test_run_that_lost_its_lease_cannot_finish_the_job(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"), lease_seconds=0.1)
+    job = store.create(spooled_document(tmp_path))
+
+    first = store.claim_next()
+    time.sleep(0.2)
+    second = store.claim_next()
+
+    assert second["id"] == job["id"] and second["attempts"] == 2
+    assert not store.heartbeat(job["id"], first["attempts"])
+    assert store.complete(job["id"], first["attempts"], {"name": "stale"}) is None
+    assert store.get(job["id"])["status"] == JOB_RUNNING
+
+    assert store.complete(job["id"], second["attempts"], {"name": "Jane Doe"})["status"] == JOB_SUCCEEDED
+    assert store.fail(job["id"], first["attempts"], "upload missing") is None
+    assert store.get(job["id"])["result"] == {"name": "Jane Doe"}
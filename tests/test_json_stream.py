@@ -0,0 +1,104 @@
+import json
+from typing import Any, List, Tuple
+
+import pytest
+
+from json_stream import IncrementalObjectParser
+
+DOCUMENT = (
+    '{"name": "Jane \\"JD\\" Doe\\\\\\n", "unicode": "\\u00e9t\\u00e9 \\ud83d\\ude00", '
+    '"nested": {"a": [1, {"b": null}], "c": "}"}, "list": [true, false, null, "]", -0.5], '
+    '"int": -125, "float": 12.5e-3, "t": true, "f": false, "n": null, "empty": {}, "last": 0}'
+)
+EXPECTED = json.loads(DOCUMENT)
+
+
+def feed_pieces(pieces: List[str]) -> Tuple[IncrementalObjectParser, List[Tuple[str, Any]]]:
+    parser = IncrementalObjectParser()
+    completed = []
+    for piece in pieces:
+        completed.extend(parser.feed(piece))
+    return parser, completed
+
+
+def test_whole_document():
+    parser, completed = feed_pieces([DOCUMENT])
+
+    assert parser.done
+    assert parser.result == EXPECTED
+    assert completed == list(EXPECTED.items())
+
+
+@pytest.mark.parametrize("split", range(1, len(DOCUMENT)))
+def test_split_in_two_at_every_position(split):
+    parser, completed = feed_pieces([DOCUMENT[:split], DOCUMENT[split:]])
+
+    assert parser.done
+    assert completed == list(EXPECTED.items())
+
+
+def test_split_in_three_at_every_pair_of_positions():
+    for first in range(1, len(DOCUMENT) - 1, 3):
+        for second in range(first + 1, len(DOCUMENT)):
+            parser, completed = feed_pieces([DOCUMENT[:first], DOCUMENT[first:second], DOCUMENT[second:]])
+            assert completed == list(EXPECTED.items()), (first, second)
+
+
+def test_fields_are_reported_only_once_their_value_has_closed():
+    parser = IncrementalObjectParser()
+    reported_at = {}
+
+    for position, char in enumerate(DOCUMENT):
+        for key, value in parser.feed(char):
+            # A value reported early would be a prefix of the final one
+            assert value == EXPECTED[key]
+            reported_at[key] = position
+
+    assert reported_at == {key: _reported_position(key) for key in EXPECTED}
+
+
+def _reported_position(key: str) -> int:
+    """Index of the character that completes a member: its closing
+    character, or for a number the delimiter after it"""
+    start = DOCUMENT.index(f'"{key}": ') + len(f'"{key}": ')
+    _, end = json.JSONDecoder().raw_decode(DOCUMENT, start)
+    value = EXPECTED[key]
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return end
+    return end - 1
+
+
+@pytest.mark.parametrize("prefix, following", [
+    ('{"a": 12', '5}'),
+    ('{"a": 12', '.5}'),
+    ('{"a": 1', 'e3}'),
+    ('{"a": -', '1}'),
+])
+def test_number_waits_for_a_delimiter(prefix, following):
+    parser = IncrementalObjectParser()
+
+    assert parser.feed(prefix) == []
+    assert parser.feed(following) == [("a", json.loads(prefix + following)["a"])]
+
+
+@pytest.mark.parametrize("prefix", ['{"a": "x\\', '{"a": "\\u00', '{"a": "\\ud83d', '{"a": tr', '{"a": nul', '{"a": fals'])
+def test_incomplete_escapes_and_literals_are_not_reported(prefix):
+    assert IncrementalObjectParser().feed(prefix) == []
+
+
+def test_text_that_is_not_an_object_is_rejected():
+    with pytest.raises(ValueError):
+        IncrementalObjectParser().feed('Sorry, I cannot')
+
+    parser = IncrementalObjectParser()
+    assert parser.feed('{"a": 1, ') == [("a", 1)]
+    with pytest.raises(ValueError):
+        parser.feed('oops')
+    assert parser.result == {"a": 1}
+
+
+def test_text_after_the_closing_brace_is_ignored():
+    parser, completed = feed_pieces(['{"a": 1}', ' trailing text'])
+
+    assert parser.done
+    assert completed == [("a", 1)]
@@ -0,0 +1,31 @@
+from cache import MemoryCacheBackend, ResultCache
+from local_extractor import LocalTextExtractor
+from mistral_parser import MistralDocumentParser
+
+DOCUMENT = b"Policy Number: ABC123\fSum Insured: Rs. 5,00,000"
+
+
+def parser(ocr_cache: ResultCache, min_page_chars: int) -> MistralDocumentParser:
+    return MistralDocumentParser("test", ocr_cache=ocr_cache, local_extractor=LocalTextExtractor(min_page_chars))
+
+
+def test_ocr_cache_is_keyed_on_the_local_extraction_settings():
+    ocr_cache = ResultCache(MemoryCacheBackend(), namespace="ocr")
+
+    pages = parser(ocr_cache, 100).parse_pages(DOCUMENT, "policy.txt")
+    parser(ocr_cache, 10).parse_pages(DOCUMENT, "policy.txt")
+    assert (ocr_cache.hits, ocr_cache.misses) == (0, 2)
+
+    assert parser(ocr_cache, 100).parse_pages(DOCUMENT, "policy.txt") == pages
+    assert (ocr_cache.hits, ocr_cache.misses) == (1, 2)
+
+
+def test_ocr_version_changes_with_the_local_extractor():
+    versions = {
+        MistralDocumentParser("test").ocr_version,
+        MistralDocumentParser("test", local_extractor=LocalTextExtractor(100)).ocr_version,
+        MistralDocumentParser("test", local_extractor=LocalTextExtractor(10)).ocr_version,
+    }
+
+    assert len(versions) == 3
+    assert all(version.startswith(f"{MistralDocumentParser.OCR_MODEL}:") for version in versions)
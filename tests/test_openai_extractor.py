@@ -0,0 +1,184 @@
+import asyncio
+import json
+from types import SimpleNamespace
+from typing import Any, Dict, List, Tuple
+
+from openai.types.chat import ChatCompletion
+
+from openai_extractor import OpenAIExtractor
+
+VALID = {
+    "name": "Jane Doe",
+    "policy_number": "P/123456/01/2024/000001",
+    "email": None,
+    "policy_name": "Family Health Optima Insurance Plan",
+    "plan_type": None,
+    "sum_assured": "Rs. 5,00,000",
+    "room_rent_limit": None,
+    "waiting_period": "30 days"
+}
+
+
+def completion(content: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": "chatcmpl-test", "object": "chat.completion", "created": 0, "model": OpenAIExtractor.MODEL,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": json.dumps(content)}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 10, "total_tokens": 20}
+    }
+
+
+class FakeCompletions:
+    """Answers every request with the same completion body, recording the requests"""
+
+    def __init__(self, content: Dict[str, Any]):
+        self.content = content
+        self.requests: List[Dict[str, Any]] = []
+
+    async def __call__(self, request: Dict[str, Any], **kwargs) -> ChatCompletion:
+        self.requests.append(request)
+        return ChatCompletion.model_validate(completion(self.content))
+
+
+def extractor_with(content: Dict[str, Any]) -> Tuple[OpenAIExtractor, FakeCompletions]:
+    extractor = OpenAIExtractor(api_key="test")
+    fake = FakeCompletions(content)
+    extractor._create_async = fake
+    return extractor, fake
+
+
+def test_field_still_invalid_after_retries_is_null():
+    extractor, fake = extractor_with({**VALID, "sum_assured": 500000})
+
+    result = asyncio.run(extractor.extract_insurance_data_async("document"))
+
+    assert result["sum_assured"] is None
+    assert result["name"] == "Jane Doe"
+    assert len(fake.requests) == 1 + extractor.FIELD_RETRIES
+    assert extractor.validation_stats["fields_failed"] == 1
+
+
+def test_every_request_sends_the_full_schema():
+    extractor, fake = extractor_with({**VALID, "email": 42})
+
+    asyncio.run(extractor.extract_insurance_data_async("document", ["name", "email"]))
+
+    schemas = [request["response_format"]["json_schema"]["schema"] for request in fake.requests]
+    assert len(schemas) == 2
+    assert all(set(schema["required"]) == set(OpenAIExtractor.REQUIRED_FIELDS) for schema in schemas)
+    assert "Only extract these fields: email" in fake.requests[1]["messages"][1]["content"]
+
+
+def test_batch_response_with_invalid_field_keeps_the_others():
+    extractor = OpenAIExtractor(api_key="test")
+
+    result = extractor.parse_batch_response(completion({**VALID, "name": ["Jane"]}), ["name", "policy_number"])
+
+    assert result == {"name": None, "policy_number": "P/123456/01/2024/000001"}
+    assert extractor.validation_stats["fields_failed"] == 1
+
+
+class TextCompletions(FakeCompletions):
+    """Answers with raw completion text instead of a JSON object"""
+
+    async def __call__(self, request: Dict[str, Any], **kwargs) -> ChatCompletion:
+        self.requests.append(request)
+        body = completion({})
+        body["choices"][0]["message"]["content"] = self.content
+        return ChatCompletion.model_validate(body)
+
+
+def test_reply_that_is_not_a_json_object_makes_fields_null():
+    extractor = OpenAIExtractor(api_key="test")
+    fake = TextCompletions("I could not find a policy in this document.")
+    extractor._create_async = fake
+
+    result = asyncio.run(extractor.extract_insurance_data_async("document", ["name", "email"]))
+
+    assert result == {"name": None, "email": None}
+    assert len(fake.requests) == 1 + extractor.FIELD_RETRIES
+    assert extractor.validation_stats["fields_failed"] == 2
+
+
+def test_reply_that_breaks_off_keeps_the_fields_before_the_break():
+    extractor = OpenAIExtractor(api_key="test")
+    content = '{"name": "Jane Doe", "email": null] trailing'
+
+    result = extractor.parse_batch_response(completion({}) | {"choices": [{
+        "index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"
+    }]}, ["name", "policy_number"])
+
+    assert result == {"name": "Jane Doe", "policy_number": None}
+
+
+class FakeStream:
+    """Streamed completion delivering the given text pieces"""
+
+    def __init__(self, pieces: List[str]):
+        self.pieces = pieces
+        self.delivered = 0
+        self.closed = False
+
+    async def __aiter__(self):
+        for piece in self.pieces:
+            self.delivered += 1
+            yield SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=SimpleNamespace(content=piece))])
+
+    async def close(self):
+        self.closed = True
+
+
+def test_stream_that_is_not_a_json_object_makes_fields_null():
+    extractor = OpenAIExtractor(api_key="test")
+    retried = FakeCompletions({**VALID, "email": "jane.doe@example.com"})
+
+    async def create(request: Dict[str, Any], **kwargs):
+        if kwargs.get("stream"):
+            return FakeStream(['{"name": "Jane', ' Doe", "email": ', 'Sorry, I cannot'])
+        return await retried(request)
+
+    extractor._create_async = create
+    reported = {}
+
+    result = asyncio.run(extractor.extract_insurance_data_stream_async(
+        "document", ["name", "email"], on_field=reported.__setitem__
+    ))
+
+    assert result == {"name": "Jane Doe", "email": "jane.doe@example.com"}
+    assert reported == result
+    assert "Only extract these fields: email" in retried.requests[0]["messages"][1]["content"]
+
+
+def test_stream_closes_early_when_the_model_adds_other_keys():
+    extractor = OpenAIExtractor(api_key="test")
+    extra = [f'"note_{index}": "{"x" * 20}", ' for index in range(20)]
+    stream = FakeStream(['{"name": "Jane Doe", "email": null, '] + extra + ['"last": 1}'])
+
+    async def create(request: Dict[str, Any], **kwargs):
+        return stream
+
+    extractor._create_async = create
+
+    result = asyncio.run(extractor.extract_insurance_data_stream_async("document", ["name"]))
+
+    assert result == {"name": "Jane Doe"}
+    assert stream.closed
+    assert stream.delivered < len(stream.pieces)
+    # Reading stops once more than STREAM_TAIL_CHARS follow the last wanted field
+    tail = sum(len(piece) for piece in extra[:stream.delivered - 1])
+    assert tail > extractor.STREAM_TAIL_CHARS
+    assert tail - len(extra[0]) <= extractor.STREAM_TAIL_CHARS
+
+
+def test_stream_reads_to_the_closing_brace_after_the_last_field():
+    extractor = OpenAIExtractor(api_key="test")
+    stream = FakeStream(['{"name": "Jane', ' Doe"', '}'])
+
+    async def create(request: Dict[str, Any], **kwargs):
+        return stream
+
+    extractor._create_async = create
+
+    result = asyncio.run(extractor.extract_insurance_data_stream_async("document", ["name"]))
+
+    assert result == {"name": "Jane Doe"}
+    assert stream.delivered == 3 and stream.closed
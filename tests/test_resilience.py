@@ -0,0 +1,110 @@
+import asyncio
+import time
+
+from resilience import CircuitBreaker, ResilientCaller, latency_kind
+
+
+def slow_call_breaker() -> CircuitBreaker:
+    """A breaker that opens on the first call slower than 50ms"""
+    return CircuitBreaker("Test", slow_call_seconds=0.05, min_calls=1, slow_call_rate_threshold=0.5)
+
+
+def test_quota_wait_is_not_timed_as_provider_latency():
+    breaker = slow_call_breaker()
+    caller = ResilientCaller("Test", breaker=breaker)
+
+    async def throttled():
+        await asyncio.sleep(0.2)
+
+    async def request():
+        await asyncio.sleep(0.01)
+        return "ok"
+
+    async def scenario():
+        for _ in range(3):
+            assert await caller.call(request, acquire=throttled) == "ok"
+
+    asyncio.run(scenario())
+
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert caller.latencies["call"].percentile(1.0) < 0.1
+
+
+def test_quota_wait_is_not_timed_in_sync_calls():
+    breaker = slow_call_breaker()
+    caller = ResilientCaller("Test", breaker=breaker)
+
+    result = caller.call_sync(lambda: "ok", acquire=lambda: time.sleep(0.2))
+
+    assert result == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_slow_provider_still_opens_the_circuit():
+    breaker = slow_call_breaker()
+    caller = ResilientCaller("Test", breaker=breaker)
+
+    caller.call_sync(lambda: time.sleep(0.1), acquire=lambda: None)
+
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_hedge_delay_starts_after_the_quota_wait():
+    caller = ResilientCaller("Test", hedging=True, hedge_min_samples=1)
+    caller.latencies["call"].record(0.05)
+    sent = []
+
+    async def throttled():
+        await asyncio.sleep(0.2)
+
+    async def request():
+        sent.append(time.monotonic())
+        await asyncio.sleep(0.01)
+        return "ok"
+
+    assert asyncio.run(caller.call(request, acquire=throttled)) == "ok"
+    assert len(sent) == 1
+    assert caller.stats["hedges"] == 0
+
+
+def test_slow_request_is_hedged():
+    caller = ResilientCaller("Test", hedging=True, hedge_min_samples=1)
+    caller.latencies["call"].record(0.05)
+
+    async def request():
+        await asyncio.sleep(0.2)
+        return "ok"
+
+    assert asyncio.run(caller.call(request)) == "ok"
+    assert caller.stats["hedges"] == 1
+
+
+def test_small_call_latencies_do_not_hedge_large_calls():
+    caller = ResilientCaller("Test", hedging=True, hedge_min_samples=5)
+    small, large = latency_kind("completion", 1500), latency_kind("completion", 30000)
+
+    async def request(seconds: float):
+        await asyncio.sleep(seconds)
+        return "ok"
+
+    async def scenario():
+        for _ in range(5):
+            await caller.call(lambda: request(0.01), kind=small)
+        return await caller.call(lambda: request(0.2), kind=large)
+
+    assert small != large
+    assert asyncio.run(scenario()) == "ok"
+    assert caller.stats["hedges"] == 0
+    assert set(caller.report()["p95_seconds"]) == {small, large}
+
+
+def test_streams_are_not_hedged():
+    caller = ResilientCaller("Test", hedging=True, hedge_min_samples=1)
+    caller.latencies["stream"].record(0.01)
+
+    async def request():
+        await asyncio.sleep(0.2)
+        return "ok"
+
+    assert asyncio.run(caller.call(request, kind="stream", hedge=False)) == "ok"
+    assert caller.stats["hedges"] == 0
@@ -0,0 +1,131 @@
+import asyncio
+
+from pipeline import ExtractionPipeline
+from rules import RuleExtractor
+
+SCHEDULE = """| Policy Holder Name | Jane Doe |
+| Policy Number | P/161130/01/2021/074677 |
+| Email Address | jane.doe@example.com |
+| Product Name | Family Health Optima Insurance Plan SHAHLIP21211V042021 |
+| Sum Insured | Rs. 5,00,000 |
+| Room Rent Limit | Rs. 5,000 per day |
+| ICU Room Rent | Rs. 10,000 per day |
+| Initial Waiting Period | 30 days |
+| Pre-existing Disease Waiting Period | 48 months |
+"""
+
+
+class UnusedLLM:
+    """Extractor that fails the test if the pipeline calls it"""
+
+    version = "unused"
+
+    async def extract_insurance_data_stream_async(self, *args, **kwargs):
+        raise AssertionError("LLM called although every field was resolved")
+
+    extract_insurance_data_async = extract_insurance_data_stream_async
+
+
+def test_schedule_resolves_every_field():
+    assert RuleExtractor().extract(SCHEDULE) == {
+        "name": "Jane Doe",
+        "policy_number": "P/161130/01/2021/074677",
+        "email": "jane.doe@example.com",
+        "policy_name": "Family Health Optima Insurance Plan",
+        "plan_type": "SHAHLIP21211V042021",
+        "sum_assured": "Rs. 5,00,000",
+        "room_rent_limit": "Rs. 5,000 per day",
+        "waiting_period": "30 days",
+    }
+
+
+def test_room_categories_and_shares_of_sum_insured():
+    extract = RuleExtractor().extract
+
+    assert extract("Room Rent: Single Private AC Room\n")["room_rent_limit"] == "Single Private AC Room"
+    assert extract("Room rent - 1% of Sum Insured per day\n")["room_rent_limit"] == "1% of Sum Insured per day"
+    assert extract("Room Rent Capping: No Limit\n")["room_rent_limit"] == "No Limit"
+    assert "room_rent_limit" not in extract("ICU Room Rent: Rs. 10,000 per day\n")
+
+
+def test_waiting_period_needs_an_initial_or_bare_label():
+    extract = RuleExtractor().extract
+
+    assert extract("Waiting Period: NIL\n")["waiting_period"] == "NIL"
+    assert "waiting_period" not in extract("Pre-existing Disease Waiting Period: 2 years\n")
+
+
+def test_disagreeing_values_are_left_to_the_llm():
+    fields = RuleExtractor().extract(
+        "Room Rent: Rs. 5,000 per day\nRoom Category - Shared Room\n"
+        "Plan Name: Star Comprehensive\nProduct Name: Star Comprehensive Gold\n"
+    )
+
+    assert "room_rent_limit" not in fields
+    assert "policy_name" not in fields
+
+
+def test_llm_call_skipped_when_rules_resolve_every_field():
+    pipeline = ExtractionPipeline(None, UnusedLLM(), rule_extractor=RuleExtractor())
+
+    result = asyncio.run(pipeline.extract([SCHEDULE]))
+
+    assert result["waiting_period"] == "30 days"
+    assert set(result["field_sources"].values()) == {"rule"}
+    assert pipeline.rule_stats["llm_calls_skipped"] == 1
+
+
+class CannedLLM:
+    """Extractor returning fixed values for whichever fields are requested"""
+
+    version = "canned"
+
+    def __init__(self, values):
+        self.values = values
+        self.requested = []
+
+    async def extract_insurance_data_async(self, document_text, fields=None):
+        self.requested.append(fields)
+        return {field: self.values.get(field) for field in fields}
+
+    async def extract_insurance_data_stream_async(self, document_text, fields=None, on_field=None):
+        return await self.extract_insurance_data_async(document_text, fields)
+
+
+def test_horizontal_table_header_is_not_a_value():
+    fields = RuleExtractor().extract(
+        "| Insured Name | Policy Number | Sum Insured | Room Rent |\n"
+        "|---|---|---|---|\n"
+        "| Jane Doe | P/161130/01/2021/074677 | Rs. 5,00,000 | Rs. 5,000 per day |\n"
+        "| Plan Name | Sum Insured |\n"
+        "|---|---|\n"
+        "| Star Comprehensive | Rs. 5,00,000 |\n"
+    )
+
+    assert "name" not in fields
+    assert "policy_name" not in fields
+    assert "sum_assured" not in fields
+
+
+def test_label_followed_by_another_label_is_not_a_value():
+    extract = RuleExtractor().extract
+
+    assert "name" not in extract("Insured Name: Date Of Birth\n")
+    assert "policy_name" not in extract("Product Name | Policy Number\n")
+    assert extract("| **Insured Name:** | Jane Doe |\n")["name"] == "Jane Doe"
+
+
+def test_llm_name_wins_over_rule_name_when_they_disagree():
+    llm = CannedLLM({"name": "Jane Doe", "plan_type": "Individual"})
+    pipeline = ExtractionPipeline(None, llm, rule_extractor=RuleExtractor())
+    document = SCHEDULE.replace("| Policy Holder Name | Jane Doe |", "| Policy Holder Name | Jane Doe Nominee |")
+    document = document.replace(" SHAHLIP21211V042021", "")
+
+    result = asyncio.run(pipeline.extract([document]))
+
+    assert set(llm.requested[0]) == {"name", "policy_name", "plan_type"}
+    assert result["name"] == "Jane Doe"
+    assert result["field_sources"]["name"] == "llm"
+    # The LLM returned no product name, so the rule value stands
+    assert result["policy_name"] == "Family Health Optima Insurance Plan"
+    assert result["field_sources"]["policy_name"] == "rule"
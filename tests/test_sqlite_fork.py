@@ -0,0 +1,27 @@
+import os
+
+from cache import SQLiteCacheBackend
+from jobs import JobStore
+from rate_limit import SQLiteRateLimitBackend
+
+
+def test_forked_child_gets_its_own_connections(tmp_path):
+    stores = [
+        SQLiteCacheBackend(str(tmp_path / "cache.sqlite3")),
+        SQLiteRateLimitBackend(str(tmp_path / "rate_limit.sqlite3")),
+        JobStore(str(tmp_path / "jobs.sqlite3"))
+    ]
+    parent_connections = [store._conn for store in stores]
+
+    pid = os.fork()
+    if pid == 0:
+        reopened = all(
+            store._conn is not conn and store._inherited_conn is conn
+            for store, conn in zip(stores, parent_connections)
+        )
+        stores[0].set("key", "value")
+        os._exit(0 if reopened and stores[0].get("key") == "value" else 1)
+
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert [store._conn for store in stores] == parent_connections
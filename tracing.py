@@ -0,0 +1,145 @@
+from contextlib import contextmanager
+from typing import Any, Iterator, Mapping, Optional
+
+try:
+    from opentelemetry import propagate, trace
+    from opentelemetry.trace import SpanKind
+except ImportError:
+    # Tracing is optional: without the API package every span is a no-op
+    trace = None
+
+TRACER_NAME = "beshak.extraction"
+
+# Spans kept by the "memory" exporter, for inspecting traces in tests
+memory_exporter = None
+
+
+def configure_tracing(
+    exporter: str = "none",
+    sample_ratio: float = 0.1,
+    service_name: str = "beshak-extraction",
+    otlp_endpoint: Optional[str] = None
+) -> bool:
+    """
+    Install a global tracer provider
+
+    Root spans are sampled at sample_ratio; spans with a parent (including
+    one propagated in the request headers) follow the parent's decision,
+    so a trace is either recorded whole or not at all. Unsampled spans are
+    never exported and cost little more than a context switch.
+
+    Args:
+        exporter: One of none, otlp, console or memory
+        sample_ratio: Fraction of new traces to record (0 to 1)
+        service_name: service.name resource attribute
+        otlp_endpoint: OTLP/HTTP traces endpoint; defaults to the
+            OTEL_EXPORTER_OTLP_* environment variables
+
+    Returns:
+        True if tracing was enabled
+
+    Raises:
+        ValueError: If the exporter is unknown or its packages are missing
+    """
+    global memory_exporter
+
+    exporter = exporter.lower()
+    if exporter == "none":
+        return False
+
+    try:
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter, SimpleSpanProcessor
+        from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+    except ImportError:
+        raise ValueError("Tracing requires the 'opentelemetry-sdk' package")
+
+    if exporter == "otlp":
+        try:
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        except ImportError:
+            raise ValueError("OTLP tracing requires the 'opentelemetry-exporter-otlp-proto-http' package")
+        processor = BatchSpanProcessor(OTLPSpanExporter(endpoint=otlp_endpoint) if otlp_endpoint else OTLPSpanExporter())
+    elif exporter == "console":
+        processor = SimpleSpanProcessor(ConsoleSpanExporter())
+    elif exporter == "memory":
+        from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+        memory_exporter = InMemorySpanExporter()
+        processor = SimpleSpanProcessor(memory_exporter)
+    else:
+        raise ValueError(f"Unknown tracing exporter: {exporter}")
+
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": service_name}),
+        sampler=ParentBased(TraceIdRatioBased(max(0.0, min(1.0, sample_ratio))))
+    )
+    provider.add_span_processor(processor)
+    trace.set_tracer_provider(provider)
+    return True
+
+
+@contextmanager
+def span(
+    name: str,
+    headers: Optional[Mapping[str, str]] = None,
+    parent: Optional[Any] = None,
+    kind: str = "internal",
+    **attributes: Any
+) -> Iterator[Any]:
+    """
+    Run the block in a child span of the current one
+
+    Exceptions escaping the block are recorded on the span and mark it as
+    an error.
+
+    Args:
+        name: Span name
+        headers: Incoming request headers to continue a trace from
+            (W3C traceparent by default)
+        parent: Context from current_context() to use as the parent instead
+            of the current one, e.g. for work that outlives a request span
+        kind: internal, server or client
+        **attributes: Span attributes; None values are left out
+
+    Yields:
+        The span, or None when tracing is not installed
+    """
+    if trace is None:
+        yield None
+        return
+
+    context = propagate.extract(headers) if headers is not None else parent
+    with trace.get_tracer(TRACER_NAME).start_as_current_span(
+        name,
+        context=context,
+        kind=getattr(SpanKind, kind.upper()),
+        attributes={key: value for key, value in attributes.items() if value is not None}
+    ) as current:
+        yield current
+
+
+def current_context() -> Optional[Any]:
+    """The active trace context, to parent spans started after it has ended"""
+    if trace is None:
+        return None
+    from opentelemetry import context
+    return context.get_current()
+
+
+def set_attributes(**attributes: Any) -> None:
+    """Add attributes to the current span (no-op if it is not being recorded)"""
+    if trace is None:
+        return
+    current = trace.get_current_span()
+    if current.is_recording():
+        current.set_attributes({key: value for key, value in attributes.items() if value is not None})
+
+
+def add_event(name: str, **attributes: Any) -> None:
+    """Add an event to the current span (no-op if it is not being recorded)"""
+    if trace is None:
+        return
+    current = trace.get_current_span()
+    if current.is_recording():
+        current.add_event(name, {key: value for key, value in attributes.items() if value is not None})
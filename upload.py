@@ -0,0 +1,156 @@
+import hashlib
+import json
+import os
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Iterable, Optional
+
+from fastapi import HTTPException, UploadFile
+
+CHUNK_SIZE = 1024 * 1024  # 1MB
+
+
+@dataclass
+class SpooledUpload:
+    """Uploaded document spooled to a temporary file on disk"""
+
+    path: Path
+    filename: str
+    size: int
+    sha256: str
+
+    def close(self) -> None:
+        """Delete the temporary file"""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+async def spool_upload(file: UploadFile, max_size: int, directory: Optional[str] = None) -> SpooledUpload:
+    """
+    Copy an upload to disk in chunks, hashing it and enforcing the size limit
+
+    Args:
+        file: Uploaded file
+        max_size: Maximum allowed size in bytes
+        directory: Directory for the temporary file (system default if None)
+
+    Returns:
+        Spooled upload with its size and SHA-256
+
+    Raises:
+        ValueError: If the file exceeds max_size
+    """
+    digest = hashlib.sha256()
+    size = 0
+    fd, path = tempfile.mkstemp(suffix=Path(file.filename).suffix.lower(), dir=directory)
+
+    try:
+        with os.fdopen(fd, "wb") as output:
+            while chunk := await file.read(CHUNK_SIZE):
+                size += len(chunk)
+                # Stop reading as soon as the limit is crossed
+                if size > max_size:
+                    raise ValueError(f"File size exceeds maximum limit of {max_size // (1024*1024)}MB")
+
+                digest.update(chunk)
+                output.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+
+    return SpooledUpload(path=Path(path), filename=file.filename, size=size, sha256=digest.hexdigest())
+
+
+def spool_stream(stream: BinaryIO, filename: str, max_size: int, directory: Optional[str] = None) -> SpooledUpload:
+    """
+    Copy a readable binary stream (such as a zip member) to disk in chunks
+
+    Args:
+        stream: Source stream
+        filename: Name of the document
+        max_size: Maximum allowed size in bytes
+        directory: Directory for the temporary file (system default if None)
+
+    Returns:
+        Spooled upload with its size and SHA-256
+
+    Raises:
+        ValueError: If the stream exceeds max_size
+    """
+    digest = hashlib.sha256()
+    size = 0
+    fd, path = tempfile.mkstemp(suffix=Path(filename).suffix.lower(), dir=directory)
+
+    try:
+        with os.fdopen(fd, "wb") as output:
+            while chunk := stream.read(CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_size:
+                    raise ValueError(f"File size exceeds maximum limit of {max_size // (1024*1024)}MB")
+
+                digest.update(chunk)
+                output.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+
+    return SpooledUpload(path=Path(path), filename=filename, size=size, sha256=digest.hexdigest())
+
+
+class BodySizeLimitMiddleware:
+    """
+    ASGI middleware that rejects oversized request bodies with 413
+
+    Requests with a Content-Length over the limit are rejected before any
+    of the body is read; chunked bodies are cut off as soon as the running
+    total crosses the limit, so multipart parsing never spools them fully.
+    """
+
+    def __init__(self, app, max_body_size: int, paths: Iterable[str]):
+        self.app = app
+        self.max_body_size = max_body_size
+        self.paths = set(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        detail = f"Request body exceeds maximum limit of {self.max_body_size // (1024*1024)}MB"
+
+        headers = dict(scope["headers"])
+        content_length = headers.get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_body_size:
+            await self._reject(send, detail)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_size:
+                    # Surfaces through FastAPI's exception handling as a 413
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    @staticmethod
+    async def _reject(send, detail: str) -> None:
+        body = json.dumps({"detail": detail}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("ascii")),
+                (b"connection", b"close")
+            ]
+        })
+        await send({"type": "http.response.body", "body": body})